@@ -1,17 +1,16 @@
 import streamlit as st
-import os
-import re
-import urllib.parse
-import random
 import time
-from typing import List, Set, Tuple
+import threading
+import sqlite3
+from dataclasses import asdict
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from ddgs import DDGS
-import cloudscraper
-import json
 from datetime import datetime
+from nucleo import (CACHE_NAMESPACES, DEGRADACOES, HIST_ETAPA, METRICAS_HOST, METRICAS_PORTA, VETORES_CAMINHO,
+                    ConfiguracaoPergunta, Progresso, cache, cache_negativo, cache_respostas, cliente_http,
+                    disjuntores, em_voo, espelho, indexar_espelho_vetorial, indice_vetorial, iniciar_sincronizacao_espelho,
+                    metricas_latencia, obter_controle_sincronizacao, obter_metricas_especulacao,
+                    obter_metricas_reclassificacao, obter_servidor_metricas, processar_pergunta, registro_ia,
+                    revalidacao)
 
 # ---------------------------
 # Configuração Inicial
@@ -24,821 +23,71 @@ st.set_page_config(
 )
 
 # ---------------------------
-# SISTEMA DE CACHE PARA MELHOR PERFORMANCE
+# ANDAMENTO E EXIBIÇÃO DA RESPOSTA
 # ---------------------------
-class CacheManager:
-    def __init__(self, ttl=3600):  # 1 hora de cache
-        self.cache = {}
-        self.ttl = ttl
-    
-    def get(self, key):
-        if key in self.cache:
-            data, timestamp = self.cache[key]
-            if time.time() - timestamp < self.ttl:
-                return data
-            else:
-                del self.cache[key]
-        return None
-    
-    def set(self, key, value):
-        self.cache[key] = (value, time.time())
-    
-    def clear(self):
-        self.cache.clear()
-
-cache = CacheManager()
-
-# ---------------------------
-# HEADERS MELHORADOS COM ROTAÇÃO DINÂMICA
-# ---------------------------
-def get_dynamic_headers(url=None):
-    """Retorna headers dinâmicos e realistas"""
-    user_agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
-        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36'
-    ]
-    
-    base_headers = {
-        'authority': 'centraldeatendimento.totvs.com',
-        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'accept-language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
-        'cache-control': 'no-cache',
-        'pragma': 'no-cache',
-        'sec-ch-ua': '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";v="141"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"Windows"',
-        'sec-fetch-dest': 'document',
-        'sec-fetch-mode': 'navigate',
-        'sec-fetch-site': 'same-origin',
-        'upgrade-insecure-requests': '1',
-        'user-agent': random.choice(user_agents),
-    }
-    
-    if url:
-        base_headers['referer'] = 'https://centraldeatendimento.totvs.com/'
-    
-    return base_headers
-
-# ---------------------------
-# SISTEMA DE REQUISIÇÕES ROBUSTO
-# ---------------------------
-def create_advanced_scraper():
-    """Cria um scraper avançado com retry automático"""
-    try:
-        scraper = cloudscraper.create_scraper(
-            browser={
-                'browser': 'chrome',
-                'platform': 'windows',
-                'mobile': False
-            },
-            delay=10,
-        )
-        return scraper
-    except Exception as e:
-        st.warning(f"CloudScraper não disponível: {e}. Usando requests.")
-        return requests.Session()
-
-scraper = create_advanced_scraper()
-
-def fazer_requisicao_inteligente(url, max_tentativas=3):
-    """Sistema inteligente de requisições com múltiplas estratégias"""
-    cache_key = f"req_{hash(url)}"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
-    
-    for tentativa in range(max_tentativas):
-        try:
-            # Delay progressivo entre tentativas
-            if tentativa > 0:
-                delay = tentativa * 2 + random.uniform(1, 3)
-                time.sleep(delay)
-            
-            headers = get_dynamic_headers(url)
-            
-            # Tentar com CloudScraper primeiro
-            response = scraper.get(url, headers=headers, timeout=25)
-            
-            if response.status_code == 200:
-                # Verificar se não é uma página de bloqueio
-                content_lower = response.text.lower()
-                if not any(term in content_lower for term in ['access denied', 'blocked', 'bot detected', 'captcha']):
-                    cache.set(cache_key, response)
-                    return response
-            
-            # Se falhou, tentar com requests simples
-            session = requests.Session()
-            alt_headers = headers.copy()
-            alt_headers['user-agent'] = random.choice([
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36',
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0'
-            ])
-            
-            response = session.get(url, headers=alt_headers, timeout=20)
-            if response.status_code == 200:
-                cache.set(cache_key, response)
-                return response
-                
-        except requests.exceptions.Timeout:
-            continue
-        except requests.exceptions.ConnectionError:
-            continue
-        except Exception as e:
-            continue
-    
-    return None
-
-# ---------------------------
-# SISTEMA DE BUSCA APRIMORADO
-# ---------------------------
-def buscar_via_api_zendesk(query, max_results=5):
-    """Busca usando a API oficial do Zendesk (método mais confiável)"""
-    cache_key = f"api_search_{hash(query)}"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
-    
-    try:
-        base_url = "https://centraldeatendimento.totvs.com/api/v2/help_center/pt-br/articles/search"
-        params = {'query': query, 'per_page': max_results}
-        
-        headers = get_dynamic_headers()
-        headers['accept'] = 'application/json'
-        
-        response = requests.get(base_url, params=params, headers=headers, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            articles = data.get('results', [])
-            
-            links = []
-            for article in articles:
-                url = article.get('html_url')
-                if url and url not in links:
-                    links.append(url)
-            
-            cache.set(cache_key, links)
-            return links
-            
-    except Exception as e:
-        pass
-    
-    return []
-
-def extrair_conteudo_via_api(url):
-    """Extrai conteúdo via API - método mais confiável"""
-    try:
-        article_id = re.search(r'/articles/(\d+)', url)
-        if not article_id:
-            return None
-            
-        article_id = article_id.group(1)
-        api_url = f"https://centraldeatendimento.totvs.com/api/v2/help_center/pt-br/articles/{article_id}"
-        
-        headers = get_dynamic_headers()
-        headers['accept'] = 'application/json'
-        
-        response = requests.get(api_url, headers=headers, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            article = data.get('article', {})
-            
-            body = article.get('body', '')
-            title = article.get('title', '')
-            
-            soup = BeautifulSoup(body, 'html.parser')
-            text = soup.get_text(separator=' ', strip=True)
-            
-            full_content = f"{title}\n\n{text}"
-            return clean_text(full_content)[:10000]  # Aumentado para 10000 caracteres
-            
-    except Exception:
-        pass
-    
-    return None
-
-# ---------------------------
-# STOP WORDS E PRÉ-PROCESSAMENTO (MELHORADO)
-# ---------------------------
-STOP_WORDS = {
-    "bom dia", "boa tarde", "boa noite", "olá", "att", "atenciosamente",
-    "obrigado", "obrigada", "prezado", "prezada", "caro", "cara", 
-    "senhor", "senhora", "ola", "oi", "saudações", "tudo bem", "tudo bem?",
-    "amigo", "amiga", "por favor", "grato", "grata", "cordialmente", 
-    "abraço", "abs", "ok", "entendi", "obg", "vlw", "por favor", 
-    "favor", "gostaria", "queria", "saber"
-}
-
-PALAVRAS_TECNICAS = {
-    'erp', 'sql', 'api', 'xml', 'json', 'tss', 'nt', 'danfe', 'nfe', 'cte',
-    'mde', 'sped', 'ecd', 'ecf', 'efd', 'protheus', 'fluig', 'rm', 'log',
-    'fis', 'fat', 'crm', 'com', 'tms', 'wms', 'bi', 'linx', 'datasul',
-    'configurar', 'parâmetro', 'erro', 'funcionalidade', 'módulo', 'instalação'
-}
-
-def clean_query(query: str) -> str:
-    """Limpa e otimiza a query para busca"""
-    if not query:
-        return ""
-    
-    # Remover caracteres especiais mas manter acentos
-    query = re.sub(r'[^\w\sáàâãéèêíïóôõöúçñÁÀÂãÉÈÊÍÏÓÔÕÖÚÇÑ-]', ' ', query)
-    query = query.lower().strip()
-    
-    # Remover stop words mas manter palavras técnicas
-    parts = query.split()
-    keep = []
-    
-    for p in parts:
-        p_clean = p.strip()
-        if (p_clean not in STOP_WORDS and len(p_clean) >= 2) or p_clean in PALAVRAS_TECNICAS:
-            keep.append(p_clean)
-    
-    # Adicionar "Protheus" se não estiver presente e for uma consulta técnica
-    if keep and "protheus" not in " ".join(keep).lower():
-        termos_tecnicos = any(term in " ".join(keep).lower() for term in 
-                            ['configurar', 'parâmetro', 'erro', 'funcionalidade', 'módulo', 'instalação'])
-        if termos_tecnicos:
-            keep.append("protheus")
-    
-    return " ".join(keep)
-
-def clean_text(text: str) -> str:
-    """Limpa texto extraído com algoritmos melhorados"""
-    if not text or pd.isna(text):
-        return ""
-    
-    # Remover caracteres nulos e problemas de encoding
-    text = text.replace("\0", " ").replace("\r", " ").replace("\t", " ")
-    
-    # Remover padrões comuns de lixo
-    patterns = [
-        r'Anexo\(s\):.*',
-        r'Compartilhar:.*',
-        r'Comentários.*',
-        r'Artigo criado.*Artigo atualizado.*',
-        r'©\s*\d{4}.*TOTVS',
-        r'https?://\S+',
-        r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b'
-    ]
-    
-    for pattern in patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # Remover HTML tags
-    text = re.sub(r'<[^>]*>', ' ', text)
-    
-    # Normalizar espaços
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
-
-def tem_video_ou_anexo(query: str) -> bool:
-    """Verifica se a query se refere a conteúdo multimídia"""
-    padroes = [
-        r"\banexo\b", r"\banexos\b", r"\banexado\b", r"\banexada\b",
-        r"\bv[íi]deo\b", r"\bv[íi]deos\b", r"\bgravaç[ãa]o\b",
-        r"\bprint\b", r"\bimagem\b", r"\bscreenshot\b", r"\bfoto\b",
-        r"\bpdf\b", r"\barquivo\b", r"\bdownload\b"
-    ]
-    query_lower = query.lower()
-    return any(re.search(p, query_lower) for p in padroes)
-
-# ---------------------------
-# SISTEMA DE EXTRAÇÃO MELHORADO
-# ---------------------------
-def extrair_conteudo_pagina(url: str) -> str:
-    """Extrai conteúdo com múltiplas estratégias"""
-    if '/search?' in url:
-        return "Página de pesquisa - conteúdo não extraído"
-
-    # Tentar via API primeiro (método mais confiável)
-    conteudo_api = extrair_conteudo_via_api(url)
-    if conteudo_api:
-        return conteudo_api
-
-    # Fallback para scraping tradicional
-    try:
-        response = fazer_requisicao_inteligente(url)
-        
-        if not response:
-            return f"❌ Não foi possível acessar: {url}"
-            
-        if response.status_code != 200:
-            return f"Erro HTTP {response.status_code}: {url}"
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remover elementos desnecessários
-        for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'form', 'iframe']):
-            element.decompose()
-        
-        # Estratégias de seleção melhoradas
-        content_selectors = [
-            "article",
-            ".article-body",
-            ".article-content", 
-            "main",
-            ".content",
-            ".post-content",
-            "[role='main']",
-            ".help-center-content"
-        ]
-        
-        content = None
-        for selector in content_selectors:
-            content = soup.select_one(selector)
-            if content:
-                break
-        
-        # Limpar elementos específicos
-        if content:
-            cleanup_selectors = [
-                '.article-meta', '.article-info', '.article-votes',
-                '.comments', '.share-buttons', '.breadcrumb',
-                '.related-articles', '.article-attachments'
-            ]
-            
-            for selector in cleanup_selectors:
-                for element in content.select(selector):
-                    element.decompose()
-            
-            text = content.get_text(separator=' ', strip=True)
-        else:
-            # Fallback estratégico
-            body = soup.find('body')
-            text = body.get_text(separator=' ', strip=True) if body else soup.get_text(separator=' ', strip=True)
-        
-        cleaned_text = clean_text(text)
-        return cleaned_text[:10000] if cleaned_text else "Conteúdo não encontrado"  # Aumentado para 10000
-        
-    except Exception as e:
-        return f"Erro na extração: {str(e)}"
-
-def pesquisar_interna_totvs(query: str, limit: int = 5) -> List[str]:
-    """Pesquisa interna com fallbacks"""
-    cache_key = f"internal_search_{hash(query)}"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
-    
-    base = "https://centraldeatendimento.totvs.com"
-    search_url = f"{base}/hc/pt-br/search?query={urllib.parse.quote(query)}"
-    
-    links = []
-    try:
-        response = fazer_requisicao_inteligente(search_url)
-        
-        if response and response.status_code == 200:
-            soup = BeautifulSoup(response.content, "html.parser")
-            
-            # Múltiplos seletores para robustez
-            selectors = [
-                "a[href*='/articles/']",
-                ".search-result a",
-                ".article-list a",
-                ".article-link"
-            ]
-            
-            for selector in selectors:
-                for a in soup.select(selector):
-                    href = a.get("href", "")
-                    if href:
-                        if href.startswith("/"):
-                            href = base + href
-                        elif not href.startswith("http"):
-                            href = base + "/" + href.lstrip("/")
-                            
-                        if href.startswith(base) and "/articles/" in href and href not in links:
-                            links.append(href)
-                            
-                    if len(links) >= limit:
-                        break
-                if len(links) >= limit:
-                    break
-                    
-    except Exception as e:
-        pass
-    
-    cache.set(cache_key, links)
-    return links
-
-def buscar_documentacao_totvs(query: str, max_links: int = 5) -> List[str]:
-    """Sistema híbrido de busca com múltiplas fontes"""
-    cache_key = f"search_{hash(query)}"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
-    
-    cleaned = clean_query(query)
-    if not cleaned:
-        return []
-    
-    found = []
-    seen = set()
-    
-    # Estratégia 1: API Zendesk (mais confiável)
-    api_links = buscar_via_api_zendesk(cleaned, max_links)
-    for url in api_links:
-        if url not in seen:
-            found.append(url)
-            seen.add(url)
-    
-    # Estratégia 2: DuckDuckGo
-    if len(found) < max_links:
-        try:
-            search_query = f"site:centraldeatendimento.totvs.com {cleaned}"
-            with DDGS() as ddgs:
-                for r in ddgs.text(search_query, max_results=10):
-                    url = r.get("href", "")
-                    if (url.startswith("https://centraldeatendimento.totvs.com") and 
-                        "/articles/" in url and url not in seen):
-                        found.append(url)
-                        seen.add(url)
-                    if len(found) >= max_links:
-                        break
-        except Exception as e:
-            pass
-    
-    # Estratégia 3: Pesquisa interna
-    if len(found) < max_links:
-        interna_links = pesquisar_interna_totvs(cleaned, max_links - len(found))
-        for url in interna_links:
-            if url not in seen:
-                found.append(url)
-                seen.add(url)
-    
-    # Fallback final
-    if not found:
-        found = [f"https://centraldeatendimento.totvs.com/hc/pt-br/search?query={urllib.parse.quote(cleaned)}"]
-    
-    cache.set(cache_key, found)
-    return found[:max_links]
-
-# ---------------------------
-# SISTEMA DE RELEVÂNCIA MELHORADO
-# ---------------------------
-def pontuar_relevancia(texto: str, query: str) -> float:
-    """Sistema de pontuação de relevância melhorado"""
-    if not texto or not query:
-        return 0.0
-    
-    tokens_query = set(clean_query(query).split())
-    tokens_texto = set(texto.lower().split())
-    
-    if not tokens_query or not tokens_texto:
-        return 0.0
-    
-    # Pontuação baseada na interseção
-    intersection = tokens_query & tokens_texto
-    base_score = len(intersection) / len(tokens_query)
-    
-    # Bônus para correspondências exatas
-    exact_matches = sum(1 for token in tokens_query if token in texto.lower())
-    exact_bonus = exact_matches * 0.1
-    
-    # Bônus para palavras técnicas
-    tech_bonus = sum(0.05 for token in intersection if token in PALAVRAS_TECNICAS)
-    
-    final_score = min(base_score + exact_bonus + tech_bonus, 1.0)
-    return final_score
-
-# ---------------------------
-# SISTEMA IA MELHORADO COM TRATAMENTO DE ERROS
-# ---------------------------
-def reclassificar_artigos_ia(artigos: List[Tuple[float, str, str]], query: str, use_gemini: bool, api_key: str, modelo: str) -> List[Tuple[float, str, str]]:
-    """Usa IA para reclassificar os artigos por relevância"""
-    if not artigos or len(artigos) <= 1:
-        return artigos
-    
-    cache_key = f"reclass_{hash(query + ''.join(url for _, url, _ in artigos))}"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
-    
-    try:
-        artigos_info = []
-        for score, url, conteudo in artigos:
-            titulo = url.split('/')[-1].replace('-', ' ')[:100]
-            preview = conteudo[:200] + "..." if conteudo and len(conteudo) > 50 else "Conteúdo não disponível"
-            artigos_info.append(f"URL: {url}\nTítulo: {titulo}\nConteúdo: {preview}\n---")
-        
-        artigos_texto = "\n".join(artigos_info)
-        
-        if use_gemini:
-            resposta = reclassificar_gemini(query, artigos_texto, modelo, api_key)
-        else:
-            resposta = reclassificar_openai(query, artigos_texto, modelo, api_key)
-        
-        artigos_ordenados = processar_resposta_reclassificacao(resposta, artigos)
-        
-        if artigos_ordenados:
-            cache.set(cache_key, artigos_ordenados)
-            return artigos_ordenados
-        else:
-            resultado = sorted(artigos, reverse=True, key=lambda x: x[0])
-            cache.set(cache_key, resultado)
-            return resultado
-            
-    except Exception as e:
-        st.error(f"Erro na reclassificação por IA: {e}")
-        resultado = sorted(artigos, reverse=True, key=lambda x: x[0])
-        cache.set(cache_key, resultado)
-        return resultado
-
-def reclassificar_gemini(query: str, artigos_texto: str, model: str, api_key: str) -> str:
-    """Reclassifica artigos usando Gemini com tratamento robusto de erros"""
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        
-        # Configuração de segurança para evitar respostas bloqueadas
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH", 
-                "threshold": "BLOCK_NONE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE"
-            }
-        ]
-        
-        prompt = f"""
-        Analise estes artigos da documentação TOTVS e ordene-os por relevância para a pergunta do usuário.
-        
-        PERGUNTA DO USUÁRIO: {query}
-        
-        ARTIGOS ENCONTRADOS:
-        {artigos_texto}
-        
-        INSTRUÇÕES:
-        1. Analise cada artigo em relação à pergunta
-        2. Ordene do MAIS RELEVANTE para o MENOS RELEVANTE  
-        3. Retorne APENAS os URLs em ordem de relevância, um por linha
-        4. Não inclua explicações, apenas a lista ordenada de URLs
-        5. Se não puder determinar a relevância, retorne os URLs na ordem original
-        
-        URLs ORDENADOS:
-        """
-        
-        # Usar modelo mais estável
-        if model not in ["gemini-2.5-flash", "gemini-2.5-pro"]:
-            model = "gemini-pro"
-            
-        gemini_model = genai.GenerativeModel(
-            model_name=model,
-            safety_settings=safety_settings,
-            generation_config={
-                "temperature": 0.0,
-                "max_output_tokens": 2000,
-            }
-        )
-        
-        response = gemini_model.generate_content([prompt])
-        
-        # Tratamento robusto da resposta
-        if response and response.parts:
-            return response.text.strip()
-        elif response and response.candidates:
-            # Tentar extrair texto dos candidatos
-            for candidate in response.candidates:
-                if candidate.content and candidate.content.parts:
-                    return candidate.content.parts[0].text.strip()
-        
-        return ""  # Retorna string vazia em caso de erro
-        
-    except Exception as e:
-        st.warning(f"Aviso Gemini: {e}")
-        return ""  # Retorna string vazia em caso de erro
-
-def reclassificar_openai(query: str, artigos_texto: str, model: str, api_key: str) -> str:
-    """Reclassifica artigos usando OpenAI"""
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        prompt = f"""
-        Analise estes artigos da documentação TOTVS e ordene-os por relevância para a pergunta do usuário.
-        
-        PERGUNTA DO USUÁRIO: {query}
-        
-        ARTIGOS ENCONTRADOS:
-        {artigos_texto}
-        
-        INSTRUÇÕES:
-        1. Analise cada artigo em relação à pergunta
-        2. Ordene do MAIS RELEVANTE para o MENOS RELEVANTE
-        3. Retorne APENAS os URLs em ordem de relevância, um por linha
-        4. Não inclua explicações, apenas a lista ordenada de URLs
-        """
-        
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Você é um especialista em classificar documentação técnica por relevância."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.0,
-            max_tokens=500,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as e:
-        raise Exception(f"Erro OpenAI: {e}")
-
-def processar_resposta_reclassificacao(resposta_ia: str, artigos_originais: List[Tuple[float, str, str]]) -> List[Tuple[float, str, str]]:
-    """Processa a resposta da IA e reordena os artigos"""
-    if not resposta_ia:
-        return []
-    
-    # Extrair URLs da resposta
-    urls_ordenados = []
-    for linha in resposta_ia.split('\n'):
-        linha = linha.strip()
-        if linha.startswith('http'):
-            urls_ordenados.append(linha)
-    
-    # Criar mapa de artigos por URL
-    artigo_por_url = {url: (score, url, conteudo) for score, url, conteudo in artigos_originais}
-    
-    # Reordenar baseado na classificação da IA
-    artigos_ordenados = []
-    for url in urls_ordenados:
-        if url in artigo_por_url:
-            artigos_ordenados.append(artigo_por_url[url])
-    
-    # Adicionar quaisquer artigos que não foram classificados pela IA
-    urls_adicionados = set(urls_ordenados)
-    for artigo in artigos_originais:
-        if artigo[1] not in urls_adicionados:
-            artigos_ordenados.append(artigo)
-    
-    return artigos_ordenados
-
-def formatar_links_saiba_mais(links: List[str]) -> str:
-    """Formata os links para a seção Saiba Mais"""
-    if not links:
-        return ""
-    
-    padroes_de_remocao = ["-Cross", "-CROSS", "-RH", "-MP", "-Logística", "-Framework", "-LOG", "-FIN", "-FAT", "-CRM"]
-    
-    links_formatados = []
-    for link in links:
-        link_limpo = link
-        for padrao in padroes_de_remocao:
-            posicao = link.find(padrao)
-            if posicao != -1:
-                link_limpo = link[:posicao]
-                break
-        links_formatados.append(link_limpo)
-    
-    # Remover duplicatas mantendo a ordem
-    links_unicos = []
-    for link in links_formatados:
-        if link not in links_unicos:
-            links_unicos.append(link)
-    
-    # Formatar a seção Saiba Mais
-    saiba_mais = "\n\n**🔗 Saiba mais:**\n"
-    for i, link in enumerate(links_unicos[:5], 1):  # Limitar a 5 links
-        saiba_mais += f"{i}. {link}\n"
-    
-    return saiba_mais
-
-def get_ai_response(query: str, context: str, fontes: List[str], modelo: str, use_gemini: bool, api_key: str, temperatura: float):
-    """Função unificada que escolhe entre Gemini e ChatGPT com tratamento robusto"""
-    
-    # Filtrar contexto removendo mensagens de erro
-    if "erro 403" in context.lower() or "acesso negado" in context.lower():
-        context = "Conteúdo não disponível devido a restrições de acesso."
-    
-    if not context or not context.strip() or context == "Conteúdo não disponível devido a restrições de acesso.":
-        return "Não encontrei essa informação na documentação oficial devido a restrições de acesso."
-
-    try:
-        if use_gemini:
-            return get_gemini_response_robusto(query, context, fontes, modelo, api_key, temperatura)
+class ProgressoStreamlit(Progresso):
+    """Mostra o andamento de processar_pergunta em um st.status e a resposta em `area_resposta`
+    
+    Avisos vindos de outras threads (busca/extração) não podem escrever na página;
+    ficam pendentes e são exibidos na próxima chamada da thread do script.
+    """
+    
+    def __init__(self, area_resposta=None):
+        self.area_resposta = area_resposta
+        self._status = None
+        self._saida = None
+        self._texto = ""
+        self._thread = threading.current_thread()
+        self._pendentes = []
+    
+    def _na_thread_do_script(self) -> bool:
+        return threading.current_thread() is self._thread
+    
+    def _exibir_pendentes(self):
+        while self._pendentes:
+            self._exibir_aviso(*self._pendentes.pop(0))
+    
+    def _exibir_aviso(self, mensagem: str, nivel: str):
+        destino = self._status or st
+        {"info": destino.info, "error": destino.error}.get(nivel, destino.warning)(mensagem)
+    
+    def status(self, rotulo: str, estado: str = "running"):
+        self._exibir_pendentes()
+        if self._status is None:
+            self._status = st.status(rotulo, expanded=True)
         else:
-            return get_chatgpt_response(query, context, fontes, modelo, api_key, temperatura)
-    except Exception as e:
-        return f"Erro ao processar a resposta: {str(e)}"
-
-def get_gemini_response_robusto(query: str, context: str, fontes: List[str], model: str, api_key: str, temperatura: float):
-    """Versão robusta do Gemini com tratamento completo de erros"""
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        
-        # Configurações de segurança relaxadas
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_NONE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_NONE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_NONE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_NONE"
-            }
-        ]
-        
-        generation_config = {
-            "temperature": min(temperatura, 0.7),  # Limitar temperatura para evitar problemas
-            "top_p": 0.8,
-            "top_k": 40,
-            "max_output_tokens": 3600,  # AUMENTADO: de 1024 para 3600 tokens
-        }
-        
-        # Usar modelo mais estável
-        if model not in ["gemini-2.5-flash", "gemini-2.5-pro"]:
-            model = "gemini-2.5-flash"
-        
-        gemini_model = genai.GenerativeModel(
-            model_name=model,
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-        
-        system_prompt = (
-            "Você é um analista de suporte especializado no ERP Protheus da TOTVS.\n"
-            "Responda de forma técnica, precisa e baseada exclusivamente no contexto fornecido.\n"
-            "- Se a informação não estiver no contexto, responda apenas: \"Não encontrei essa informação na documentação oficial\".\n"
-            "- Seja objetivo e inclua passos acionáveis quando aplicável.\n"
-            "- Forneça respostas RESUMIDA, não corte informações importantes.\n"
-            "- NÃO inclua a seção 'Fontes consultadas' no final - isso será adicionado automaticamente.\n"
-        )
-
-        user_content = (
-            f"{system_prompt}\n\n"
-            f"PERGUNTA DO USUÁRIO:\n{query}\n\n"
-            f"CONTEÚDO EXTRAÍDO:\n{context}\n\n"
-            "INSTRUÇÃO IMPORTANTE: Forneça uma resposta COMPLETA sem cortes. Se necessário, use parágrafos claros e organizados.\n\n"
-            "Fontes disponíveis:\n" + "\n".join(fontes)
-        )
-
-        response = gemini_model.generate_content([user_content])
-        
-        # Tratamento robusto da resposta
-        if response and response.parts:
-            return response.text.strip()
-        elif response and response.candidates:
-            for candidate in response.candidates:
-                if candidate.content and candidate.content.parts:
-                    return candidate.content.parts[0].text.strip()
-        
-        # Fallback se a resposta estiver vazia
-        return "Não foi possível gerar uma resposta para esta consulta."
-        
-    except Exception as e:
-        return f"Erro ao processar a solicitação: {str(e)}"
-
-def get_chatgpt_response(query: str, context: str, fontes: List[str], model: str, api_key: str, temperatura: float):
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        system_prompt = (
-            "Você é um analista de suporte especializado no ERP Protheus da TOTVS.\n"
-            "Responda de forma técnica, precisa e baseada exclusivamente no contexto fornecido.\n"
-            "- Se a informação não estiver no contexto, responda apenas: \"Não encontrei essa informação na documentação oficial\".\n"
-            "- Seja objetivo e inclua passos acionáveis quando aplicável.\n"
-            "- Forneça respostas RESUMIDA, não corte informações importantes.\n"
-            "- NÃO inclua a seção 'Fontes consultadas' no final - isso será adicionado automaticamente.\n"
-        )
-        
-        user_content = f"PERGUNTA DO USUÁRIO:\n{query}\n\nCONTEÚDO EXTRAÍDO:\n{context}\n\nINSTRUÇÃO: Forneça resposta COMPLETA sem cortes.\n\nFontes disponíveis:\n" + "\n".join(fontes)
-
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content},
-            ],
-            temperature=temperatura,
-            max_tokens=3060,  # AUMENTADO: de 512 para 3060 tokens
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Erro ao gerar resposta com OpenAI: {e}"
+            self._status.update(label=rotulo, state=estado, expanded=False)
+    
+    def etapa(self, mensagem: str):
+        self._exibir_pendentes()
+        if self._status is not None:
+            self._status.write(mensagem)
+    
+    def aviso(self, mensagem: str, nivel: str = "warning"):
+        if not self._na_thread_do_script():
+            self._pendentes.append((mensagem, nivel))
+            return
+        self._exibir_pendentes()
+        self._exibir_aviso(mensagem, nivel)
+    
+    def inicio_resposta(self, prefixo: str):
+        self._exibir_pendentes()
+        if self.area_resposta is None:
+            return
+        with self.area_resposta.container():
+            st.markdown("---")
+            st.subheader("📋 Resposta:")
+            if prefixo:
+                st.write(prefixo)
+            self._saida = st.empty()
+    
+    def pedaco(self, texto: str):
+        if self._saida is not None:
+            self._texto += texto
+            self._saida.markdown(self._texto + "▌")
+    
+    def concluir(self):
+        self._exibir_pendentes()
 
 def exibir_resposta_longa(resposta):
     """Exibe respostas longas com melhor formatação"""
@@ -883,15 +132,10 @@ def exibir_resposta_longa(resposta):
 # ---------------------------
 def inicializar_session_state():
     """Inicializa as variáveis de session state"""
+    # Configurações da pergunta (os padrões do núcleo) e estado da interface
     defaults = {
-        'min_score': 0.3,
-        'use_gemini': True,
-        'modelo': "gemini-2.5-flash", 
-        'api_key': "",
-        'temperatura': 0.1,
+        **asdict(ConfiguracaoPergunta()),
         'mostrar_codigo': False,
-        'reclassificar_ia': True,
-        'cache_enabled': True,
         'historico': []
     }
     
@@ -926,110 +170,202 @@ def adicionar_ao_historico(pergunta, resposta):
     if len(st.session_state.historico) > 10:
         st.session_state.historico = st.session_state.historico[-10:]
 
-def processar_pergunta(user_query: str):
-    """Processa a pergunta do usuário e retorna a resposta"""
-    # Verificar se a API key foi configurada
-    if not st.session_state.api_key:
-        return "Erro: Chave da API não configurada. Por favor, configure sua chave na sidebar."
+def responder_pergunta(user_query: str, area_resposta=None) -> str:
+    """Roda o pipeline do núcleo com a configuração da sidebar e guarda latência e etapas na sessão
+    
+    Com o streaming ativo e `area_resposta` (um st.empty()) informado, a resposta é
+    exibida ali conforme é gerada; o texto final completo é retornado do mesmo jeito.
+    """
+    st.session_state.ultima_latencia = None
+    progresso = ProgressoStreamlit(area_resposta)
+    resultado = processar_pergunta(user_query, ConfiguracaoPergunta.de_dict(st.session_state), progresso)
+    progresso.concluir()
+    
+    st.session_state.ultima_latencia = resultado.latencia
+    st.session_state.ultimo_detalhamento = resultado.etapas
+    st.session_state.ultimas_degradacoes = resultado.degradacoes
+    if resultado.respondida:
+        adicionar_ao_historico(user_query, resultado.resposta)
+    return resultado.resposta
+
+def exibir_estatisticas_cache():
+    """Mostra ocupação e acertos/erros do cache por namespace"""
+    stats = cache.estatisticas()
+    st.caption(f"Itens: {stats['itens']}/{cache.max_itens} | "
+               f"Memória: {stats['bytes'] / 1024 / 1024:.1f}/{cache.max_bytes / 1024 / 1024:.0f} MB")
+    if stats["disco"] is not None:
+        st.caption(f"Disco: {stats['disco']['itens']} itens | "
+                   f"{stats['disco']['bytes'] / 1024 / 1024:.1f}/{cache.disco.max_bytes / 1024 / 1024:.0f} MB")
+    
+    linhas = []
+    for namespace in CACHE_NAMESPACES + ("outros",):
+        ns = stats["namespaces"].get(namespace)
+        if not ns:
+            continue
+        consultas = ns["hits"] + ns["hits_disco"] + ns["misses"]
+        linhas.append({
+            "Namespace": namespace,
+            "Hits": ns["hits"],
+            "Hits disco": ns["hits_disco"],
+            "Misses": ns["misses"],
+            "Taxa de acerto": f"{(ns['hits'] + ns['hits_disco']) / consultas:.0%}" if consultas else "-",
+            "Evictions": ns["evictions"],
+            "Expirados": ns["expirados"],
+        })
+    
+    if linhas:
+        st.dataframe(pd.DataFrame(linhas), hide_index=True, use_container_width=True)
+    else:
+        st.caption("Nenhuma consulta ao cache ainda.")
+    
+    validacao = revalidacao.estatisticas()
+    revalidadas = validacao["revalidadas_304"] + validacao["revalidadas_updated_at"]
+    if revalidadas or validacao["completas"]:
+        st.caption(f"Artigos revalidados: {revalidadas} ({validacao['revalidadas_304']} por 304, "
+                   f"{validacao['revalidadas_updated_at']} pelo updated_at) | "
+                   f"Baixados por completo: {validacao['completas']} | Versões guardadas: {validacao['itens']}")
+    
+    voos = em_voo.estatisticas().values()
+    compartilhadas = sum(stats["compartilhadas"] for stats in voos)
+    if compartilhadas:
+        st.caption(f"Coalescência: {compartilhadas} chamada(s) aproveitaram outra igual em andamento "
+                   f"({sum(stats['chamadas'] for stats in voos)} feitas de fato)")
+    
+    respostas = cache_respostas.estatisticas()
+    consultas = respostas["hits_exatos"] + respostas["hits_semelhantes"] + respostas["misses"]
+    taxa = f"{(consultas - respostas['misses']) / consultas:.0%}" if consultas else "-"
+    st.caption(f"Respostas: {respostas['itens']}/{cache_respostas.max_itens} | "
+               f"Hits: {respostas['hits_exatos']} exatos, {respostas['hits_semelhantes']} semelhantes | "
+               f"Misses: {respostas['misses']} | Taxa de acerto: {taxa}")
+    if respostas["invalidados"] or respostas["expirados"]:
+        st.caption(f"Respostas descartadas: {respostas['invalidados']} por artigo alterado, "
+                   f"{respostas['expirados']} por TTL")
+
+def exibir_estatisticas_http():
+    """Mostra o uso do pool de conexões HTTP compartilhado"""
+    stats = cliente_http.estatisticas()
+    total = stats["conexoes_abertas"] + stats["conexoes_reutilizadas"]
+    col1, col2 = st.columns(2)
+    col1.metric("Conexões abertas", stats["conexoes_abertas"])
+    col2.metric("Reutilizadas", stats["conexoes_reutilizadas"],
+                help=f"{stats['conexoes_reutilizadas'] / total:.0%} das requisições" if total else None)
+    st.caption(f"Requisições: {stats['requisicoes']['simples']} diretas, "
+               f"{stats['requisicoes']['navegador']} via CloudScraper | Hosts no pool: {stats['hosts']} | "
+               f"Pool por host: {cliente_http.pool_maxsize}")
+
+def exibir_clientes_ia():
+    """Clientes de IA em uso com a chave desta sessão: chamadas e custo de construção"""
+    api_key = st.session_state.get('api_key')
+    linhas = [{
+        "Provedor": stats["provedor"],
+        "Modelo": stats["modelo"],
+        "Chamadas": stats["chamadas"],
+        "Construções": stats["construcoes"],
+        "Construção (ms)": round(stats["tempo_construcao"] * 1000, 1),
+    } for stats in registro_ia.estatisticas(api_key)] if api_key else []
+    
+    if linhas:
+        st.dataframe(pd.DataFrame(linhas), hide_index=True, use_container_width=True)
+    else:
+        st.caption("Nenhuma chamada à IA ainda.")
+
+def exibir_latencias():
+    """Tempo de cada etapa da última consulta e percentis acumulados por etapa"""
+    etapas = st.session_state.get('ultimo_detalhamento')
+    if etapas:
+        st.dataframe(pd.DataFrame([{
+            "Etapa": etapa["etapa"],
+            "Início (s)": round(etapa["inicio"], 2),
+            "Duração (s)": round(etapa["duracao"], 3),
+            "Resultado": etapa["resultado"],
+        } for etapa in etapas]), hide_index=True, use_container_width=True)
+        degradacoes = st.session_state.get('ultimas_degradacoes')
+        if degradacoes:
+            st.caption("Degradações pelo prazo: " + " | ".join(DEGRADACOES[codigo] for codigo in degradacoes))
+    else:
+        st.caption("Nenhuma consulta processada nesta sessão.")
     
-    cleaned_query = clean_query(user_query)
-    if not cleaned_query:
-        return "Não foi possível processar a pergunta."
-
-    if tem_video_ou_anexo(user_query):
-        return "Pergunta contém referência a vídeo ou anexo. Não será feita busca automática na documentação."
+    histograma = metricas_latencia.obter(HIST_ETAPA)
+    linhas = []
+    for rotulos, serie in histograma.series():
+        if rotulos["resultado"] != "sucesso":
+            continue
+        p50 = histograma.quantil(0.5, serie["contagens"])
+        p95 = histograma.quantil(0.95, serie["contagens"])
+        linhas.append({"Etapa": rotulos["etapa"], "Consultas": serie["total"],
+                       "p50 (s)": round(p50, 3), "p95 (s)": round(p95, 3)})
+    if linhas:
+        st.caption("Todas as consultas do processo (estimativa pelos buckets):")
+        st.dataframe(pd.DataFrame(sorted(linhas, key=lambda l: l["Etapa"])), hide_index=True,
+                     use_container_width=True)
+    
+    servidor = obter_servidor_metricas()
+    if servidor.ativo:
+        st.caption(f"Prometheus: http://{METRICAS_HOST}:{METRICAS_PORTA}/metrics")
+    elif servidor.erro:
+        st.caption(f"Endpoint /metrics indisponível: {servidor.erro}")
+    else:
+        st.caption("Endpoint /metrics desativado (RESPONDE_AI_METRICAS_PORTA=0).")
+
+ROTULOS_DISJUNTOR = {"fechado": "🟢 Fechado", "aberto": "🔴 Aberto", "meio_aberto": "🟡 Meio-aberto"}
+
+def exibir_disjuntores():
+    """Estado do disjuntor de cada host e tamanho do cache negativo"""
+    linhas = [{
+        "Host": estado["host"],
+        "Estado": ROTULOS_DISJUNTOR[estado["estado"]],
+        "Falhas seguidas": estado["falhas_seguidas"],
+        "Reabre em (s)": round(estado["reabre_em"]) if estado["estado"] == "aberto" else None,
+        "Recusadas": estado["recusadas"],
+    } for estado in disjuntores.estados()]
+    
+    if linhas:
+        st.dataframe(pd.DataFrame(linhas), hide_index=True, use_container_width=True)
+    else:
+        st.caption("Nenhuma requisição externa ainda.")
+    st.caption(f"Cache negativo: {len(cache_negativo)} URL(s)/consulta(s) com falha recente | "
+               f"Tentativas evitadas: {cache_negativo.evitadas}")
+
+def exibir_espelho():
+    """Estado do espelho local e controle da sincronização"""
+    if espelho is None:
+        st.caption("Espelho desativado (RESPONDE_AI_ESPELHO).")
+        return
+    
+    st.session_state.usar_espelho = st.checkbox(
+        "Consultar espelho primeiro",
+        value=st.session_state.usar_espelho,
+        help="Busca e lê artigos do espelho local antes de ir à central"
+    )
     
     try:
-        # Buscar links
-        with st.status("Buscando na documentação TOTVS...", expanded=True) as status:
-            status.write("🔍 Procurando artigos relevantes...")
-            links = buscar_documentacao_totvs(user_query, max_links=5)
-            
-            if not links:
-                return "Não foram encontrados artigos relevantes na documentação TOTVS."
-            
-            status.write(f"📚 Encontrados {len(links)} artigos. Extraindo conteúdo...")
-            contexto_scores = []
-            
-            # Extrair conteúdo dos links
-            for i, link in enumerate(links):
-                status.write(f"📖 Lendo artigo {i+1}/{len(links)}...")
-                texto = extrair_conteudo_pagina(link)
-                score = pontuar_relevancia(texto, user_query)
-                contexto_scores.append((score, link, texto))
-
-            # Reclassificação inteligente por IA
-            if st.session_state.reclassificar_ia and len(contexto_scores) > 1:
-                status.write("🧠 Reclassificando artigos por relevância...")
-                contexto_scores = reclassificar_artigos_ia(
-                    contexto_scores, 
-                    user_query, 
-                    st.session_state.use_gemini,
-                    st.session_state.api_key,
-                    st.session_state.modelo
-                )
-            else:
-                # Ordenação tradicional por score
-                contexto_scores.sort(reverse=True, key=lambda x: x[0])
-            
-            status.write("🤖 Gerando resposta com IA...")
-            
-            # Usar os 3 artigos mais relevantes para o contexto
-            artigos_relevantes = contexto_scores[:3]
-            contexto_combinado = "\n\n".join([conteudo for _, _, conteudo in artigos_relevantes if conteudo.strip()])
-            
-            # Gerar resposta
-            if not contexto_combinado.strip():
-                resposta_final = "Atenção: não foi possível validar essa informação específica na documentação oficial."
-            elif contexto_scores[0][0] < st.session_state.min_score:
-                resposta_final = "Observação: essa consulta aborda um ponto não detalhado na documentação. A resposta é baseada em conhecimento geral.\n\n"
-                resposta_final += get_ai_response(
-                    user_query, 
-                    contexto_combinado, 
-                    [link for _, link, _ in artigos_relevantes], 
-                    st.session_state.modelo,
-                    st.session_state.use_gemini,
-                    st.session_state.api_key,
-                    st.session_state.temperatura
-                )
-            else:
-                resposta_final = get_ai_response(
-                    user_query, 
-                    contexto_combinado, 
-                    [link for _, link, _ in artigos_relevantes], 
-                    st.session_state.modelo,
-                    st.session_state.use_gemini,
-                    st.session_state.api_key,
-                    st.session_state.temperatura
-                )
-            
-            # Adicionar seção "Saiba mais" se a resposta for válida
-            mensagens_erro = [
-                "não foi possível validar essa informação específica",
-                "não encontrei essa informação na documentação oficial",
-                "conteúdo não disponível devido a restrições de acesso",
-                "erro ao processar",
-                "não foi possível gerar"
-            ]
-            
-            resposta_valida = not any(erro in resposta_final.lower() for erro in mensagens_erro)
-            
-            if resposta_valida and links:
-                saiba_mais = formatar_links_saiba_mais([link for _, link, _ in contexto_scores[:5]])
-                resposta_final += saiba_mais
-            
-            status.update(label="Processamento completo!", state="complete")
-            
-        # Adicionar ao histórico
-        adicionar_ao_historico(user_query, resposta_final)
-        return resposta_final
-
-    except Exception as e:
-        return f"Ocorreu um erro durante o processamento: {str(e)}"
+        st.caption(f"Artigos: {espelho.total()} | Última sincronização: {espelho.meta('ultima_sincronizacao') or 'nunca'}")
+    except sqlite3.Error as e:
+        st.caption(f"Espelho indisponível: {e}")
+    
+    thread = obter_controle_sincronizacao()["thread"]
+    if thread is not None and thread.executando:
+        st.info("🔄 Sincronização em andamento...")
+    elif st.button("🔄 Sincronizar agora"):
+        iniciar_sincronizacao_espelho()
+        st.info("🔄 Sincronização iniciada em segundo plano.")
+    
+    st.caption(f"Índice vetorial: {len(indice_vetorial)} artigos ({indice_vetorial.dim} dimensões)")
+    if st.button("🧮 Indexar espelho (vetorial)"):
+        with st.spinner("Codificando artigos do espelho..."):
+            total = indexar_espelho_vetorial()
+        st.success(f"{total} artigos indexados e salvos em {VETORES_CAMINHO}")
+    
+    if thread is not None and not thread.executando:
+        if thread.ultimo_erro:
+            st.warning(f"Última sincronização falhou: {thread.ultimo_erro}")
+        elif thread.ultimo_resultado:
+            st.caption(f"Última execução: {thread.ultimo_resultado}")
 
 def main():
     # Inicializar session state
     inicializar_session_state()
+    obter_servidor_metricas()
     
     # Sidebar para configurações
     with st.sidebar:
@@ -1053,16 +389,130 @@ def main():
             help="Melhora performance armazenando resultados temporariamente"
         )
         
+        st.session_state.cache_respostas = st.checkbox(
+            "Reaproveitar Respostas",
+            value=st.session_state.cache_respostas,
+            disabled=not st.session_state.cache_enabled,
+            help="Responde na hora perguntas iguais ou muito parecidas com outras já respondidas"
+        )
+        
+        if st.session_state.cache_respostas:
+            st.session_state.similaridade_resposta = st.slider(
+                "Similaridade Mínima (respostas)",
+                min_value=0.5,
+                max_value=1.0,
+                value=float(st.session_state.similaridade_resposta),
+                step=0.05,
+                help="Quão parecida a pergunta precisa ser de uma já respondida para reaproveitar a resposta"
+            )
+        
         if st.button("🧹 Limpar Cache"):
             cache.clear()
+            cache_respostas.clear()
+            cache_negativo.clear()
+            revalidacao.clear()
             st.success("Cache limpo!")
         
+        with st.expander("📊 Estatísticas do Cache"):
+            exibir_estatisticas_cache()
+        
+        with st.expander("🌐 Conexões HTTP"):
+            exibir_estatisticas_http()
+        
+        with st.expander("🔌 Disjuntores por Host"):
+            exibir_disjuntores()
+        
+        with st.expander("🤖 Clientes de IA"):
+            exibir_clientes_ia()
+        
+        with st.expander("⏱️ Última Consulta"):
+            exibir_latencias()
+        
+        with st.expander("📦 Espelho Local"):
+            exibir_espelho()
+        
+        st.session_state.max_extracoes = st.slider(
+            "Extrações Simultâneas",
+            min_value=1,
+            max_value=8,
+            value=st.session_state.max_extracoes,
+            step=1,
+            help="Quantidade máxima de artigos lidos em paralelo (valores altos podem causar bloqueio da central)"
+        )
+        
+        st.session_state.busca_paralela = st.checkbox(
+            "Busca Paralela",
+            value=st.session_state.busca_paralela,
+            help="Consulta API, DuckDuckGo e pesquisa interna ao mesmo tempo"
+        )
+        
+        st.session_state.busca_vetorial = st.checkbox(
+            "Busca Vetorial Local",
+            value=st.session_state.busca_vetorial,
+            help="Acrescenta artigos semelhantes já lidos/espelhados, sem nova busca na rede"
+        )
+        
+        if st.session_state.busca_paralela:
+            st.session_state.prazo_busca = st.slider(
+                "Prazo da Busca (s)",
+                min_value=2.0,
+                max_value=30.0,
+                value=float(st.session_state.prazo_busca),
+                step=1.0,
+                help="Tempo máximo de espera pelas estratégias de busca; as mais lentas são ignoradas"
+            )
+        
+        st.session_state.prazo_total = st.slider(
+            "Prazo da Pergunta (s)",
+            min_value=0.0,
+            max_value=180.0,
+            value=float(st.session_state.prazo_total),
+            step=5.0,
+            help="Tempo máximo para responder (0 = sem prazo). Quando aperta, a pergunta usa menos artigos, "
+                 "dispensa a reclassificação por IA e, por fim, entrega uma resposta parcial"
+        )
+        
+        st.session_state.streaming = st.checkbox(
+            "Resposta em Streaming",
+            value=st.session_state.streaming,
+            help="Exibe a resposta enquanto é gerada pela IA"
+        )
+        
         st.session_state.reclassificar_ia = st.checkbox(
             "Reclassificação por IA", 
             value=st.session_state.reclassificar_ia,
-            help="Usa IA para ordenar resultados por relevância"
+            help="Usa IA para ordenar resultados por relevância quando a ordenação local é incerta"
         )
         
+        if st.session_state.reclassificar_ia:
+            st.session_state.margem_reclassificacao = st.slider(
+                "Margem para Dispensar a IA",
+                min_value=0.0,
+                max_value=0.5,
+                value=float(st.session_state.margem_reclassificacao),
+                step=0.01,
+                help="Se o 1º artigo da ordenação local superar o 2º por esta margem, a reclassificação por IA é dispensada (0 = sempre dispensa)"
+            )
+            metricas = obter_metricas_reclassificacao()
+            total = metricas["ia"] + metricas["local"]
+            if total:
+                st.caption(f"IA dispensada em {metricas['local']}/{total} perguntas ({metricas['local'] / total:.0%})")
+            
+            st.session_state.resposta_antecipada = st.checkbox(
+                "Resposta Antecipada",
+                value=st.session_state.resposta_antecipada,
+                help="Começa a gerar a resposta com a ordem local enquanto a IA reclassifica; "
+                     "se os 3 artigos principais mudarem, a resposta é descartada e gerada de novo"
+            )
+            especulacao = obter_metricas_especulacao()
+            tentativas = especulacao["acertos"] + especulacao["erros"]
+            if tentativas:
+                economia_media = especulacao["economia"] / especulacao["acertos"] if especulacao["acertos"] else 0.0
+                st.caption(f"Antecipação: {especulacao['acertos']}/{tentativas} aproveitadas "
+                           f"({especulacao['acertos'] / tentativas:.0%}) | "
+                           f"Economia: {especulacao['economia']:.1f}s (média {economia_media:.1f}s) | "
+                           f"Descartado: {especulacao['desperdicio']:.1f}s")
+        
         st.session_state.min_score = st.slider(
             "Score Mínimo de Relevância",
             min_value=0.0,
@@ -1072,6 +522,24 @@ def main():
             help="Valores mais baixos retornam mais resultados"
         )
         
+        st.session_state.max_passagens = st.slider(
+            "Trechos no Contexto",
+            min_value=2,
+            max_value=12,
+            value=st.session_state.max_passagens,
+            step=1,
+            help="Quantidade de trechos (passagens) dos artigos enviados à IA"
+        )
+        
+        st.session_state.orcamento_tokens = st.slider(
+            "Orçamento de Tokens (entrada)",
+            min_value=1000,
+            max_value=16000,
+            value=st.session_state.orcamento_tokens,
+            step=500,
+            help="Limite de tokens do prompt de resposta; os trechos mais relevantes são incluídos até esse limite"
+        )
+        
         st.session_state.temperatura = st.slider(
             "Temperatura da IA",
             min_value=0.0,
@@ -1138,29 +606,42 @@ def main():
     # Botão de envio
     col1, col2 = st.columns([1, 4])
     with col1:
-        if st.button("🚀 Enviar Pergunta", type="primary", use_container_width=True):
-            if not user_query.strip():
-                st.warning("Por favor, digite sua pergunta.")
-            else:
-                if not st.session_state.api_key:
-                    st.error("❌ Configure sua chave da API na sidebar para continuar.")
-                else:
-                    resposta = processar_pergunta(user_query)
-                    st.session_state.resposta = resposta
-                    st.session_state.mostrar_codigo = False
+        enviar = st.button("🚀 Enviar Pergunta", type="primary", use_container_width=True)
     
     with col2:
         if st.button("🧹 Limpar", use_container_width=True):
             if 'resposta' in st.session_state:
                 del st.session_state.resposta
+            st.session_state.ultima_latencia = None
             st.session_state.mostrar_codigo = False
             st.rerun()
     
+    # Área onde a resposta é exibida durante o streaming
+    area_resposta = st.empty()
+    
+    if enviar:
+        if not user_query.strip():
+            st.warning("Por favor, digite sua pergunta.")
+        else:
+            if not st.session_state.api_key:
+                st.error("❌ Configure sua chave da API na sidebar para continuar.")
+            else:
+                resposta = responder_pergunta(user_query, area_resposta)
+                area_resposta.empty()  # A versão final é exibida abaixo
+                st.session_state.resposta = resposta
+                st.session_state.mostrar_codigo = False
+    
     # Exibir resposta se existir
     if 'resposta' in st.session_state and st.session_state.resposta:
         # Use a nova função para exibir respostas longas
         exibir_resposta_longa(st.session_state.resposta)
         
+        latencia = st.session_state.get('ultima_latencia')
+        if latencia and latencia.get('total') is not None:
+            primeiro = latencia.get('primeiro_token')
+            primeiro_desc = f"{primeiro:.2f}s" if primeiro is not None else "sem streaming"
+            st.caption(f"⚡ Primeiro token: {primeiro_desc} | Resposta completa: {latencia['total']:.2f}s")
+        
         # Controles para a resposta
         col_controls1, col_controls2, col_controls3 = st.columns([2, 1, 1])
         
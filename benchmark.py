@@ -0,0 +1,404 @@
+"""Micro-benchmarks offline das rotinas de CPU do Responde AI.
+
+Gera um corpus sintético de artigos no estilo da central (Protheus) em vários
+tamanhos, mede as funções quentes isoladamente (sem rede nem IA), grava um
+relatório JSON e compara com uma baseline guardada no repositório.
+
+Uso:
+    python benchmark.py                          # tamanhos padrão, compara com a baseline
+    python benchmark.py --tamanhos 10,1000       # execução rápida
+    python benchmark.py --somente clean_text,bm25_pontuar
+    python benchmark.py --salvar-baseline        # grava o resultado como nova baseline
+    python benchmark.py --tolerancia 0.15        # falha (código 1) se algo ficar 15% mais lento
+
+Na mesma máquina da baseline (mesmo host) os tempos brutos são comparados; em outra,
+eles são normalizados por uma calibração (laço Python fixo, mediana de rodadas
+espalhadas pela execução). --normalizar força a calibração e --sem-normalizar a
+desliga. A comparação usa o melhor tempo de cada benchmark, e a tolerância de cada
+um cresce com o ruído medido nele (mediana vs. melhor). Um suspeito de regressão é
+medido de novo antes de falhar. Funções que processam um item por vez usam uma
+amostra de até --amostra itens do corpus; o índice BM25 usa o corpus inteiro.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+import types
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import extracao
+import nucleo
+
+BASELINE_CAMINHO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+RELATORIO_CAMINHO = os.path.join(".cache", "benchmark.json")
+TAMANHOS_PADRAO = "10,1000,100000"
+
+# ---------------------------
+# CORPUS SINTÉTICO
+# ---------------------------
+MODULOS = ["SIGAEST", "SIGAFAT", "SIGAFIN", "SIGACOM", "SIGAFIS", "SIGAGPE", "SIGACTB", "SIGATMS", "SIGAWMS"]
+PARAMETROS = ["MV_ESTNEG", "MV_CUSMED", "MV_ULMES", "MV_TPNRNFS", "MV_SPEDURL", "MV_NFEDISD", "MV_PAR01",
+              "MV_FATDIST", "MV_RATEIO", "MV_CTBFLAG", "MV_DATAFIN", "MV_GERAIMP"]
+TABELAS = ["SB1", "SB2", "SA1", "SA2", "SC5", "SC6", "SD1", "SD2", "SD3", "SF1", "SF2", "SE1", "SE2", "CT2"]
+ROTINAS = ["MATA010", "MATA410", "MATA460", "MATA103", "MATA261", "FINA050", "FINA070", "CTBA102", "SPEDNFE"]
+HELPS = ["A410TES", "NOFUNC", "REGNOIS", "MA330SEM", "TSSERRO", "A103NFORI", "CTBDATA", "FA050NAT"]
+VOCABULARIO = ("produto pedido venda compra estoque saldo custo médio fechamento nota fiscal "
+               "entrada saída documento série emissão transmissão sefaz rejeição contingência "
+               "lançamento contábil centro custo natureza título baixa financeiro cliente fornecedor "
+               "usuário acesso permissão rotina campo tabela índice parâmetro configuração módulo "
+               "ambiente servidor banco dados atualização pacote patch versão release dicionário "
+               "validação gatilho consulta relatório cálculo imposto ICMS IPI PIS COFINS TES CFOP "
+               "quantidade valor data período filial empresa integração TSS NF-e DANFE SPED EFD").split()
+
+def _sentenca(r: random.Random) -> str:
+    palavras = r.choices(VOCABULARIO, k=r.randint(6, 18))
+    if r.random() < 0.35:
+        palavras.insert(r.randrange(len(palavras)), r.choice(PARAMETROS + TABELAS + ROTINAS))
+    return " ".join(palavras).capitalize() + "."
+
+def _titulo(r: random.Random) -> str:
+    modulo = r.choice(MODULOS)
+    assunto = r.choice([
+        f"Como configurar o parâmetro {r.choice(PARAMETROS)}",
+        f"Erro {r.choice(HELPS)} na rotina {r.choice(ROTINAS)}",
+        f"Como ajustar o campo {r.choice(TABELAS)}_{r.choice(['COD', 'TES', 'QUANT', 'VALOR'])}",
+        f"Mensagem {r.choice(HELPS)} ao {r.choice(['incluir', 'alterar', 'excluir', 'transmitir'])} documento",
+    ])
+    return f"Cross Segmento - TOTVS Backoffice (Linha Protheus) - {modulo} - {assunto}"
+
+def _slug(titulo: str) -> str:
+    return re.sub(r"[^\w]+", "-", titulo).strip("-")
+
+def gerar_artigos(n: int, semente: int = 42, base: str = "https://centraldeatendimento.totvs.com") -> List[dict]:
+    """Artigos sintéticos: url, título, texto bruto (com lixo de rodapé) e parágrafos"""
+    r = random.Random(semente)
+    artigos = []
+    for i in range(n):
+        titulo = _titulo(r)
+        paragrafos = [" ".join(_sentenca(r) for _ in range(r.randint(2, 6))) for _ in range(r.randint(3, 10))]
+        rodape = []
+        if r.random() < 0.3:
+            rodape.append(f"Anexo(s): {r.choice(ROTINAS)}.pdf")
+        if r.random() < 0.5:
+            rodape.append("Artigo criado em 10/02/2021 Artigo atualizado em 05/06/2024")
+        if r.random() < 0.2:
+            rodape.append("Veja também https://tdn.totvs.com/display/public/PROT e fale com suporte@totvs.com.br")
+        if r.random() < 0.3:
+            rodape.append("Compartilhar: Facebook Twitter LinkedIn © 2024 TOTVS. Todos os direitos reservados")
+        artigos.append({
+            "url": f"{base}/hc/pt-br/articles/{360000000000 + i}-{_slug(titulo)}",
+            "titulo": titulo,
+            "paragrafos": paragrafos,
+            "texto_bruto": "\n\t".join([titulo] + paragrafos + rodape),
+        })
+    return artigos
+
+def pagina_html(artigo: dict) -> bytes:
+    """Página de artigo no formato do Help Center (com cabeçalho, menus, scripts e comentários)"""
+    corpo = "".join(
+        f"<p>{p.replace(' custo ', ' <strong>custo</strong> ', 1)}</p>\n" if i % 3 else
+        f"<h2>{p[:40]}</h2><ul><li>{p}</li></ul>\n"
+        for i, p in enumerate(artigo["paragrafos"])
+    )
+    return (
+        "<!DOCTYPE html><html lang='pt-br'><head><meta charset='utf-8'>"
+        f"<title>{artigo['titulo']} – Central de Atendimento</title>"
+        "<script>window.HelpCenter = {user: {}};</script><style>.x{color:red}</style></head><body>"
+        "<header class='header'><nav class='user-nav'><a href='/hc/pt-br'>Central</a><a href='/hc/pt-br/requests'>"
+        "Minhas solicitações</a></nav></header>"
+        "<main role='main'><div class='container'><nav class='sub-nav'><ol class='breadcrumbs'>"
+        "<li><a href='/hc/pt-br'>TOTVS</a></li><li>Protheus</li></ol></nav>"
+        "<article class='article'><header class='article-header'><h1 class='article-title'>"
+        f"{artigo['titulo']}</h1></header><div class='article-info'><span>Atualizado</span></div>"
+        f"<div class='article-body'>{corpo}</div>"
+        "<div class='article-votes'>Esse artigo foi útil? Sim Não</div>"
+        "<section class='comments'><h2>Comentários</h2><p>Nenhum comentário</p></section>"
+        "</article></div></main><footer class='footer'>© 2025 TOTVS</footer>"
+        "<script>var analytics = '<p>não</p>';</script></body></html>"
+    ).encode("utf-8")
+
+def gerar_consultas(n: int, semente: int = 7) -> List[str]:
+    r = random.Random(semente)
+    modelos = [
+        "Como configurar o parâmetro {p} no {m}?",
+        "Erro {h} ao executar a rotina {ro}, o que fazer?",
+        "Qual o significado da mensagem {h} na {ro}",
+        "como ajustar saldo de estoque negativo na tabela {t}",
+        "Rejeição na transmissão da NF-e pelo TSS no {m}",
+        "Segue o vídeo com o erro {h} na {ro}",
+        "Em anexo o print da tela do {m} com o parâmetro {p}",
+    ]
+    return [
+        r.choice(modelos).format(p=r.choice(PARAMETROS), m=r.choice(MODULOS), h=r.choice(HELPS),
+                                 ro=r.choice(ROTINAS), t=r.choice(TABELAS))
+        for _ in range(n)
+    ]
+
+def resposta_reclassificacao(candidatos: List[tuple], r: random.Random) -> str:
+    """Resposta típica da IA na reclassificação: URLs fora de ordem, com ruído"""
+    urls = [url for _, url, _ in candidatos]
+    r.shuffle(urls)
+    linhas = ["Segue a lista ordenada:", ""] + [f"{url}" if i % 2 else f"  {url}  " for i, url in enumerate(urls)]
+    return "\n".join(linhas + ["", "Espero ter ajudado."])
+
+# ---------------------------
+# MEDIÇÃO
+# ---------------------------
+# Ruído máximo (fração) somado à tolerância de um benchmark
+RUIDO_MAXIMO = 1.0
+
+def calibrar(repeticoes: int = 5) -> List[float]:
+    """Tempos (s) de uma carga Python fixa, usados para normalizar entre máquinas
+
+    Retorna todas as rodadas: executar_benchmarks espalha as chamadas pela execução e usa a
+    mediana, que acompanha a carga média da máquina em vez de um instante de folga.
+    """
+    texto = "parâmetro MV_ESTNEG estoque negativo " * 200
+    padrao = re.compile(r"\w+")
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        total = 0
+        for i in range(200000):
+            total += i * i % 7
+        contagem = {}
+        for palavra in padrao.findall(texto):
+            contagem[palavra] = contagem.get(palavra, 0) + 1
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+def ruido(resultado: dict) -> float:
+    """Dispersão relativa das repetições de um benchmark: (mediana - melhor) / melhor"""
+    if not resultado.get("min_us"):
+        return 0.0
+    return min((resultado["mediana_us"] - resultado["min_us"]) / resultado["min_us"], RUIDO_MAXIMO)
+
+def medir(executar: Callable[[], None], itens: int, repeticoes: int, tempo_max: float) -> dict:
+    """Roda `executar` (que processa `itens` itens) até `repeticoes` vezes, ou até estourar tempo_max"""
+    executar()  # Aquecimento: caches de regex, imports tardios e alocações da primeira chamada
+    tempos = []
+    inicio_total = time.perf_counter()
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        executar()
+        tempos.append(time.perf_counter() - inicio)
+        if time.perf_counter() - inicio_total >= tempo_max:
+            break
+    por_item = [t / itens for t in tempos]
+    mediana = statistics.median(por_item)
+    return {
+        "itens": itens,
+        "repeticoes": len(tempos),
+        "mediana_us": mediana * 1e6,
+        "min_us": min(por_item) * 1e6,
+        "max_us": max(por_item) * 1e6,
+        "ops_s": 1 / mediana if mediana else None,
+    }
+
+# ---------------------------
+# BENCHMARKS
+# ---------------------------
+def benchmarks_de_consulta(consultas: List[str]) -> Dict[str, Callable]:
+    """Funções que recebem só a pergunta (não dependem do tamanho do corpus)"""
+    return {
+        "clean_query": lambda: [nucleo.clean_query(c) for c in consultas],
+        "tem_video_ou_anexo": lambda: [nucleo.tem_video_ou_anexo(c) for c in consultas],
+    }
+
+def benchmarks_de_corpus(artigos: List[dict], consultas: List[str], amostra: int,
+                         max_paginas_bs4: int) -> Dict[str, tuple]:
+    """Funções sobre artigos: nome -> (executar, itens processados por execução)"""
+    r = random.Random(1)
+    selecionados = artigos[:amostra]
+    textos = [a["texto_bruto"] for a in selecionados]
+    paginas = [types.SimpleNamespace(content=pagina_html(a)) for a in selecionados]
+    paginas_bs4 = paginas[:max_paginas_bs4]
+    limpos = [extracao.clean_text(a["texto_bruto"]) for a in artigos]
+    urls = [a["url"] for a in artigos]
+
+    # Índice do tamanho do corpus, pronto para as consultas
+    indice = nucleo.IndiceBM25(max_docs=len(artigos))
+    for url, texto in zip(urls, limpos):
+        indice.adicionar(url, texto)
+
+    def indexar():
+        novo = nucleo.IndiceBM25(max_docs=len(artigos))
+        for url, texto in zip(urls, limpos):
+            novo.adicionar(url, texto)
+
+    # Como no app: 5 candidatos por pergunta, vindos da busca
+    pares = list(zip(urls, limpos))
+    candidatos = [[(0.5, url, texto) for url, texto in r.sample(pares, min(5, len(pares)))] for _ in consultas]
+    respostas_ia = [resposta_reclassificacao(c, r) for c in candidatos]
+    # Pontuar o índice inteiro custa O(corpus) por pergunta; poucas perguntas bastam
+    consultas_indice = consultas[:50 if len(artigos) <= 10000 else 5]
+    links_saiba_mais = [[url for _, url, _ in c] for c in candidatos]
+
+    return {
+        "clean_text": (lambda: [extracao.clean_text(t) for t in textos], len(textos)),
+        "extrair_texto_html": (lambda: [extracao.extrair_texto_html(p) for p in paginas], len(paginas)),
+        "extrair_texto_html_bs4": (lambda: [extracao._extrair_texto_html_bs4(p.content) for p in paginas_bs4],
+                                   len(paginas_bs4)),
+        "bm25_indexar": (indexar, len(artigos)),
+        "bm25_pontuar": (lambda: [indice.pontuar(c) for c in consultas_indice], len(consultas_indice)),
+        "bm25_pontuar_candidatos": (lambda: [indice.pontuar(c, [u for _, u, _ in cand])
+                                             for c, cand in zip(consultas, candidatos)], len(consultas)),
+        "processar_resposta_reclassificacao": (lambda: [nucleo.processar_resposta_reclassificacao(resp, cand)
+                                                        for resp, cand in zip(respostas_ia, candidatos)],
+                                               len(consultas)),
+        "formatar_links_saiba_mais": (lambda: [nucleo.formatar_links_saiba_mais(links) for links in links_saiba_mais],
+                                      len(consultas)),
+    }
+
+def executar_benchmarks(tamanhos: List[int], somente: set = None, amostra: int = 2000, consultas_n: int = 500,
+                        repeticoes: int = 5, tempo_max: float = 10.0, max_paginas_bs4: int = 200) -> dict:
+    consultas = gerar_consultas(consultas_n)
+    calibracao = calibrar()
+    resultados = {}
+
+    def registrar(nome, tamanho, executar, itens):
+        if somente and nome not in somente:
+            return
+        chave = nome if tamanho is None else f"{nome}@{tamanho}"
+        print(f"  {chave}...", end="", flush=True, file=sys.stderr)
+        calibracao.extend(calibrar(2))  # Intercalada com as medições: acompanha a carga da máquina
+        resultados[chave] = {"funcao": nome, "tamanho": tamanho, **medir(executar, itens, repeticoes, tempo_max)}
+        print(f" {resultados[chave]['mediana_us']:.1f} µs/item", file=sys.stderr)
+
+    for nome, executar in benchmarks_de_consulta(consultas).items():
+        registrar(nome, None, executar, len(consultas))
+
+    for tamanho in tamanhos:
+        print(f"Corpus com {tamanho} artigos", file=sys.stderr)
+        artigos = gerar_artigos(tamanho)
+        for nome, (executar, itens) in benchmarks_de_corpus(artigos, consultas, amostra,
+                                                            max_paginas_bs4).items():
+            if itens:
+                registrar(nome, tamanho, executar, itens)
+
+    calibracao.extend(calibrar())
+    return {
+        "versao": 2,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "host": platform.node(),
+        "calibracao_s": statistics.median(calibracao),
+        "parametros": {"tamanhos": tamanhos, "amostra": amostra, "consultas": consultas_n, "repeticoes": repeticoes},
+        "resultados": resultados,
+    }
+
+# ---------------------------
+# COMPARAÇÃO COM A BASELINE
+# ---------------------------
+def mesma_maquina(relatorio: dict, baseline: dict) -> bool:
+    """Baseline gravada neste host e com o mesmo Python: os tempos brutos são comparáveis"""
+    return (relatorio.get("host") is not None and relatorio.get("host") == baseline.get("host")
+            and relatorio["python"] == baseline["python"])
+
+def comparar(relatorio: dict, baseline: dict, tolerancia: float, normalizar: bool = True) -> List[dict]:
+    """Razão melhor tempo atual / da baseline por benchmark (>1 = mais lento), descontada a calibração
+
+    O limite de cada benchmark é a tolerância mais o ruído medido nele, aqui e na baseline.
+    """
+    fator = relatorio["calibracao_s"] / baseline["calibracao_s"] if normalizar else 1.0
+    linhas = []
+    for chave, atual in relatorio["resultados"].items():
+        anterior = baseline["resultados"].get(chave)
+        if anterior is None:
+            linhas.append({"chave": chave, "atual_us": atual["min_us"], "baseline_us": None,
+                           "razao": None, "limite": None, "situacao": "novo"})
+            continue
+        razao = atual["min_us"] / anterior["min_us"] / fator
+        limite = tolerancia + ruido(atual) + ruido(anterior)
+        if razao > 1 + limite:
+            situacao = "REGRESSÃO"
+        elif razao < 1 / (1 + limite):
+            situacao = "melhora"
+        else:
+            situacao = "ok"
+        linhas.append({"chave": chave, "atual_us": atual["min_us"], "baseline_us": anterior["min_us"],
+                       "razao": razao, "limite": limite, "situacao": situacao})
+    return linhas
+
+def imprimir_comparacao(linhas: List[dict], fator: float):
+    if fator == 1.0:
+        print("\nComparação com a baseline (mesma máquina: tempos brutos, melhor de cada benchmark)")
+    else:
+        print(f"\nComparação com a baseline (calibração desta máquina: {fator:.2f}x a da baseline)")
+    print(f"{'benchmark':48s} {'atual µs':>12s} {'baseline µs':>12s} {'razão':>7s} {'limite':>7s}  situação")
+    for linha in linhas:
+        baseline = f"{linha['baseline_us']:12.2f}" if linha["baseline_us"] is not None else f"{'-':>12s}"
+        razao = f"{linha['razao']:7.2f}" if linha["razao"] is not None else f"{'-':>7s}"
+        limite = f"{1 + linha['limite']:7.2f}" if linha["limite"] is not None else f"{'-':>7s}"
+        print(f"{linha['chave']:48s} {linha['atual_us']:12.2f} {baseline} {razao} {limite}  {linha['situacao']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks offline das rotinas de CPU do Responde AI")
+    parser.add_argument("--tamanhos", default=TAMANHOS_PADRAO, help="Tamanhos do corpus, separados por vírgula")
+    parser.add_argument("--somente", default="", help="Roda apenas estes benchmarks (nomes separados por vírgula)")
+    parser.add_argument("--amostra", type=int, default=2000, help="Máximo de itens por execução nas funções por item")
+    parser.add_argument("--consultas", type=int, default=500, help="Quantidade de perguntas sintéticas")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--tempo-max", type=float, default=10.0, help="Tempo máximo (s) por benchmark")
+    parser.add_argument("--saida", default=RELATORIO_CAMINHO, help="Arquivo JSON do relatório")
+    parser.add_argument("--baseline", default=BASELINE_CAMINHO)
+    parser.add_argument("--salvar-baseline", action="store_true", help="Grava o resultado como a nova baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Variação aceita antes de acusar regressão")
+    normalizacao = parser.add_mutually_exclusive_group()
+    normalizacao.add_argument("--sem-normalizar", action="store_true", help="Compara tempos brutos, sem a calibração")
+    normalizacao.add_argument("--normalizar", action="store_true",
+                              help="Usa a calibração mesmo na máquina da baseline")
+    args = parser.parse_args()
+
+    tamanhos = [int(t) for t in args.tamanhos.split(",") if t.strip()]
+    somente = {s.strip() for s in args.somente.split(",") if s.strip()} or None
+    relatorio = executar_benchmarks(tamanhos, somente, amostra=args.amostra, consultas_n=args.consultas,
+                                    repeticoes=args.repeticoes, tempo_max=args.tempo_max)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"Relatório gravado em {args.saida}")
+
+    if args.salvar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"Baseline gravada em {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("Sem baseline para comparar (use --salvar-baseline).")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    normalizar = args.normalizar or not (args.sem_normalizar or mesma_maquina(relatorio, baseline))
+    linhas = comparar(relatorio, baseline, args.tolerancia, normalizar)
+
+    # Um pico de carga da máquina não reprova o código: os suspeitos são medidos de novo
+    suspeitos = [relatorio["resultados"][l["chave"]] for l in linhas if l["situacao"] == "REGRESSÃO"]
+    if suspeitos:
+        print(f"Medindo de novo {len(suspeitos)} suspeito(s) de regressão...", file=sys.stderr)
+        nova = executar_benchmarks(sorted({r["tamanho"] for r in suspeitos if r["tamanho"] is not None}),
+                                   {r["funcao"] for r in suspeitos}, amostra=args.amostra,
+                                   consultas_n=args.consultas, repeticoes=args.repeticoes, tempo_max=args.tempo_max)
+        for chave, resultado in nova["resultados"].items():
+            anterior = relatorio["resultados"].get(chave)
+            if anterior is not None and resultado["min_us"] < anterior["min_us"]:
+                relatorio["resultados"][chave] = resultado
+        linhas = comparar(relatorio, baseline, args.tolerancia, normalizar)
+
+    imprimir_comparacao(linhas, relatorio["calibracao_s"] / baseline["calibracao_s"] if normalizar else 1.0)
+    if any(linha["situacao"] == "REGRESSÃO" for linha in linhas):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Espelho local da Central de Atendimento TOTVS (Zendesk Help Center).
+
+Pagina a API pública de artigos e guarda tudo em um SQLite local, para que busca e
+extração possam responder sem ir à central. Depois da primeira carga, só os artigos
+com `updated_at` alterado são regravados.
+
+Uso:
+    python espelho.py                      # sincronização incremental única
+    python espelho.py --completo           # recarrega tudo e remove artigos apagados
+    python espelho.py --intervalo 3600     # mantém sincronizando a cada hora
+    python espelho.py --base-url http://127.0.0.1:8000   # contra um servidor local de testes
+"""
+import argparse
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+BASE_CENTRAL = os.getenv("RESPONDE_AI_BASE_CENTRAL", "https://centraldeatendimento.totvs.com").rstrip("/")
+LOCALE_PADRAO = "pt-br"
+
+# Caminho do SQLite do espelho; "0"/"off" desativa o uso pelo app
+ESPELHO_CAMINHO = os.getenv("RESPONDE_AI_ESPELHO", os.path.join(".cache", "espelho_central.sqlite3"))
+
+
+def _html_para_texto(corpo: str) -> str:
+    """Conversão barata de HTML para texto, usada apenas na indexação de busca"""
+    return " ".join(html.unescape(re.sub(r"<[^>]+>", " ", corpo or "")).split())
+
+
+def id_do_artigo(url: str) -> Optional[int]:
+    match = re.search(r"/articles/(\d+)", url or "")
+    return int(match.group(1)) if match else None
+
+
+class EspelhoCentral:
+    """Armazena os artigos da central em SQLite (modo WAL), com índice FTS5 quando disponível"""
+
+    def __init__(self, caminho: str = ESPELHO_CAMINHO):
+        self.caminho = caminho
+        self._local = threading.local()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        conn = self._conexao()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS artigos (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                titulo TEXT NOT NULL,
+                corpo TEXT NOT NULL,
+                locale TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                sincronizado_em REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS artigos_fts "
+                "USING fts5(titulo, texto, tokenize='unicode61 remove_diacritics 2')"
+            )
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite sem FTS5: busca cai para LIKE
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    def salvar_artigos(self, artigos: List[dict], locale: str = LOCALE_PADRAO) -> int:
+        """Insere ou atualiza artigos no formato da API do Zendesk"""
+        conn = self._conexao()
+        agora = time.time()
+        salvos = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for artigo in artigos:
+                if artigo.get("id") is None or artigo.get("draft"):
+                    continue
+                titulo = artigo.get("title") or ""
+                corpo = artigo.get("body") or ""
+                conn.execute(
+                    "INSERT OR REPLACE INTO artigos (id, url, titulo, corpo, locale, updated_at, sincronizado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (artigo["id"], artigo.get("html_url") or "", titulo, corpo,
+                     artigo.get("locale") or locale, artigo.get("updated_at") or "", agora)
+                )
+                if self.fts:
+                    conn.execute("DELETE FROM artigos_fts WHERE rowid = ?", (artigo["id"],))
+                    conn.execute("INSERT INTO artigos_fts (rowid, titulo, texto) VALUES (?, ?, ?)",
+                                 (artigo["id"], titulo, _html_para_texto(corpo)))
+                salvos += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return salvos
+
+    def remover_ausentes(self, ids_presentes) -> int:
+        """Remove artigos que não existem mais na central (usado na sincronização completa)"""
+        conn = self._conexao()
+        ids_locais = {row[0] for row in conn.execute("SELECT id FROM artigos")}
+        ausentes = [(i,) for i in ids_locais - set(ids_presentes)]
+        if ausentes:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM artigos WHERE id = ?", ausentes)
+            if self.fts:
+                conn.executemany("DELETE FROM artigos_fts WHERE rowid = ?", ausentes)
+            conn.execute("COMMIT")
+        return len(ausentes)
+
+    def versoes(self) -> Dict[int, str]:
+        """Mapa id -> updated_at dos artigos já espelhados"""
+        return dict(self._conexao().execute("SELECT id, updated_at FROM artigos"))
+
+    def marca_d_agua(self) -> Optional[str]:
+        """Maior updated_at espelhado (timestamps ISO 8601 em UTC comparam como texto)"""
+        row = self._conexao().execute("SELECT MAX(updated_at) FROM artigos").fetchone()
+        return row[0] if row and row[0] else None
+
+    def artigo(self, article_id: int) -> Optional[dict]:
+        row = self._conexao().execute(
+            "SELECT id, url, titulo, corpo, updated_at FROM artigos WHERE id = ?", (article_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "url": row[1], "titulo": row[2], "corpo": row[3], "updated_at": row[4]}
+
+    def artigo_por_url(self, url: str) -> Optional[dict]:
+        article_id = id_do_artigo(url)
+        return self.artigo(article_id) if article_id is not None else None
+
+    def buscar(self, consulta: str, limite: int = 5) -> List[str]:
+        """Busca local por relevância (FTS5/bm25 com peso maior para o título)"""
+        termos = [t for t in re.findall(r"\w+", consulta.lower()) if len(t) >= 2]
+        if not termos:
+            return []
+
+        conn = self._conexao()
+        if self.fts:
+            expressao = " OR ".join(f'"{t}"' for t in termos)
+            rows = conn.execute(
+                "SELECT a.url FROM artigos_fts f JOIN artigos a ON a.id = f.rowid "
+                "WHERE artigos_fts MATCH ? ORDER BY bm25(artigos_fts, 5.0, 1.0) LIMIT ?",
+                (expressao, limite)
+            ).fetchall()
+        else:
+            filtros = " OR ".join("(lower(titulo) LIKE ? OR lower(corpo) LIKE ?)" for _ in termos)
+            parametros = [p for t in termos for p in (f"%{t}%", f"%{t}%")]
+            rows = conn.execute(
+                f"SELECT url FROM artigos WHERE {filtros} ORDER BY updated_at DESC LIMIT ?",
+                parametros + [limite]
+            ).fetchall()
+        return [row[0] for row in rows if row[0]]
+
+    def iterar_textos(self):
+        """Gera (url, texto) de todos os artigos, com conversão barata de HTML (para indexação)"""
+        cursor = self._conexao().execute("SELECT url, titulo, corpo FROM artigos ORDER BY id")
+        for url, titulo, corpo in cursor:
+            if url:
+                yield url, f"{titulo}\n\n{_html_para_texto(corpo)}"
+
+    def total(self) -> int:
+        return self._conexao().execute("SELECT COUNT(*) FROM artigos").fetchone()[0]
+
+    def registrar_meta(self, chave: str, valor: str):
+        self._conexao().execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)", (chave, valor))
+
+    def meta(self, chave: str) -> Optional[str]:
+        row = self._conexao().execute("SELECT valor FROM meta WHERE chave = ?", (chave,)).fetchone()
+        return row[0] if row else None
+
+
+def _get_json(sessao, url, params=None, timeout=30, max_tentativas=5):
+    """GET com espera em caso de limite de requisições (429 / Retry-After)"""
+    for tentativa in range(max_tentativas):
+        response = sessao.get(url, params=params, headers={"accept": "application/json"}, timeout=timeout)
+        if response.status_code == 429 and tentativa < max_tentativas - 1:
+            espera = response.headers.get("Retry-After", "")
+            time.sleep(float(espera) if espera.isdigit() else 2 ** tentativa)
+            continue
+        response.raise_for_status()
+        return response.json()
+    return {}
+
+
+def sincronizar(espelho: EspelhoCentral, base_url: str = BASE_CENTRAL, locale: str = LOCALE_PADRAO,
+                sessao=None, por_pagina: int = 100, completo: bool = False, timeout: int = 30) -> dict:
+    """Sincroniza o espelho com a API de artigos do Help Center
+
+    As páginas vêm ordenadas por updated_at decrescente; na sincronização incremental a
+    paginação para assim que uma página alcança a marca d'água do espelho, e só os artigos
+    com updated_at diferente do armazenado são regravados.
+    """
+    sessao = sessao or requests.Session()
+    inicio = time.time()
+    marca = None if completo else espelho.marca_d_agua()
+    versoes = espelho.versoes()
+    vistos = set()
+    stats = {"paginas": 0, "recebidos": 0, "atualizados": 0, "removidos": 0}
+
+    url = f"{base_url.rstrip('/')}/api/v2/help_center/{locale}/articles.json"
+    params = {"per_page": por_pagina, "sort_by": "updated_at", "sort_order": "desc"}
+    while url:
+        data = _get_json(sessao, url, params=params, timeout=timeout)
+        params = None  # next_page já traz os parâmetros
+        artigos = data.get("articles", [])
+        stats["paginas"] += 1
+        stats["recebidos"] += len(artigos)
+
+        alterados = [a for a in artigos if versoes.get(a.get("id")) != a.get("updated_at")]
+        stats["atualizados"] += espelho.salvar_artigos(alterados, locale)
+        vistos.update(a.get("id") for a in artigos)
+
+        # Daqui em diante tudo é mais antigo que a marca d'água: nada mudou
+        if marca and artigos and min(a.get("updated_at") or "" for a in artigos) <= marca:
+            break
+        url = data.get("next_page")
+
+    if completo:
+        stats["removidos"] = espelho.remover_ausentes(vistos)
+
+    stats["duracao"] = round(time.time() - inicio, 2)
+    espelho.registrar_meta("ultima_sincronizacao", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    return stats
+
+
+class SincronizadorPeriodico(threading.Thread):
+    """Thread em segundo plano que sincroniza o espelho na partida e depois a cada `intervalo` segundos"""
+
+    def __init__(self, espelho: EspelhoCentral, intervalo: float = 3600, **kwargs_sincronizacao):
+        super().__init__(name="sincronizador-espelho", daemon=True)
+        self.espelho = espelho
+        self.intervalo = intervalo
+        self.kwargs_sincronizacao = kwargs_sincronizacao
+        self.ultimo_resultado = None
+        self.ultimo_erro = None
+        self.executando = False
+        self._parar = threading.Event()
+
+    def run(self):
+        while True:
+            self.executando = True
+            try:
+                self.ultimo_resultado = sincronizar(self.espelho, **self.kwargs_sincronizacao)
+                self.ultimo_erro = None
+            except Exception as e:
+                self.ultimo_erro = str(e)
+            finally:
+                self.executando = False
+
+            if self.intervalo <= 0 or self._parar.wait(self.intervalo):
+                break
+
+    def parar(self):
+        self._parar.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza o espelho local da Central de Atendimento TOTVS")
+    parser.add_argument("--db", default=ESPELHO_CAMINHO, help="Arquivo SQLite do espelho")
+    parser.add_argument("--base-url", default=BASE_CENTRAL, help="URL base do Help Center")
+    parser.add_argument("--locale", default=LOCALE_PADRAO)
+    parser.add_argument("--por-pagina", type=int, default=100)
+    parser.add_argument("--completo", action="store_true", help="Ignora a marca d'água e remove artigos apagados")
+    parser.add_argument("--intervalo", type=float, default=0, help="Repete a cada N segundos (0 = uma vez)")
+    args = parser.parse_args()
+
+    espelho = EspelhoCentral(args.db)
+    while True:
+        stats = sincronizar(espelho, base_url=args.base_url, locale=args.locale,
+                            por_pagina=args.por_pagina, completo=args.completo)
+        print(f"Sincronizado: {stats} | Total no espelho: {espelho.total()}")
+        if args.intervalo <= 0:
+            break
+        time.sleep(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
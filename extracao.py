@@ -0,0 +1,308 @@
+"""Extração de texto das páginas e artigos da central.
+
+Usa lxml quando disponível: um único parse em C e uma só caminhada pela árvore,
+pulando (sem remover) os elementos descartados. O caminho com BeautifulSoup
+(`html.parser`) continua como referência e fallback; os dois produzem o mesmo texto.
+
+A exceção é o aninhamento que o libxml2 conserta e o html.parser mantém como veio: um
+bloco dentro de <p> (o <p> é fechado antes do bloco), tags fechadas fora de ordem ou
+fechamentos sem abertura. A árvore muda e, com ela, o que os seletores encontram e
+removem, e o texto antes e depois de um </p> órfão pode sair colado. O libxml2 avisa
+esses consertos (ERR_TAG_NAME_MISMATCH); nessas páginas o texto vem do BeautifulSoup.
+Resta uma divergência que ele não avisa: uma tag inline nunca fechada seguida de um
+bloco (<b>texto<p>...) é fechada ali pelo libxml2 e fica aberta até o fim no html.parser.
+tests/test_extracao.py confere a paridade num corpus de páginas da central.
+"""
+import os
+import re
+import threading
+from typing import List
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml é opcional: sem ele fica o html.parser
+    lxml = None
+
+# URL base da central (RESPONDE_AI_BASE_CENTRAL aponta para um simulador local, ex.: simulador.py)
+BASE_CENTRAL = os.getenv("RESPONDE_AI_BASE_CENTRAL", "https://centraldeatendimento.totvs.com").rstrip("/")
+
+# Limite de segurança do texto extraído; o recorte relevante é feito por trechos (passagens)
+MAX_CARACTERES_ARTIGO = 60000
+
+# Elementos removidos da página inteira antes de escolher o conteúdo
+TAGS_DESCARTADAS = ('script', 'style', 'nav', 'footer', 'header', 'aside', 'form', 'iframe')
+
+# Elementos cujo texto o BeautifulSoup não inclui no get_text()
+TAGS_SEM_TEXTO = ('script', 'style', 'template', 'rt', 'rp')
+
+# Contêineres do artigo, em ordem de preferência
+SELETORES_CONTEUDO = [
+    "article",
+    ".article-body",
+    ".article-content",
+    "main",
+    ".content",
+    ".post-content",
+    "[role='main']",
+    ".help-center-content"
+]
+
+# Partes do contêiner que não são conteúdo
+SELETORES_LIMPEZA = [
+    '.article-meta', '.article-info', '.article-votes',
+    '.comments', '.share-buttons', '.breadcrumb',
+    '.related-articles', '.article-attachments'
+]
+
+SELETORES_LINKS_BUSCA = [
+    "a[href*='/articles/']",
+    ".search-result a",
+    ".article-list a",
+    ".article-link"
+]
+
+# ---------------------------
+# LIMPEZA DE TEXTO
+# ---------------------------
+# Cada um destes marcadores corta o texto dali até o fim; basta achar o primeiro.
+# O literal (minúsculo) de cada padrão permite pular a regex quando ele não aparece.
+_CORTES = [
+    ("anexo(s):", re.compile(r'Anexo\(s\):', re.IGNORECASE)),
+    ("compartilhar:", re.compile(r'Compartilhar:', re.IGNORECASE)),
+    ("comentários", re.compile(r'Comentários', re.IGNORECASE)),
+]
+_RE_RODAPE_ARTIGO = re.compile(r'Artigo criado.*Artigo atualizado.*', re.IGNORECASE | re.DOTALL)
+_RE_COPYRIGHT = re.compile(r'©\s*\d{4}.*TOTVS', re.IGNORECASE | re.DOTALL)
+_RE_URL = re.compile(r'https?://\S+', re.IGNORECASE)
+_RE_EMAIL = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b', re.IGNORECASE)
+_RE_TAG = re.compile(r'<[^>]*>')
+_RE_BODY = re.compile(r'<body[\s>/]', re.IGNORECASE)
+
+# Letras que o IGNORECASE do re equipara a "i"/"s" mas que o str.lower() não converte
+_LETRAS_CASO_ESPECIAL = ("ı", "İ", "ſ")
+
+def clean_text(text: str) -> str:
+    """Limpa texto extraído com algoritmos melhorados
+
+    Padrões pré-compilados, e cada um só roda quando seu literal aparece no texto.
+    """
+    if not text or not isinstance(text, str):
+        return ""
+
+    # Remover caracteres nulos e problemas de encoding
+    text = text.replace("\0", " ").replace("\r", " ").replace("\t", " ")
+
+    # Filtro barato: busca o literal no texto minúsculo antes de rodar a regex
+    minusculo = None if any(letra in text for letra in _LETRAS_CASO_ESPECIAL) else text.lower()
+
+    def pode_conter(literal):
+        return minusculo is None or literal in minusculo
+
+    # Remover padrões comuns de lixo (anexos, compartilhamento, comentários e rodapés)
+    inicio_corte = len(text)
+    for literal, padrao in _CORTES:
+        if pode_conter(literal):
+            corte = padrao.search(text, 0, inicio_corte)
+            if corte:
+                inicio_corte = corte.start()
+    text = text[:inicio_corte]
+    if pode_conter("artigo criado"):
+        text = _RE_RODAPE_ARTIGO.sub('', text)
+    if '©' in text:
+        text = _RE_COPYRIGHT.sub('', text)
+    if '://' in text:
+        text = _RE_URL.sub('', text)
+    if '@' in text:
+        text = _RE_EMAIL.sub('', text)
+
+    # Remover HTML tags
+    if '<' in text:
+        text = _RE_TAG.sub(' ', text)
+
+    # Normalizar espaços
+    return " ".join(text.split())
+
+# ---------------------------
+# EXTRAÇÃO COM LXML
+# ---------------------------
+def _xpath_seletor(seletor: str) -> str:
+    """Traduz os seletores CSS simples usados aqui (tag, .classe, [attr='v'], 'a b') para XPath"""
+    passos = []
+    for parte in seletor.split():
+        if parte.startswith("."):
+            passos.append(f"*[contains(concat(' ', normalize-space(@class), ' '), ' {parte[1:]} ')]")
+        elif parte.startswith("["):
+            atributo, valor = parte[1:-1].split("=", 1)
+            if atributo.endswith("*"):
+                passos.append(f"*[contains(@{atributo[:-1]}, {valor})]")
+            else:
+                passos.append(f"*[@{atributo}={valor}]")
+        elif "[" in parte:
+            tag, filtro = parte.split("[", 1)
+            atributo, valor = filtro[:-1].split("=", 1)
+            if atributo.endswith("*"):
+                passos.append(f"{tag}[contains(@{atributo[:-1]}, {valor})]")
+            else:
+                passos.append(f"{tag}[@{atributo}={valor}]")
+        else:
+            passos.append(parte)
+    return "//" + "//".join(passos)
+
+def _fora_dos_descartados(xpath: str) -> str:
+    condicao = " or ".join(f"ancestor-or-self::{tag}" for tag in TAGS_DESCARTADAS)
+    return f"({xpath})[not({condicao})]"
+
+if lxml is not None:
+    _XPATH_CONTEUDO = [etree.XPath(_fora_dos_descartados(_xpath_seletor(s))) for s in SELETORES_CONTEUDO]
+    _XPATH_LINKS_BUSCA = [etree.XPath(_xpath_seletor(s)) for s in SELETORES_LINKS_BUSCA]
+    _CLASSES_LIMPEZA = frozenset(s[1:] for s in SELETORES_LIMPEZA)
+
+def _textos(elemento, tags_ignoradas, classes_ignoradas=frozenset()) -> List[str]:
+    """Textos do elemento em ordem, como o get_text(strip=True) do BeautifulSoup
+
+    Subárvores ignoradas são puladas, mas o texto que vem depois delas (tail) é mantido.
+    """
+    partes = []
+
+    def visitar(el):
+        if el.text and el.text.strip():
+            partes.append(el.text.strip())
+        for filho in el:
+            # Comentários e instruções de processamento não têm tag textual
+            if isinstance(filho.tag, str) and filho.tag not in tags_ignoradas and not (
+                    classes_ignoradas and classes_ignoradas.intersection((filho.get("class") or "").split())):
+                visitar(filho)
+            if filho.tail and filho.tail.strip():
+                partes.append(filho.tail.strip())
+
+    visitar(elemento)
+    return partes
+
+class AninhamentoReparado(ValueError):
+    """O libxml2 reorganizou tags mal aninhadas: a árvore difere da do html.parser"""
+
+_parsers = threading.local()
+
+def _parser_lxml():
+    # Um parser por thread: o error_log é do parser e guarda os avisos do último parse
+    parser = getattr(_parsers, "parser", None)
+    if parser is None:
+        parser = _parsers.parser = lxml.html.HTMLParser()
+    return parser
+
+def _conferir_aninhamento(parser):
+    if any(erro.type == etree.ErrorTypes.ERR_TAG_NAME_MISMATCH for erro in parser.error_log):
+        raise AninhamentoReparado("aninhamento reparado pelo libxml2")
+
+def _documento_lxml(conteudo: bytes):
+    # Mesma decodificação que o BeautifulSoup faria (BOM, meta charset, detecção, utf-8)
+    markup = UnicodeDammit(conteudo, is_html=True).unicode_markup
+    parser = _parser_lxml()
+    documento = lxml.html.document_fromstring(markup, parser=parser)
+    _conferir_aninhamento(parser)
+    return markup, documento
+
+def _extrair_texto_html_lxml(conteudo: bytes) -> str:
+    markup, documento = _documento_lxml(conteudo)
+
+    for xpath in _XPATH_CONTEUDO:
+        encontrados = xpath(documento)
+        if encontrados:
+            partes = _textos(encontrados[0], TAGS_DESCARTADAS + TAGS_SEM_TEXTO, _CLASSES_LIMPEZA)
+            break
+    else:
+        # Fallback estratégico (o lxml sempre cria <body>; o html.parser só se existir no HTML)
+        body = documento.find('body') if _RE_BODY.search(markup) else None
+        partes = _textos(body if body is not None else documento, TAGS_DESCARTADAS + TAGS_SEM_TEXTO)
+
+    return clean_text(" ".join(partes))[:MAX_CARACTERES_ARTIGO]
+
+# ---------------------------
+# EXTRAÇÃO COM BEAUTIFULSOUP (REFERÊNCIA / FALLBACK)
+# ---------------------------
+def _extrair_texto_html_bs4(conteudo: bytes) -> str:
+    soup = BeautifulSoup(conteudo, 'html.parser')
+
+    # Remover elementos desnecessários
+    for element in soup(list(TAGS_DESCARTADAS)):
+        element.decompose()
+
+    content = None
+    for selector in SELETORES_CONTEUDO:
+        content = soup.select_one(selector)
+        if content:
+            break
+
+    # Limpar elementos específicos
+    if content:
+        for selector in SELETORES_LIMPEZA:
+            for element in content.select(selector):
+                element.decompose()
+
+        text = content.get_text(separator=' ', strip=True)
+    else:
+        # Fallback estratégico
+        body = soup.find('body')
+        text = body.get_text(separator=' ', strip=True) if body else soup.get_text(separator=' ', strip=True)
+
+    return clean_text(text)[:MAX_CARACTERES_ARTIGO]
+
+def _links_busca_bs4(conteudo: bytes) -> List[str]:
+    soup = BeautifulSoup(conteudo, "html.parser")
+    return [a.get("href", "") for selector in SELETORES_LINKS_BUSCA for a in soup.select(selector)]
+
+# ---------------------------
+# API PÚBLICA
+# ---------------------------
+def extrair_texto_html(response) -> str:
+    """Extrai o texto principal de uma página de artigo da central"""
+    if lxml is not None:
+        try:
+            return _extrair_texto_html_lxml(response.content)
+        except (ValueError, etree.LxmlError):
+            pass  # Ex.: declaração XML com encoding ou aninhamento reparado; o html.parser aceita
+    return _extrair_texto_html_bs4(response.content)
+
+def texto_de_fragmento_html(corpo: str) -> str:
+    """Texto de um trecho HTML (corpo de artigo da API), como get_text(' ', strip=True)"""
+    if not corpo:
+        return ""
+    if lxml is not None:
+        try:
+            parser = _parser_lxml()
+            fragmento = lxml.html.fragment_fromstring(corpo, create_parent="div", parser=parser)
+            _conferir_aninhamento(parser)
+            return " ".join(_textos(fragmento, TAGS_SEM_TEXTO))
+        except (ValueError, etree.LxmlError):
+            pass
+    return BeautifulSoup(corpo, 'html.parser').get_text(separator=' ', strip=True)
+
+def extrair_links_busca(response) -> List[str]:
+    """Extrai os links de artigos de uma página de resultados da pesquisa interna"""
+    base = BASE_CENTRAL
+
+    hrefs = None
+    if lxml is not None:
+        try:
+            _, documento = _documento_lxml(response.content)
+            hrefs = [a.get("href", "") for xpath in _XPATH_LINKS_BUSCA for a in xpath(documento)]
+        except (ValueError, etree.LxmlError):
+            pass
+    if hrefs is None:
+        hrefs = _links_busca_bs4(response.content)
+
+    links = []
+    for href in hrefs:
+        if href:
+            if href.startswith("/"):
+                href = base + href
+            elif not href.startswith("http"):
+                href = base + "/" + href.lstrip("/")
+
+            if href.startswith(base) and "/articles/" in href and href not in links:
+                links.append(href)
+
+    return links
@@ -0,0 +1,241 @@
+"""Modo em lote do Responde AI: responde uma planilha de chamados sem a interface.
+
+Lê as perguntas de um CSV ou JSONL, processa várias ao mesmo tempo (concorrência
+limitada e limite de requisições por minuto por provedor) e grava cada resultado em
+um JSONL assim que fica pronto: resposta, fontes, scores dos artigos e o tempo de
+cada etapa. O próprio arquivo de saída é o checkpoint: rodar o mesmo comando de novo
+depois de uma queda (ou de um Ctrl+C) pula as perguntas já gravadas.
+
+Uso:
+    python lote.py chamados.csv respostas.jsonl --provedor openai --concorrencia 8
+    python lote.py chamados.jsonl respostas.jsonl --coluna descricao --id-coluna ticket
+    python lote.py chamados.csv respostas.jsonl --limite gemini=60 --limite central=300
+    python lote.py chamados.csv respostas.jsonl --refazer-falhas   # repete as não respondidas: erro da
+                                                                    # IA (ex.: limite de requisições) ou
+                                                                    # prazo esgotado sem texto (o registro
+                                                                    # mais recente de cada id vale)
+    python lote.py chamados.csv respostas.jsonl --config '{"reclassificar_ia": false}'
+
+Contra o simulador local (sem rede nem chave real), ver simulador.py:
+    python lote.py chamados.csv respostas.jsonl --provedor openai --api-key simulada \\
+        --base-central http://127.0.0.1:8765 --base-openai http://127.0.0.1:8765/v1 --sem-duckduckgo
+
+A chave vem de --api-key, da config ou de RESPONDE_AI_API_KEY. Provedores com limite
+(--limite ou RESPONDE_AI_RPM_<PROVEDOR>): gemini, openai, central, duckduckgo.
+"""
+import argparse
+import contextvars
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import List, Set, Tuple
+
+import pandas as pd
+
+MODELO_PADRAO = {"gemini": "gemini-2.5-flash", "openai": "gpt-4o-mini"}
+
+
+def ler_perguntas(caminho: str, coluna: str, id_coluna: str = None) -> List[Tuple[str, str]]:
+    """(id, pergunta) de um CSV ou JSONL; sem coluna de id, usa o número da linha (1, 2, ...)"""
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao in (".jsonl", ".ndjson"):
+        df = pd.read_json(caminho, lines=True, dtype=False)
+    elif extensao == ".json":
+        df = pd.read_json(caminho, dtype=False)
+    else:
+        df = pd.read_csv(caminho, dtype=str, keep_default_na=False)
+
+    if coluna not in df.columns:
+        raise ValueError(f"coluna '{coluna}' não encontrada (colunas: {', '.join(map(str, df.columns))})")
+    if id_coluna and id_coluna not in df.columns:
+        raise ValueError(f"coluna de id '{id_coluna}' não encontrada")
+
+    ids = df[id_coluna].astype(str) if id_coluna else pd.Series(range(1, len(df) + 1), index=df.index).astype(str)
+    perguntas = [(i, str(p).strip()) for i, p in zip(ids, df[coluna].fillna(""))]
+    repetidos = ids[ids.duplicated()].unique()
+    if len(repetidos):
+        raise ValueError(f"ids repetidos: {', '.join(repetidos[:5])}")
+    return [(i, p) for i, p in perguntas if p]
+
+
+def retomar(saida: str, refazer_falhas: bool = False) -> Set[str]:
+    """Ids já gravados na saída; corta a última linha se ela ficou pela metade numa queda"""
+    if not os.path.exists(saida):
+        return set()
+
+    concluidos = set()
+    valido = 0
+    with open(saida, "rb") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                break
+            if not linha.endswith(b"\n"):
+                break
+            valido += len(linha)
+            # O registro mais recente de cada id vale (uma falha refeita depois de um sucesso volta à fila)
+            if refazer_falhas and (registro.get("erro") or not registro.get("respondida")):
+                concluidos.discard(str(registro["id"]))
+            else:
+                concluidos.add(str(registro["id"]))
+
+    if valido < os.path.getsize(saida):
+        with open(saida, "r+b") as f:
+            f.truncate(valido)
+    return concluidos
+
+
+def _arredondar(valor):
+    if isinstance(valor, float):
+        return round(valor, 4)
+    if isinstance(valor, dict):
+        return {chave: _arredondar(v) for chave, v in valor.items()}
+    if isinstance(valor, list):
+        return [_arredondar(v) for v in valor]
+    return valor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde em lote as perguntas de um CSV/JSONL")
+    parser.add_argument("entrada", help="CSV ou JSONL com as perguntas")
+    parser.add_argument("saida", help="JSONL de resultados (e checkpoint para retomar)")
+    parser.add_argument("--coluna", default="pergunta", help="Coluna com o texto da pergunta")
+    parser.add_argument("--id-coluna", help="Coluna com o id do chamado (padrão: número da linha)")
+    parser.add_argument("--concorrencia", type=int, default=4, help="Perguntas processadas ao mesmo tempo")
+    parser.add_argument("--limite", action="append", default=[], metavar="PROVEDOR=RPM",
+                        help="Requisições por minuto de um provedor (repetível)")
+    parser.add_argument("--provedor", choices=sorted(MODELO_PADRAO), default="gemini")
+    parser.add_argument("--modelo", help="Modelo da IA (padrão depende do provedor)")
+    parser.add_argument("--api-key", default=os.getenv("RESPONDE_AI_API_KEY", ""))
+    parser.add_argument("--config", default="{}",
+                        help="JSON (ou arquivo .json) com campos de ConfiguracaoPergunta")
+    parser.add_argument("--base-central", help="URL base da central (ex.: o simulador local)")
+    parser.add_argument("--base-openai", help="URL base da API compatível com a OpenAI")
+    parser.add_argument("--sem-duckduckgo", action="store_true", help="Não busca no DuckDuckGo")
+    parser.add_argument("--refazer-falhas", action="store_true",
+                        help="Na retomada, repete as perguntas com erro ou sem resposta")
+    parser.add_argument("--reiniciar", action="store_true", help="Apaga a saída e começa do zero")
+    args = parser.parse_args()
+
+    # Lidos na importação do núcleo: precisam estar no ambiente antes dela
+    if args.base_central:
+        os.environ["RESPONDE_AI_BASE_CENTRAL"] = args.base_central
+    if args.base_openai:
+        os.environ["RESPONDE_AI_BASE_OPENAI"] = args.base_openai
+    if args.sem_duckduckgo:
+        os.environ["RESPONDE_AI_DUCKDUCKGO"] = "0"
+
+    from nucleo import ConfiguracaoPergunta, PROVEDORES_LIMITADOS, Progresso, definir_limite_taxa, processar_pergunta
+
+    class ProgressoLote(Progresso):
+        """Guarda só os avisos (vão para o registro da pergunta)"""
+
+        def __init__(self):
+            self.avisos = []
+
+        def aviso(self, mensagem: str, nivel: str = "warning"):
+            self.avisos.append({"mensagem": mensagem, "nivel": nivel})
+
+    for limite in args.limite:
+        provedor, _, rpm = limite.partition("=")
+        if provedor not in PROVEDORES_LIMITADOS:
+            parser.error(f"--limite: provedor '{provedor}' desconhecido ({', '.join(PROVEDORES_LIMITADOS)})")
+        try:
+            definir_limite_taxa(provedor, float(rpm))
+        except ValueError:
+            parser.error(f"--limite: esperado PROVEDOR=RPM, recebido '{limite}'")
+
+    try:
+        config_bruta = args.config
+        if os.path.isfile(config_bruta):
+            with open(config_bruta, encoding="utf-8") as f:
+                config_bruta = f.read()
+        config = ConfiguracaoPergunta.de_dict({
+            "use_gemini": args.provedor == "gemini",
+            "modelo": args.modelo or MODELO_PADRAO[args.provedor],
+            **json.loads(config_bruta),
+        })
+    except ValueError as e:
+        parser.error(f"--config inválida: {e}")
+    config.streaming = False  # Ninguém lê os pedaços: a chamada bloqueante basta
+    config.api_key = config.api_key or args.api_key
+    if not config.api_key:
+        parser.error("chave da IA ausente (--api-key, config ou RESPONDE_AI_API_KEY)")
+
+    try:
+        perguntas = ler_perguntas(args.entrada, args.coluna, args.id_coluna)
+    except (OSError, ValueError) as e:
+        parser.error(f"entrada: {e}")
+
+    if args.reiniciar and os.path.exists(args.saida):
+        os.remove(args.saida)
+    concluidos = retomar(args.saida, args.refazer_falhas)
+    pendentes = [(i, p) for i, p in perguntas if i not in concluidos]
+    print(f"{len(perguntas)} pergunta(s), {len(perguntas) - len(pendentes)} já respondida(s), "
+          f"{len(pendentes)} a processar", file=sys.stderr)
+    if not pendentes:
+        return
+
+    def responder(id_pergunta: str, pergunta: str) -> dict:
+        progresso = ProgressoLote()
+        inicio = time.perf_counter()
+        registro = {"id": id_pergunta, "pergunta": pergunta, "erro": None}
+        try:
+            resultado = processar_pergunta(pergunta, config, progresso).para_dict()
+            registro.update(resultado)
+        except Exception as e:
+            registro.update(resposta=None, respondida=False, erro=f"{type(e).__name__}: {e}")
+        registro["avisos"] = progresso.avisos
+        registro["duracao"] = time.perf_counter() - inicio
+        registro["processado_em"] = datetime.now().isoformat(timespec="seconds")
+        return _arredondar(registro)
+
+    inicio = time.perf_counter()
+    feitas = falhas = 0
+    fila = iter(pendentes)
+    executor = ThreadPoolExecutor(max_workers=args.concorrencia, thread_name_prefix="lote")
+    em_andamento = {}
+    try:
+        with open(args.saida, "a", encoding="utf-8") as saida:
+            while True:
+                # No máximo 2x a concorrência na fila: a entrada pode ter milhares de linhas
+                while len(em_andamento) < 2 * args.concorrencia:
+                    proxima = next(fila, None)
+                    if proxima is None:
+                        break
+                    futuro = executor.submit(contextvars.copy_context().run, responder, *proxima)
+                    em_andamento[futuro] = proxima[0]
+                if not em_andamento:
+                    break
+
+                concluidas, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in concluidas:
+                    del em_andamento[futuro]
+                    registro = futuro.result()
+                    # Uma linha por pergunta, no disco antes da próxima: é o que permite retomar
+                    saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                    saida.flush()
+                    os.fsync(saida.fileno())
+
+                    feitas += 1
+                    falhas += not registro["respondida"]
+                    situacao = registro["erro"] or ("ok" if registro["respondida"] else "sem resposta")
+                    print(f"[{feitas}/{len(pendentes)}] {registro['id']} {registro['duracao']:.1f}s {situacao}",
+                          file=sys.stderr)
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        print(f"\nInterrompido após {feitas} pergunta(s); rode o mesmo comando para continuar.", file=sys.stderr)
+        sys.exit(130)
+    executor.shutdown()
+
+    decorrido = time.perf_counter() - inicio
+    print(f"Concluído: {feitas} pergunta(s) em {decorrido:.1f}s ({feitas / decorrido * 60:.1f}/min), "
+          f"{falhas} sem resposta", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Métricas de latência por etapa, no formato de exposição do Prometheus.
+
+Histogramas com rótulos (etapa, resultado, ...) acumulados por processo, mais o
+detalhamento da consulta em andamento (guardado em uma ContextVar, então as
+threads que herdam o contexto também registram nele). O texto de /metrics é
+gerado aqui e servido por um http.server em segundo plano, sem dependências.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Limites (segundos) dos buckets: de leituras em cache até gerações longas da IA
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_numero(valor: float) -> str:
+    return "+Inf" if valor == float("inf") else repr(float(valor))
+
+
+class Histograma:
+    """Histograma cumulativo por combinação de rótulos (como o do cliente oficial do Prometheus)"""
+
+    def __init__(self, nome: str, descricao: str, rotulos: Tuple[str, ...], buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **rotulos):
+        chave = tuple(str(rotulos.get(rotulo, "")) for rotulo in self.rotulos)
+        i = bisect.bisect_left(self.buckets, valor)  # primeiro limite >= valor (le = "menor ou igual")
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = {"contagens": [0] * (len(self.buckets) + 1), "soma": 0.0, "total": 0}
+            serie["contagens"][i] += 1
+            serie["soma"] += valor
+            serie["total"] += 1
+
+    def series(self) -> List[Tuple[Dict[str, str], dict]]:
+        """Cópia das séries: (rótulos, {"contagens", "soma", "total"}), contagens não cumulativas"""
+        with self._lock:
+            return [(dict(zip(self.rotulos, chave)), {"contagens": list(serie["contagens"]),
+                                                      "soma": serie["soma"], "total": serie["total"]})
+                    for chave, serie in self._series.items()]
+
+    def quantil(self, q: float, contagens: List[int]) -> Optional[float]:
+        """Estimativa do quantil por interpolação linear dentro do bucket (como histogram_quantile)"""
+        total = sum(contagens)
+        if not total:
+            return None
+        alvo = q * total
+        acumulado = 0
+        for i, contagem in enumerate(contagens):
+            if acumulado + contagem >= alvo and contagem:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # Acima do maior limite: o melhor que dá para dizer
+                inferior = self.buckets[i - 1] if i else 0.0
+                return inferior + (self.buckets[i] - inferior) * (alvo - acumulado) / contagem
+            acumulado += contagem
+        return self.buckets[-1]
+
+    def exposicao(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao.replace(chr(92), chr(92) * 2).replace(chr(10), ' ')}",
+                  f"# TYPE {self.nome} histogram"]
+        for rotulos, serie in sorted(self.series(), key=lambda s: tuple(s[0].values())):
+            base = ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos.items())
+            prefixo = base + "," if base else ""
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), serie["contagens"]):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{{{prefixo}le="{_formatar_numero(limite)}"}} {acumulado}')
+            linhas.append(f"{self.nome}_sum{{{base}}} {_formatar_numero(serie['soma'])}")
+            linhas.append(f"{self.nome}_count{{{base}}} {serie['total']}")
+        return linhas
+
+
+class Detalhamento:
+    """Etapas medidas durante uma consulta, com início relativo ao começo da consulta"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = []
+
+    def registrar(self, descricao: str, inicio: float, duracao: float, resultado: str):
+        # list.append é atômico: as threads da busca/extração registram sem lock
+        self.etapas.append({"etapa": descricao, "inicio": inicio - self.inicio,
+                            "duracao": duracao, "resultado": resultado})
+
+    def linhas(self) -> List[dict]:
+        return sorted(self.etapas, key=lambda etapa: etapa["inicio"])
+
+
+_detalhamento_atual = contextvars.ContextVar("detalhamento_metricas", default=None)
+
+
+@contextmanager
+def detalhar():
+    """Coleta as medições feitas neste contexto (e nas threads que o herdam) em um Detalhamento"""
+    detalhamento = Detalhamento()
+    token = _detalhamento_atual.set(detalhamento)
+    try:
+        yield detalhamento
+    finally:
+        _detalhamento_atual.reset(token)
+
+
+class Medicao:
+    """Mede um bloco `with` e registra no histograma ao sair
+
+    Exceções contam como "falha" e o fechamento de um gerador no meio (GeneratorExit)
+    como "cancelada"; falhas tratadas dentro do bloco são marcadas com `falhou()`.
+    """
+
+    def __init__(self, histograma: Histograma, descricao: str, rotulos: dict):
+        self._histograma = histograma
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.resultado = "sucesso"
+        self.inicio = None
+        self.duracao = None
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def falhou(self):
+        self.resultado = "falha"
+
+    def decorrido(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def __exit__(self, tipo, valor, tb):
+        if tipo is GeneratorExit:
+            self.resultado = "cancelada"
+        elif tipo is not None:
+            self.resultado = "falha"
+        self.duracao = self.decorrido()
+        self._histograma.observar(self.duracao, resultado=self.resultado, **self.rotulos)
+        detalhamento = _detalhamento_atual.get()
+        if detalhamento is not None:
+            detalhamento.registrar(self.descricao, self.inicio, self.duracao, self.resultado)
+        return False
+
+
+class RegistroMetricas:
+    """Conjunto de histogramas de um processo, exportado no formato texto do Prometheus"""
+
+    def __init__(self):
+        self._histogramas: Dict[str, Histograma] = {}
+        self._lock = threading.Lock()
+
+    def histograma(self, nome: str, descricao: str, rotulos: Tuple[str, ...], buckets=BUCKETS_LATENCIA) -> Histograma:
+        with self._lock:
+            if nome not in self._histogramas:
+                self._histogramas[nome] = Histograma(nome, descricao, rotulos, buckets)
+            return self._histogramas[nome]
+
+    def obter(self, nome: str) -> Optional[Histograma]:
+        return self._histogramas.get(nome)
+
+    def medir(self, nome: str, descricao: str, **rotulos) -> Medicao:
+        """Medição de um bloco no histograma `nome`; o rótulo "resultado" é preenchido ao sair"""
+        return Medicao(self._histogramas[nome], descricao, rotulos)
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        self._histogramas[nome].observar(valor, **rotulos)
+
+    def exposicao(self) -> str:
+        with self._lock:
+            histogramas = list(self._histogramas.values())
+        return "\n".join(linha for histograma in histogramas for linha in histograma.exposicao()) + "\n"
+
+
+class ServidorMetricas:
+    """Servidor HTTP mínimo em segundo plano que responde GET /metrics"""
+
+    def __init__(self, registro: RegistroMetricas, host: str = "127.0.0.1", porta: int = 9464):
+        self.registro = registro
+        self.host = host
+        self.porta = porta
+        self.erro = None
+        self._servidor = None
+
+    def iniciar(self) -> bool:
+        registro = self.registro
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/metrics/"):
+                    self.send_error(404)
+                    return
+                corpo = registro.exposicao().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", TIPO_CONTEUDO)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass  # Sem uma linha de log a cada coleta
+
+        try:
+            self._servidor = ThreadingHTTPServer((self.host, self.porta), Handler)
+        except OSError as e:
+            self.erro = str(e)  # Ex.: porta ocupada por outra instância
+            return False
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, name="servidor-metricas", daemon=True).start()
+        return True
+
+    @property
+    def ativo(self) -> bool:
+        return self._servidor is not None
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
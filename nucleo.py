@@ -0,0 +1,3497 @@
+"""Núcleo do Responde AI: busca, extração, ranqueamento e geração, sem interface.
+
+Não depende do Streamlit. Os objetos compartilhados (cache, cliente HTTP, índices,
+clientes de IA) são únicos por processo e `processar_pergunta` recebe a configuração
+e um objeto `Progresso` para reportar o andamento; app.py (Streamlit) e servico.py
+(HTTP/ASGI) são clientes deste módulo.
+"""
+import os
+import re
+import urllib.parse
+import random
+import sys
+import time
+import threading
+import contextvars
+import hashlib
+import unicodedata
+import math
+import functools
+import zlib
+import sqlite3
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from ddgs import DDGS
+import cloudscraper
+import json
+import logging
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FuturoTimeout
+from espelho import EspelhoCentral, SincronizadorPeriodico, ESPELHO_CAMINHO
+from extracao import (BASE_CENTRAL, MAX_CARACTERES_ARTIGO, clean_text, extrair_links_busca, extrair_texto_html,
+                      texto_de_fragmento_html)
+from metricas import RegistroMetricas, ServidorMetricas, detalhar
+
+logger = logging.getLogger("responde_ai")
+
+# ---------------------------
+# PROGRESSO E AVISOS
+# ---------------------------
+class Progresso:
+    """Recebe o andamento de processar_pergunta; cada interface sobrescreve o que exibe
+    
+    A implementação padrão ignora tudo. `aviso` pode ser chamado pelas threads de
+    busca/extração (que herdam o contexto da pergunta), não só pela thread chamadora.
+    """
+    
+    def status(self, rotulo: str, estado: str = "running"):
+        """Fase atual ("Buscando...", "Gerando resposta..."); estado "complete" ao terminar"""
+    
+    def etapa(self, mensagem: str):
+        """Passo concluído dentro da fase atual (artigo lido, reclassificação dispensada...)"""
+    
+    def aviso(self, mensagem: str, nivel: str = "warning"):
+        """Mensagem para o usuário (nivel: info, warning ou error)"""
+    
+    def inicio_resposta(self, prefixo: str):
+        """A geração em streaming começou; `prefixo` antecede o texto gerado"""
+    
+    def pedaco(self, texto: str):
+        """Pedaço da resposta em streaming"""
+
+# Progresso da pergunta em andamento (as threads submetidas com _submeter o herdam)
+_progresso_atual = contextvars.ContextVar("progresso_atual", default=None)
+
+def avisar(mensagem: str, nivel: str = "warning"):
+    """Envia um aviso ao Progresso da pergunta atual ou, fora de uma pergunta, ao log"""
+    progresso = _progresso_atual.get()
+    if progresso is not None:
+        progresso.aviso(mensagem, nivel)
+    else:
+        logger.log(logging.ERROR if nivel == "error" else logging.WARNING, mensagem)
+
+# ---------------------------
+# PRAZO DA PERGUNTA E DEGRADAÇÕES
+# ---------------------------
+# Prazo total padrão de uma pergunta, em segundos ("0" = sem prazo)
+PRAZO_PERGUNTA = float(os.getenv("RESPONDE_AI_PRAZO_PERGUNTA", "60"))
+# Fração do prazo guardada para a geração (ao menos RESERVA_MINIMA_RESPOSTA segundos, sem
+# passar da metade do prazo): busca, extração e reclassificação usam o resto
+FRACAO_RESERVA_RESPOSTA = 0.3
+RESERVA_MINIMA_RESPOSTA = 5.0
+# Tempo mínimo (segundos) para ainda valer a pena chamar a IA em cada etapa
+MINIMO_RECLASSIFICACAO = 3.0
+MINIMO_GERACAO = 2.0
+
+# O que foi sacrificado para cumprir o prazo (vai em ResultadoPergunta.degradacoes)
+DEGRADACOES = {
+    "menos_artigos": "⏱️ Prazo curto: a resposta usa só os artigos lidos a tempo",
+    "reclassificacao_pulada": "⏱️ Prazo curto: reclassificação por IA dispensada",
+    "resposta_parcial": "⏱️ Prazo esgotado: resposta parcial",
+}
+
+class PrazoEsgotado(requests.Timeout):
+    """Requisição não feita: o prazo da pergunta já acabou"""
+
+# Instante (time.monotonic) limite da pergunta/etapa atual e degradações aplicadas; as
+# threads submetidas com _submeter herdam os dois
+_prazo_atual = contextvars.ContextVar("prazo_atual", default=None)
+_degradacoes_atuais = contextvars.ContextVar("degradacoes_atuais", default=None)
+# threading.Event que, ligado de fora (ex.: o cliente do serviço desconectou), esgota o prazo
+# da pergunta em todas as threads dela
+_cancelamento_atual = contextvars.ContextVar("cancelamento_atual", default=None)
+
+def vincular_cancelamento(evento: threading.Event):
+    """Associa `evento` ao contexto atual: quando ele for ligado, o prazo conta como esgotado"""
+    _cancelamento_atual.set(evento)
+
+def tempo_restante() -> Optional[float]:
+    """Segundos até o prazo atual (negativo se passou); None sem prazo"""
+    cancelamento = _cancelamento_atual.get()
+    if cancelamento is not None and cancelamento.is_set():
+        return 0.0
+    prazo = _prazo_atual.get()
+    return None if prazo is None else prazo - time.monotonic()
+
+def prazo_esgotado() -> bool:
+    restante = tempo_restante()
+    return restante is not None and restante <= 0
+
+def no_prazo(timeout: Optional[float], minimo: float = 0.5) -> Optional[float]:
+    """Timeout limitado ao que resta do prazo (ao menos `minimo`, para não virar zero)"""
+    restante = tempo_restante()
+    if restante is None:
+        return timeout
+    restante = max(restante, minimo)
+    return restante if timeout is None else min(timeout, restante)
+
+@contextmanager
+def limitar_prazo(segundos: Optional[float]):
+    """Limita este contexto a `segundos` a partir de agora (None: sem limite novo); nunca estende o prazo externo"""
+    atual = _prazo_atual.get()
+    limite = None if segundos is None else time.monotonic() + segundos
+    if atual is not None and (limite is None or atual < limite):
+        limite = atual
+    token = _prazo_atual.set(limite)
+    try:
+        yield
+    finally:
+        _prazo_atual.reset(token)
+
+def reservar_prazo(reserva: float):
+    """Limita o contexto ao prazo atual menos `reserva` segundos (ex.: o que fica guardado para a geração)"""
+    restante = tempo_restante()
+    return limitar_prazo(None if restante is None else max(restante - reserva, 0.0))
+
+def reserva_resposta(prazo_total: Optional[float]) -> float:
+    """Segundos do prazo guardados para a geração da resposta (0 sem prazo)"""
+    if not prazo_total:
+        return 0.0
+    return min(max(prazo_total * FRACAO_RESERVA_RESPOSTA, RESERVA_MINIMA_RESPOSTA), prazo_total / 2)
+
+def registrar_degradacao(codigo: str):
+    """Anota (e avisa) uma degradação aplicada na pergunta atual"""
+    degradacoes = _degradacoes_atuais.get()
+    if degradacoes is None or codigo in degradacoes:
+        return
+    degradacoes.append(codigo)
+    avisar(DEGRADACOES[codigo], "info")
+
+def opcoes_prazo_ia(provedor: str) -> dict:
+    """Argumentos de timeout da chamada à IA para caber no prazo ({} sem prazo)"""
+    timeout = no_prazo(None, minimo=1.0)
+    if timeout is None:
+        return {}
+    return {"request_options": {"timeout": timeout}} if provedor == "gemini" else {"timeout": timeout}
+
+# ---------------------------
+# SISTEMA DE CACHE PARA MELHOR PERFORMANCE
+# ---------------------------
+# Namespaces conhecidos (prefixos das chaves) para as estatísticas por tipo
+CACHE_NAMESPACES = ("api_search_", "internal_search_", "search_", "reclass_", "req_", "validado_")
+
+# Limites configuráveis por variável de ambiente
+CACHE_TTL = int(os.getenv("RESPONDE_AI_CACHE_TTL", "3600"))  # 1 hora de cache
+CACHE_MAX_ITENS = int(os.getenv("RESPONDE_AI_CACHE_MAX_ITENS", "2000"))
+CACHE_MAX_BYTES = int(os.getenv("RESPONDE_AI_CACHE_MAX_MB", "64")) * 1024 * 1024
+# Texto e validadores (ETag, Last-Modified, updated_at) dos artigos ficam bem mais que o TTL:
+# passado o TTL, o artigo é revalidado com uma requisição condicional em vez de baixado de novo
+CACHE_VALIDADORES_TTL = int(os.getenv("RESPONDE_AI_CACHE_VALIDADORES_TTL", str(30 * 24 * 3600)))
+
+# Cache em disco (segundo nível): caminho do SQLite; "0"/"off" desativa
+CACHE_DISCO_CAMINHO = os.getenv("RESPONDE_AI_CACHE_DISCO", os.path.join(".cache", "responde_ai_cache.sqlite3"))
+CACHE_DISCO_MAX_BYTES = int(os.getenv("RESPONDE_AI_CACHE_DISCO_MAX_MB", "256")) * 1024 * 1024
+
+# Namespaces persistidos em disco e seus TTLs (segundos)
+CACHE_DISCO_TTL = {
+    "api_search_": 6 * 3600,
+    "internal_search_": 6 * 3600,
+    "search_": 6 * 3600,
+    "reclass_": 24 * 3600,
+    "req_": 6 * 3600,
+    "validado_": CACHE_VALIDADORES_TTL,
+}
+
+# Permite que uma sessão ignore o cache sem afetar as demais
+_cache_ignorado = contextvars.ContextVar("cache_ignorado", default=False)
+
+def _tamanho_aproximado(valor) -> int:
+    """Estimativa barata do tamanho em memória de um valor armazenado"""
+    if isinstance(valor, (str, bytes)):
+        return sys.getsizeof(valor)
+    if isinstance(valor, (list, tuple, set)):
+        return sys.getsizeof(valor) + sum(_tamanho_aproximado(v) for v in valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(_tamanho_aproximado(k) + _tamanho_aproximado(v) for k, v in valor.items())
+    return sys.getsizeof(valor)
+
+def normalizar_url(url: str) -> str:
+    """Normaliza a URL para chaves de cache: esquema/host minúsculos, sem fragmento, query ordenada"""
+    partes = urllib.parse.urlsplit(url.strip())
+    path = partes.path.rstrip("/") or "/"
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(partes.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((partes.scheme.lower(), partes.netloc.lower(), path, query, ""))
+
+def normalizar_consulta(query: str) -> str:
+    """Normaliza a consulta para chaves de cache (minúsculas e espaços colapsados)"""
+    return " ".join(query.lower().split())
+
+def chave_cache(namespace: str, *partes) -> str:
+    """Chave determinística (endereçada por conteúdo) a partir do namespace e dos parâmetros relevantes
+    
+    Diferente do hash() do Python, o resultado é o mesmo em todos os processos e reinícios.
+    """
+    conteudo = json.dumps(partes, ensure_ascii=False, separators=(",", ":"), default=str)
+    return f"{namespace}{hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:32]}"
+
+def _namespace_da_chave(key: str) -> str:
+    for namespace in CACHE_NAMESPACES:
+        if key.startswith(namespace):
+            return namespace
+    return "outros"
+
+class DiskCache:
+    """Cache persistente em SQLite (modo WAL), compartilhado entre processos e reinícios"""
+    
+    def __init__(self, caminho, max_bytes=CACHE_DISCO_MAX_BYTES, ttls=None, intervalo_limpeza=50):
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self.ttls = dict(CACHE_DISCO_TTL if ttls is None else ttls)
+        self.intervalo_limpeza = intervalo_limpeza
+        self._local = threading.local()
+        self._escritas = 0
+        self._lock = threading.Lock()
+        
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        
+        conn = self._conexao()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                chave TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                expira_em REAL NOT NULL,
+                acessado_em REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_acessado ON cache(acessado_em)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expira ON cache(expira_em)")
+    
+    def _conexao(self):
+        # Uma conexão por thread; o WAL permite leitores concorrentes com um escritor
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+    
+    def persiste(self, namespace: str) -> bool:
+        return namespace in self.ttls
+    
+    def get(self, key):
+        try:
+            conn = self._conexao()
+            row = conn.execute("SELECT valor, expira_em FROM cache WHERE chave = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            
+            valor, expira_em = row
+            agora = time.time()
+            if expira_em <= agora:
+                conn.execute("DELETE FROM cache WHERE chave = ?", (key,))
+                return None
+            
+            conn.execute("UPDATE cache SET acessado_em = ? WHERE chave = ?", (agora, key))
+            return json.loads(valor)
+        except (sqlite3.Error, ValueError):
+            return None
+    
+    def set(self, key, value, namespace):
+        ttl = self.ttls.get(namespace)
+        if ttl is None:
+            return
+        
+        try:
+            valor = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return  # Apenas valores serializáveis vão para o disco
+        
+        agora = time.time()
+        try:
+            self._conexao().execute(
+                "INSERT OR REPLACE INTO cache (chave, namespace, valor, tamanho, expira_em, acessado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, valor, len(valor.encode("utf-8")), agora + ttl, agora)
+            )
+        except sqlite3.Error:
+            return
+        
+        with self._lock:
+            self._escritas += 1
+            limpar = self._escritas % self.intervalo_limpeza == 0
+        if limpar:
+            self.limpar_excesso()
+    
+    def limpar_excesso(self):
+        """Remove expirados e, se necessário, os menos acessados até caber no limite de bytes"""
+        try:
+            conn = self._conexao()
+            conn.execute("DELETE FROM cache WHERE expira_em <= ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM cache").fetchone()[0]
+            while total > self.max_bytes:
+                removidos = conn.execute(
+                    "DELETE FROM cache WHERE chave IN (SELECT chave FROM cache ORDER BY acessado_em LIMIT 100)"
+                ).rowcount
+                if not removidos:
+                    break
+                total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM cache").fetchone()[0]
+        except sqlite3.Error:
+            pass
+    
+    def estatisticas(self) -> dict:
+        try:
+            itens, total = self._conexao().execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM cache").fetchone()
+            return {"itens": itens, "bytes": total}
+        except sqlite3.Error:
+            return {"itens": 0, "bytes": 0}
+    
+    def clear(self):
+        try:
+            self._conexao().execute("DELETE FROM cache")
+        except sqlite3.Error:
+            pass
+
+class CacheManager:
+    """Cache LRU com TTL, limitado por itens e bytes aproximados, seguro entre sessões"""
+    
+    def __init__(self, ttl=CACHE_TTL, max_itens=CACHE_MAX_ITENS, max_bytes=CACHE_MAX_BYTES, intervalo_varredura=60,
+                 disco: "DiskCache" = None):
+        self.cache = OrderedDict()  # chave -> (valor, timestamp, tamanho)
+        self.disco = disco  # Segundo nível opcional
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.intervalo_varredura = intervalo_varredura
+        self.bytes = 0
+        self._lock = threading.RLock()
+        self._ultima_varredura = time.time()
+        self._stats = {}
+    
+    def _contar(self, namespace, campo, n=1):
+        stats = self._stats.setdefault(namespace, {"hits": 0, "hits_disco": 0, "misses": 0, "evictions": 0, "expirados": 0})
+        stats[campo] += n
+    
+    def _remover(self, key):
+        _, _, tamanho = self.cache.pop(key)
+        self.bytes -= tamanho
+    
+    def get(self, key):
+        if _cache_ignorado.get():
+            return None
+        
+        namespace = _namespace_da_chave(key)
+        with self._lock:
+            item = self.cache.get(key)
+            if item is not None:
+                data, timestamp, _ = item
+                if time.time() - timestamp < self.ttl:
+                    self.cache.move_to_end(key)
+                    self._contar(namespace, "hits")
+                    return data
+                self._remover(key)
+                self._contar(namespace, "expirados")
+        
+        # Segundo nível: promove para a memória o que estiver no disco
+        if self.disco is not None and self.disco.persiste(namespace):
+            data = self.disco.get(key)
+            if data is not None:
+                self._set_memoria(key, data)
+                with self._lock:
+                    self._contar(namespace, "hits_disco")
+                return data
+        
+        with self._lock:
+            self._contar(namespace, "misses")
+        return None
+    
+    def set(self, key, value):
+        if _cache_ignorado.get():
+            return
+        
+        self._set_memoria(key, value)
+        
+        namespace = _namespace_da_chave(key)
+        if self.disco is not None and self.disco.persiste(namespace):
+            self.disco.set(key, value, namespace)
+    
+    def _set_memoria(self, key, value):
+        tamanho = _tamanho_aproximado(value)
+        if tamanho > self.max_bytes:
+            return  # Um único item maior que o cache inteiro não é armazenado
+        
+        with self._lock:
+            if key in self.cache:
+                self._remover(key)
+            self.cache[key] = (value, time.time(), tamanho)
+            self.bytes += tamanho
+            
+            if time.time() - self._ultima_varredura >= self.intervalo_varredura:
+                self._varrer_expirados()
+            
+            # Despejar os itens usados há mais tempo até respeitar os limites
+            while len(self.cache) > self.max_itens or self.bytes > self.max_bytes:
+                antiga, _ = next(iter(self.cache.items()))
+                self._remover(antiga)
+                self._contar(_namespace_da_chave(antiga), "evictions")
+    
+    def _varrer_expirados(self):
+        agora = time.time()
+        expiradas = [k for k, (_, timestamp, _) in self.cache.items() if agora - timestamp >= self.ttl]
+        for key in expiradas:
+            self._remover(key)
+            self._contar(_namespace_da_chave(key), "expirados")
+        self._ultima_varredura = agora
+    
+    def varrer(self):
+        """Remove todos os itens expirados"""
+        with self._lock:
+            self._varrer_expirados()
+    
+    @contextmanager
+    def ignorado(self, ignorar: bool = True):
+        """Ignora o cache (leitura e escrita) no contexto atual, inclusive nas tarefas submetidas com _submeter"""
+        token = _cache_ignorado.set(ignorar)
+        try:
+            yield
+        finally:
+            _cache_ignorado.reset(token)
+    
+    def estatisticas(self) -> dict:
+        with self._lock:
+            stats = {
+                "itens": len(self.cache),
+                "bytes": self.bytes,
+                "namespaces": {ns: dict(stats) for ns, stats in self._stats.items()},
+            }
+        stats["disco"] = self.disco.estatisticas() if self.disco is not None else None
+        return stats
+    
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.bytes = 0
+        if self.disco is not None:
+            self.disco.clear()
+
+@functools.lru_cache(maxsize=None)
+def obter_cache() -> CacheManager:
+    """Instância única por processo (o script é reexecutado a cada interação do Streamlit)"""
+    disco = None
+    if CACHE_DISCO_CAMINHO.lower() not in ("", "0", "off", "false"):
+        try:
+            disco = DiskCache(CACHE_DISCO_CAMINHO)
+        except (sqlite3.Error, OSError) as e:
+            avisar(f"Cache em disco indisponível: {e}. Usando apenas memória.")
+    return CacheManager(disco=disco)
+
+cache = obter_cache()
+
+def _submeter(executor, func, *args, **kwargs):
+    """Submete uma tarefa preservando o contexto (contextvars) da thread chamadora"""
+    contexto = contextvars.copy_context()
+    return executor.submit(contexto.run, func, *args, **kwargs)
+
+# ---------------------------
+# COALESCÊNCIA DE CHAMADAS CONCORRENTES (SINGLE-FLIGHT)
+# ---------------------------
+class _Voo:
+    """Uma chamada em andamento e o resultado que os demais interessados esperam"""
+    
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.cortado = False
+
+class ChamadasEmVoo:
+    """Chamadas concorrentes com a mesma chave (a do cache) esperam a que já está em andamento
+    
+    O cache só é escrito depois da busca: sem isto, várias sessões perguntando sobre o mesmo
+    assunto ao mesmo tempo fariam as mesmas requisições e reclassificações em paralelo.
+    """
+    
+    def __init__(self):
+        self._voos = {}  # chave -> _Voo
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def _contar(self, chave, campo):
+        stats = self._stats.setdefault(_namespace_da_chave(chave), {"chamadas": 0, "compartilhadas": 0, "desistencias": 0})
+        stats[campo] += 1
+    
+    def executar(self, chave: str, func, padrao=None):
+        """Resultado de func() - desta thread ou da que já o calcula para a mesma chave
+        
+        Quem espera respeita o próprio prazo (devolve `padrao` se ele acabar) e, se a chamada
+        em andamento foi cortada pelo prazo de quem a fez, tenta de novo por conta própria.
+        """
+        while True:
+            with self._lock:
+                voo = self._voos.get(chave)
+                lider = voo is None
+                if lider:
+                    voo = self._voos[chave] = _Voo()
+                    self._contar(chave, "chamadas")
+            
+            if lider:
+                try:
+                    voo.resultado = func()
+                    return voo.resultado
+                except BaseException as e:
+                    voo.erro = e
+                    raise
+                finally:
+                    voo.cortado = prazo_esgotado()
+                    with self._lock:
+                        del self._voos[chave]
+                    voo.evento.set()
+            
+            restante = tempo_restante()
+            if not voo.evento.wait(None if restante is None else max(restante, 0.0)):
+                with self._lock:
+                    self._contar(chave, "desistencias")
+                return padrao
+            if voo.cortado:
+                continue  # Resultado possivelmente incompleto por falta de tempo de outra pergunta
+            
+            with self._lock:
+                self._contar(chave, "compartilhadas")
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado
+    
+    def em_andamento(self) -> int:
+        with self._lock:
+            return len(self._voos)
+    
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {ns: dict(stats) for ns, stats in self._stats.items()}
+
+@functools.lru_cache(maxsize=None)
+def obter_chamadas_em_voo() -> ChamadasEmVoo:
+    """Coalescência única por processo (compartilhada por todas as sessões)"""
+    return ChamadasEmVoo()
+
+em_voo = obter_chamadas_em_voo()
+
+# ---------------------------
+# MÉTRICAS DE LATÊNCIA (PROMETHEUS)
+# ---------------------------
+# Porta do endpoint /metrics ("0" desativa) e interface onde ele escuta. Por padrão só a
+# própria máquina alcança o endpoint: para um Prometheus em outro host, use "0.0.0.0"
+METRICAS_PORTA = int(os.getenv("RESPONDE_AI_METRICAS_PORTA", "9464"))
+METRICAS_HOST = os.getenv("RESPONDE_AI_METRICAS_HOST", "127.0.0.1")
+
+HIST_ETAPA = "responde_ai_etapa_segundos"
+HIST_REQUISICAO = "responde_ai_requisicao_segundos"
+HIST_LLM = "responde_ai_llm_segundos"
+HIST_PRIMEIRO_TOKEN = "responde_ai_llm_primeiro_token_segundos"
+
+@functools.lru_cache(maxsize=None)
+def obter_metricas_latencia() -> RegistroMetricas:
+    """Histogramas de latência do processo (compartilhados por todas as sessões)"""
+    registro = RegistroMetricas()
+    registro.histograma(HIST_ETAPA, "Duração de cada etapa de processar_pergunta", ("etapa", "resultado"))
+    registro.histograma(HIST_REQUISICAO, "Duração de cada tentativa de fazer_requisicao_inteligente",
+                        ("host", "resultado"))
+    registro.histograma(HIST_LLM, "Duração das chamadas à IA", ("provedor", "finalidade", "modo", "resultado"))
+    registro.histograma(HIST_PRIMEIRO_TOKEN, "Tempo até o primeiro pedaço nas chamadas à IA em streaming",
+                        ("provedor", "finalidade"))
+    return registro
+
+metricas_latencia = obter_metricas_latencia()
+
+@functools.lru_cache(maxsize=None)
+def obter_servidor_metricas() -> ServidorMetricas:
+    """Endpoint /metrics para o Prometheus, iniciado uma vez por processo"""
+    servidor = ServidorMetricas(metricas_latencia, METRICAS_HOST, METRICAS_PORTA)
+    if METRICAS_PORTA:
+        servidor.iniciar()
+    return servidor
+
+def medir_etapa(etapa: str, descricao: str = None):
+    return metricas_latencia.medir(HIST_ETAPA, descricao or etapa, etapa=etapa)
+
+def medir_requisicao(url: str, tentativa: int):
+    host = urllib.parse.urlsplit(url).netloc
+    return metricas_latencia.medir(HIST_REQUISICAO, f"GET {host} (tentativa {tentativa})", host=host)
+
+def medir_llm(provedor: str, finalidade: str, modo: str):
+    # A espera pelo limite de taxa fica fora da medição (não é latência do provedor)
+    aguardar_vez(provedor)
+    return metricas_latencia.medir(HIST_LLM, f"IA {provedor}: {finalidade} ({modo})",
+                                   provedor=provedor, finalidade=finalidade, modo=modo)
+
+# ---------------------------
+# LIMITES DE TAXA POR PROVEDOR
+# ---------------------------
+PROVEDORES_LIMITADOS = ("gemini", "openai", "central", "duckduckgo")
+
+class LimitadorTaxa:
+    """Limite de requisições por minuto compartilhado entre threads (GCRA / balde de fichas)
+    
+    `rajada` requisições podem sair juntas; depois, uma a cada 60/por_minuto segundos.
+    """
+    
+    def __init__(self, por_minuto: float, rajada: int = 1):
+        self.intervalo = 60.0 / por_minuto
+        self.tolerancia = self.intervalo * (max(rajada, 1) - 1)
+        self._proxima = 0.0  # Instante teórico da próxima liberação
+        self._lock = threading.Lock()
+    
+    def aguardar(self) -> float:
+        """Bloqueia até a vez desta requisição; retorna quanto esperou (segundos)"""
+        with self._lock:
+            agora = time.monotonic()
+            proxima = max(self._proxima, agora)
+            espera = max(proxima - self.tolerancia - agora, 0.0)
+            self._proxima = proxima + self.intervalo
+        if espera:
+            time.sleep(espera)
+        return espera
+
+@functools.lru_cache(maxsize=None)
+def obter_limites_taxa() -> Dict[str, LimitadorTaxa]:
+    """Limitadores do processo, de RESPONDE_AI_RPM_<PROVEDOR> (sem a variável, sem limite)"""
+    limites = {}
+    for provedor in PROVEDORES_LIMITADOS:
+        valor = os.getenv(f"RESPONDE_AI_RPM_{provedor.upper()}", "")
+        try:
+            por_minuto = float(valor) if valor else 0.0
+        except ValueError:
+            por_minuto = 0.0
+        if por_minuto > 0:
+            limites[provedor] = LimitadorTaxa(por_minuto)
+    return limites
+
+def definir_limite_taxa(provedor: str, por_minuto: float, rajada: int = 1):
+    """Troca (ou remove, com por_minuto <= 0) o limite de um provedor"""
+    limites = obter_limites_taxa()
+    if por_minuto > 0:
+        limites[provedor] = LimitadorTaxa(por_minuto, rajada)
+    else:
+        limites.pop(provedor, None)
+
+def aguardar_vez(provedor: str) -> float:
+    limitador = obter_limites_taxa().get(provedor)
+    return limitador.aguardar() if limitador else 0.0
+
+# ---------------------------
+# DISJUNTORES POR HOST E CACHE NEGATIVO
+# ---------------------------
+# Falhas seguidas que abrem o disjuntor de um host e por quanto tempo ele fica aberto
+# (dobra a cada sonda que falha, até o máximo)
+DISJUNTOR_FALHAS = int(os.getenv("RESPONDE_AI_DISJUNTOR_FALHAS", "5"))
+DISJUNTOR_ABERTO = float(os.getenv("RESPONDE_AI_DISJUNTOR_ABERTO", "30"))
+DISJUNTOR_ABERTO_MAX = 300.0
+# Por quanto tempo (segundos) uma URL ou consulta que falhou não é tentada de novo
+CACHE_NEGATIVO_TTL = float(os.getenv("RESPONDE_AI_CACHE_NEGATIVO_TTL", "60"))
+
+HOST_DUCKDUCKGO = "duckduckgo.com"
+
+class CircuitoAberto(requests.RequestException):
+    """Requisição recusada sem ir à rede: o disjuntor do host está aberto"""
+
+class DisjuntorHost:
+    """Disjuntor de um host: fechado -> aberto (falha rápida) -> meio-aberto (uma sonda) -> fechado"""
+    
+    def __init__(self, host: str, limiar: int = DISJUNTOR_FALHAS, tempo_aberto: float = DISJUNTOR_ABERTO):
+        self.host = host
+        self.limiar = limiar
+        self.tempo_aberto_inicial = tempo_aberto
+        self.tempo_aberto = tempo_aberto
+        self.estado = "fechado"
+        self.falhas_seguidas = 0
+        self.aberto_em = 0.0
+        self.recusadas = 0
+        self._sonda = False  # Já há uma requisição de teste em andamento no estado meio-aberto
+        self._lock = threading.Lock()
+    
+    def _atualizar(self, agora: float):
+        if self.estado == "aberto" and agora - self.aberto_em >= self.tempo_aberto:
+            self.estado = "meio_aberto"
+            self._sonda = False
+    
+    def disponivel(self) -> bool:
+        """Se uma requisição agora poderia passar (sem consumir a sonda do meio-aberto); se não, conta a recusa"""
+        with self._lock:
+            self._atualizar(time.monotonic())
+            if self.estado == "fechado" or (self.estado == "meio_aberto" and not self._sonda):
+                return True
+            self.recusadas += 1
+            return False
+    
+    def permitir(self) -> bool:
+        with self._lock:
+            self._atualizar(time.monotonic())
+            if self.estado == "fechado":
+                return True
+            if self.estado == "meio_aberto" and not self._sonda:
+                self._sonda = True
+                return True
+            self.recusadas += 1
+            return False
+    
+    def liberar_sonda(self):
+        """A requisição terminou sem dizer nada sobre o host: outra pode servir de sonda"""
+        with self._lock:
+            self._sonda = False
+    
+    def sucesso(self):
+        with self._lock:
+            self.estado = "fechado"
+            self.falhas_seguidas = 0
+            self.tempo_aberto = self.tempo_aberto_inicial
+            self._sonda = False
+    
+    def falha(self):
+        with self._lock:
+            self.falhas_seguidas += 1
+            if self.estado == "meio_aberto":
+                # A sonda falhou: volta a abrir, por mais tempo
+                self.tempo_aberto = min(self.tempo_aberto * 2, DISJUNTOR_ABERTO_MAX)
+            elif self.estado != "fechado" or self.falhas_seguidas < self.limiar:
+                return
+            self.estado = "aberto"
+            self.aberto_em = time.monotonic()
+            self._sonda = False
+    
+    def situacao(self) -> dict:
+        with self._lock:
+            self._atualizar(time.monotonic())
+            restante = self.tempo_aberto - (time.monotonic() - self.aberto_em) if self.estado == "aberto" else 0.0
+            return {"host": self.host, "estado": self.estado, "falhas_seguidas": self.falhas_seguidas,
+                    "reabre_em": max(restante, 0.0), "recusadas": self.recusadas}
+
+class Disjuntores:
+    """Disjuntores por host, criados sob demanda"""
+    
+    def __init__(self):
+        self._hosts: Dict[str, DisjuntorHost] = {}
+        self._lock = threading.Lock()
+    
+    def obter(self, url_ou_host: str) -> DisjuntorHost:
+        host = urllib.parse.urlsplit(url_ou_host).netloc if "://" in url_ou_host else url_ou_host
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = DisjuntorHost(host)
+            return self._hosts[host]
+    
+    def estados(self) -> List[dict]:
+        with self._lock:
+            disjuntores = list(self._hosts.values())
+        return [disjuntor.situacao() for disjuntor in disjuntores]
+
+@functools.lru_cache(maxsize=None)
+def obter_disjuntores() -> Disjuntores:
+    return Disjuntores()
+
+disjuntores = obter_disjuntores()
+
+class CacheNegativo:
+    """Chaves (URLs, consultas) que falharam há pouco; evita repetir a mesma falha dentro do TTL"""
+    
+    def __init__(self, ttl: float = CACHE_NEGATIVO_TTL, max_itens: int = 5000):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._expira = OrderedDict()  # chave -> instante (monotonic) em que volta a ser tentada
+        self._lock = threading.Lock()
+        self.evitadas = 0
+    
+    def marcar(self, chave: str):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._expira[chave] = time.monotonic() + self.ttl
+            self._expira.move_to_end(chave)
+            while len(self._expira) > self.max_itens:
+                self._expira.popitem(last=False)
+    
+    def contem(self, chave: str) -> bool:
+        with self._lock:
+            expira = self._expira.get(chave)
+            if expira is None:
+                return False
+            if expira <= time.monotonic():
+                del self._expira[chave]
+                return False
+            self.evitadas += 1
+            return True
+    
+    def __len__(self):
+        agora = time.monotonic()
+        with self._lock:
+            return sum(1 for expira in self._expira.values() if expira > agora)
+    
+    def clear(self):
+        with self._lock:
+            self._expira.clear()
+
+@functools.lru_cache(maxsize=None)
+def obter_cache_negativo() -> CacheNegativo:
+    return CacheNegativo()
+
+cache_negativo = obter_cache_negativo()
+
+# ---------------------------
+# HEADERS MELHORADOS COM ROTAÇÃO DINÂMICA
+# ---------------------------
+def get_dynamic_headers(url=None):
+    """Retorna headers dinâmicos e realistas"""
+    user_agents = [
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36'
+    ]
+    
+    base_headers = {
+        'authority': 'centraldeatendimento.totvs.com',
+        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+        'accept-language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
+        'cache-control': 'no-cache',
+        'pragma': 'no-cache',
+        'sec-ch-ua': '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";v="141"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"Windows"',
+        'sec-fetch-dest': 'document',
+        'sec-fetch-mode': 'navigate',
+        'sec-fetch-site': 'same-origin',
+        'upgrade-insecure-requests': '1',
+        'user-agent': random.choice(user_agents),
+    }
+    
+    if url:
+        base_headers['referer'] = 'https://centraldeatendimento.totvs.com/'
+    
+    return base_headers
+
+# ---------------------------
+# SISTEMA DE REQUISIÇÕES ROBUSTO
+# ---------------------------
+def create_advanced_scraper():
+    """Cria um scraper avançado com retry automático"""
+    try:
+        scraper = cloudscraper.create_scraper(
+            browser={
+                'browser': 'chrome',
+                'platform': 'windows',
+                'mobile': False
+            },
+            delay=10,
+        )
+        return scraper
+    except Exception as e:
+        avisar(f"CloudScraper não disponível: {e}. Usando requests.")
+        return requests.Session()
+
+# Pool de conexões HTTP configurável por variável de ambiente
+HTTP_POOL_HOSTS = int(os.getenv("RESPONDE_AI_HTTP_POOL_HOSTS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("RESPONDE_AI_HTTP_POOL", "10"))
+HTTP_RETRIES = int(os.getenv("RESPONDE_AI_HTTP_RETRIES", "2"))  # Só falhas de conexão
+HTTP_BACKOFF = float(os.getenv("RESPONDE_AI_HTTP_BACKOFF", "0.5"))
+
+class ClienteHTTP:
+    """Cliente HTTP compartilhado por todos os caminhos de busca e extração
+    
+    Cada thread usa sua própria sessão (requests.Session e o CloudScraper não são
+    seguros entre threads), mas todas montam os mesmos adaptadores, então os pools
+    de conexão por host (keep-alive) são compartilhados pelo processo inteiro.
+    """
+    
+    def __init__(self, pool_hosts=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+        self.pool_hosts = pool_hosts
+        self.pool_maxsize = pool_maxsize
+        # Só falhas de conexão são repetidas aqui. Timeouts de leitura e status de erro (429, 5xx,
+        # o 503 do desafio do Cloudflare) voltam na hora: quem repete é fazer_requisicao_inteligente,
+        # dentro do prazo da pergunta e com o disjuntor contando cada falha (um Retry-After dormido
+        # aqui passaria do prazo e multiplicaria as requisições a um host que já está limitando)
+        self.retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            backoff_factor=backoff,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize, max_retries=self.retry)
+        self._adapter_navegador = None  # Adaptador TLS do CloudScraper, criado na primeira sessão
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._requisicoes = {"simples": 0, "navegador": 0}
+    
+    def _sessao(self) -> requests.Session:
+        sessao = getattr(self._local, "sessao", None)
+        if sessao is None:
+            sessao = requests.Session()
+            sessao.mount("https://", self._adapter)
+            sessao.mount("http://", self._adapter)
+            self._local.sessao = sessao
+        return sessao
+    
+    def _sessao_navegador(self) -> requests.Session:
+        sessao = getattr(self._local, "sessao_navegador", None)
+        if sessao is None:
+            sessao = create_advanced_scraper()
+            with self._lock:
+                if self._adapter_navegador is None:
+                    # Reaproveita o adaptador do CloudScraper (mantém a assinatura TLS) com o pool configurado
+                    adapter = sessao.get_adapter("https://")
+                    if adapter is self._adapter or not isinstance(adapter, HTTPAdapter):
+                        adapter = self._adapter
+                    else:
+                        adapter.max_retries = self.retry
+                        adapter.init_poolmanager(self.pool_hosts, self.pool_maxsize)
+                    self._adapter_navegador = adapter
+            sessao.mount("https://", self._adapter_navegador)
+            sessao.mount("http://", self._adapter)
+            self._local.sessao_navegador = sessao
+        return sessao
+    
+    def get(self, url, navegador: bool = False, **kwargs) -> requests.Response:
+        """GET pelo pool compartilhado; navegador=True usa o CloudScraper (anti-bot)
+        
+        O timeout é encurtado para caber no prazo da pergunta atual, se houver.
+        """
+        if prazo_esgotado():
+            raise PrazoEsgotado("Prazo da pergunta esgotado")
+        disjuntor = disjuntores.obter(url)
+        if not disjuntor.permitir():
+            raise CircuitoAberto(f"Disjuntor aberto para {disjuntor.host}")
+        # Daqui em diante o disjuntor sempre fica sabendo do resultado: sem isso, uma sonda do
+        # meio-aberto perdida (ex.: prazo esgotado na fila do limite) deixaria o host bloqueado
+        registrado = False
+        try:
+            sessao = self._sessao_navegador() if navegador else self._sessao()
+            if url.startswith(BASE_CENTRAL):
+                aguardar_vez("central")
+            with self._lock:
+                self._requisicoes["navegador" if navegador else "simples"] += 1
+            timeout = kwargs.get("timeout")
+            kwargs["timeout"] = no_prazo(timeout)
+            encurtado = kwargs["timeout"] != timeout
+            try:
+                response = sessao.get(url, **kwargs)
+            except Exception as e:  # Inclui os erros próprios do CloudScraper (desafio não resolvido etc.)
+                # Timeout encurtado pelo nosso prazo não é culpa do host
+                if not (encurtado and isinstance(e, requests.Timeout)):
+                    disjuntor.falha()
+                    registrado = True
+                raise
+            # 403/429 costumam ser bloqueio anti-bot; 404 e afins são respostas normais de um host saudável
+            if response.status_code in (403, 429) or response.status_code >= 500:
+                disjuntor.falha()
+            else:
+                disjuntor.sucesso()
+            registrado = True
+            return response
+        finally:
+            if not registrado:
+                disjuntor.liberar_sonda()  # Nada se soube do host: outra requisição pode ser a sonda
+    
+    def estatisticas(self) -> dict:
+        """Requisições feitas e conexões abertas/reutilizadas pelos pools ativos"""
+        conexoes = requisicoes_pool = hosts = 0
+        adapters = {id(a): a for a in (self._adapter, self._adapter_navegador) if a is not None}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for chave in list(pools.keys()):
+                pool = pools.get(chave)
+                if pool is None:
+                    continue
+                hosts += 1
+                conexoes += pool.num_connections
+                requisicoes_pool += pool.num_requests
+        
+        with self._lock:
+            requisicoes = dict(self._requisicoes)
+        return {
+            "requisicoes": requisicoes,
+            "hosts": hosts,
+            "conexoes_abertas": conexoes,
+            "conexoes_reutilizadas": max(requisicoes_pool - conexoes, 0),
+        }
+
+@functools.lru_cache(maxsize=None)
+def obter_cliente_http() -> ClienteHTTP:
+    """Cliente HTTP único por processo, compartilhado entre sessões e reexecuções"""
+    return ClienteHTTP()
+
+cliente_http = obter_cliente_http()
+
+# ---------------------------
+# ESPELHO LOCAL DA CENTRAL
+# ---------------------------
+@functools.lru_cache(maxsize=None)
+def obter_espelho():
+    """Espelho local dos artigos (None se desativado ou indisponível)"""
+    if ESPELHO_CAMINHO.lower() in ("", "0", "off", "false"):
+        return None
+    try:
+        return EspelhoCentral(ESPELHO_CAMINHO)
+    except (sqlite3.Error, OSError):
+        return None
+
+espelho = obter_espelho()
+
+@functools.lru_cache(maxsize=None)
+def obter_controle_sincronizacao() -> dict:
+    """Guarda a thread de sincronização em segundo plano (uma por processo)"""
+    return {"thread": None, "lock": threading.Lock()}
+
+def iniciar_sincronizacao_espelho(intervalo: float = 0):
+    """Dispara a sincronização do espelho em segundo plano, se ainda não estiver rodando"""
+    if espelho is None:
+        return None
+    
+    controle = obter_controle_sincronizacao()
+    with controle["lock"]:
+        thread = controle["thread"]
+        if thread is None or not thread.is_alive():
+            thread = SincronizadorPeriodico(espelho, intervalo=intervalo, sessao=cliente_http)
+            thread.start()
+            controle["thread"] = thread
+    return thread
+
+def buscar_no_espelho(query: str, max_links: int = 5) -> List[str]:
+    """Busca no espelho local, sem acesso à rede"""
+    if espelho is None:
+        return []
+    with medir_etapa("busca_espelho", "Busca no espelho local") as medicao:
+        try:
+            links = espelho.buscar(query, max_links)
+        except sqlite3.Error:
+            medicao.falhou()
+            return []
+    metadados_artigos.registrar(links, "espelho")
+    return links
+
+def _tentar_requisicao(url, condicionais: dict = None):
+    """Uma tentativa: CloudScraper e, se falhar ou for bloqueado, requests simples
+    
+    Com `condicionais` (cabeçalhos If-None-Match/If-Modified-Since), um 304 também é sucesso.
+    """
+    headers = get_dynamic_headers(url)
+    headers.update(condicionais or {})
+    
+    # Tentar com CloudScraper primeiro
+    response = cliente_http.get(url, navegador=True, headers=headers, timeout=25)
+    
+    if response.status_code == 304 and condicionais:
+        return response
+    if response.status_code == 200:
+        # Verificar se não é uma página de bloqueio
+        content_lower = response.text.lower()
+        if not any(term in content_lower for term in ['access denied', 'blocked', 'bot detected', 'captcha']):
+            return response
+    if prazo_esgotado():
+        return None
+    
+    # Se falhou, tentar com requests simples
+    alt_headers = headers.copy()
+    alt_headers['user-agent'] = random.choice([
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36',
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0'
+    ])
+    
+    response = cliente_http.get(url, headers=alt_headers, timeout=20)
+    if response.status_code == 200 or (response.status_code == 304 and condicionais):
+        return response
+    return None
+
+def fazer_requisicao_inteligente(url, max_tentativas=3, extrator=None):
+    """Sistema inteligente de requisições com múltiplas estratégias
+    
+    Com `extrator`, retorna apenas extrator(response) - um valor compacto e serializável
+    (texto, lista de links) que é o que fica no cache. Sem ele, retorna o Response sem cache.
+    Chamadas simultâneas para a mesma URL (e extrator) compartilham uma única requisição.
+    Uma página com ETag/Last-Modified fica só na revalidação: passado o TTL, ela é pedida
+    de novo com os validadores e, num 304, o valor extraído da última vez é reaproveitado.
+    As demais ficam no cache comum (req_).
+    """
+    cache_key = chave_validadores = validada = None
+    if extrator is not None:
+        chave_validadores = chave_cache("validado_", normalizar_url(url), extrator.__name__)
+        validada = revalidacao.obter(chave_validadores)
+        if validada is not None and revalidacao.fresca(validada):
+            return validada["texto"]
+        
+        cache_key = chave_cache("req_", normalizar_url(url), extrator.__name__)
+        cached = cache.get(cache_key) if validada is None else None
+        if cached:
+            return cached
+    
+    chave_negativa = chave_cache("req_", normalizar_url(url))
+    if cache_negativo.contem(chave_negativa):
+        return None
+    
+    def requisitar():
+        disjuntor = disjuntores.obter(url)
+        response_ok = None
+        for tentativa in range(max_tentativas):
+            # Host bloqueando (disjuntor aberto): falha já, sem gastar as tentativas nem o delay
+            if not disjuntor.disponivel():
+                break
+            
+            # Delay progressivo entre tentativas (fora da medição da tentativa)
+            if tentativa > 0:
+                delay = tentativa * 2 + random.uniform(1, 3)
+                restante = tempo_restante()
+                if restante is not None and restante <= delay:
+                    break  # Não sobra tempo para outra tentativa dentro do prazo
+                time.sleep(delay)
+            
+            with medir_requisicao(url, tentativa + 1) as medicao:
+                try:
+                    response_ok = _tentar_requisicao(url, revalidacao.condicionais(validada))
+                except Exception:
+                    response_ok = None  # Timeout, conexão recusada etc.: tenta de novo
+                if response_ok is None:
+                    medicao.falhou()
+            
+            if response_ok is not None:
+                break
+        
+        if response_ok is None and not prazo_esgotado():
+            cache_negativo.marcar(chave_negativa)
+        if response_ok is None or extrator is None:
+            return response_ok
+        
+        if response_ok.status_code == 304:
+            return revalidacao.revalidada(chave_validadores, validada, response_ok)
+        resultado = extrator(response_ok)
+        if not revalidacao.guardar(chave_validadores, resultado, response_ok):
+            cache.set(cache_key, resultado)  # Sem validadores: não há como revalidar, vale o TTL do cache
+        return resultado
+    
+    return em_voo.executar(cache_key or chave_negativa, requisitar)
+
+# ---------------------------
+# METADADOS DOS ARTIGOS ENCONTRADOS
+# ---------------------------
+class MetadadosArtigos:
+    """Por URL: estratégias de busca que encontraram o artigo e data da última atualização
+    
+    Alimentado pelas buscas e extrações; usado como sinal barato pela reclassificação local.
+    """
+    
+    def __init__(self, max_itens=20000):
+        self.max_itens = max_itens
+        self._dados = OrderedDict()  # url normalizada -> {"origens": set, "updated_at": str | None}
+        self._lock = threading.Lock()
+    
+    def registrar(self, urls, origem: str = None, updated_at: str = None):
+        with self._lock:
+            for url in urls:
+                chave = normalizar_url(url)
+                dados = self._dados.pop(chave, None) or {"origens": set(), "updated_at": None}
+                if origem:
+                    dados["origens"].add(origem)
+                if updated_at:
+                    dados["updated_at"] = updated_at
+                self._dados[chave] = dados
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+    
+    def obter(self, url: str) -> dict:
+        with self._lock:
+            dados = self._dados.get(normalizar_url(url))
+            return {"origens": set(dados["origens"]), "updated_at": dados["updated_at"]} if dados else \
+                {"origens": set(), "updated_at": None}
+
+@functools.lru_cache(maxsize=None)
+def obter_metadados_artigos() -> MetadadosArtigos:
+    return MetadadosArtigos()
+
+metadados_artigos = obter_metadados_artigos()
+
+# ---------------------------
+# REVALIDAÇÃO CONDICIONAL DOS ARTIGOS
+# ---------------------------
+class RevalidacaoArtigos:
+    """Texto extraído de cada artigo com seus validadores (ETag, Last-Modified, updated_at)
+    
+    Até `ttl` segundos depois da última validação o texto é usado direto. Depois disso o
+    artigo é pedido com If-None-Match/If-Modified-Since: num 304 (ou com o mesmo updated_at)
+    o texto guardado continua valendo e só a data da validação é renovada.
+    """
+    
+    def __init__(self, ttl=CACHE_TTL, armazenamento: "CacheManager" = None):
+        self.ttl = ttl
+        # Guarda por CACHE_VALIDADORES_TTL (e no disco, se houver): sobrevive ao TTL do cache comum
+        self.armazenamento = armazenamento or CacheManager(ttl=CACHE_VALIDADORES_TTL)
+        self._lock = threading.Lock()
+        self._stats = {"revalidadas_304": 0, "revalidadas_updated_at": 0, "completas": 0}
+    
+    def _contar(self, campo: str):
+        with self._lock:
+            self._stats[campo] += 1
+    
+    def obter(self, chave: str) -> Optional[dict]:
+        return self.armazenamento.get(chave)
+    
+    def fresca(self, validada: dict) -> bool:
+        return time.time() - validada["validado_em"] < self.ttl
+    
+    @staticmethod
+    def condicionais(validada: Optional[dict]) -> dict:
+        """Cabeçalhos da requisição condicional ({} sem versão guardada ou sem validadores HTTP)"""
+        cabecalhos = {}
+        if validada is not None:
+            if validada.get("etag"):
+                cabecalhos["if-none-match"] = validada["etag"]
+            if validada.get("last_modified"):
+                cabecalhos["if-modified-since"] = validada["last_modified"]
+        return cabecalhos
+    
+    def revalidada(self, chave: str, validada: dict, response: requests.Response):
+        """O artigo não mudou: renova a validação e devolve o texto guardado"""
+        self.armazenamento.set(chave, {
+            **validada,
+            "etag": response.headers.get("ETag") or validada.get("etag"),
+            "last_modified": response.headers.get("Last-Modified") or validada.get("last_modified"),
+            "validado_em": time.time(),
+        })
+        self._contar("revalidadas_304" if response.status_code == 304 else "revalidadas_updated_at")
+        return validada["texto"]
+    
+    def guardar(self, chave: str, texto, response: requests.Response, updated_at: str = None) -> bool:
+        """Registra um download completo; guarda o texto se houver como revalidá-lo depois (retorna se guardou)"""
+        self._contar("completas")
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if not texto or not (etag or last_modified or updated_at):
+            return False
+        self.armazenamento.set(chave, {"texto": texto, "etag": etag, "last_modified": last_modified,
+                                       "updated_at": updated_at, "validado_em": time.time()})
+        return True
+    
+    def estatisticas(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["itens"] = self.armazenamento.estatisticas()["itens"]
+        return stats
+    
+    def clear(self):
+        """Esquece as versões guardadas (o disco é o mesmo do cache comum e também é limpo)"""
+        self.armazenamento.clear()
+
+@functools.lru_cache(maxsize=None)
+def obter_revalidacao() -> RevalidacaoArtigos:
+    """Única por processo; usa o mesmo SQLite do cache em disco"""
+    return RevalidacaoArtigos(armazenamento=CacheManager(ttl=CACHE_VALIDADORES_TTL, disco=cache.disco))
+
+revalidacao = obter_revalidacao()
+
+# ---------------------------
+# SISTEMA DE BUSCA APRIMORADO
+# ---------------------------
+def buscar_via_api_zendesk(query, max_results=5):
+    """Busca usando a API oficial do Zendesk (método mais confiável)"""
+    cache_key = chave_cache("api_search_", normalizar_consulta(query), max_results)
+    cached = cache.get(cache_key)
+    if cached:
+        metadados_artigos.registrar(cached, "api")
+        return cached
+    if cache_negativo.contem(cache_key):
+        return []
+    
+    def buscar():
+        with medir_etapa("busca_api", "Busca na API do Zendesk") as medicao:
+            try:
+                base_url = f"{BASE_CENTRAL}/api/v2/help_center/pt-br/articles/search"
+                params = {'query': query, 'per_page': max_results}
+                
+                headers = get_dynamic_headers()
+                headers['accept'] = 'application/json'
+                
+                response = cliente_http.get(base_url, params=params, headers=headers, timeout=15)
+                
+                if response.status_code == 200:
+                    data = response.json()
+                    articles = data.get('results', [])
+                    
+                    links = []
+                    for article in articles:
+                        url = article.get('html_url')
+                        if url and url not in links:
+                            links.append(url)
+                            metadados_artigos.registrar([url], "api", article.get('updated_at'))
+                    
+                    cache.set(cache_key, links)
+                    return links
+            
+            except Exception as e:
+                pass
+            
+            medicao.falhou()
+            if not prazo_esgotado():
+                cache_negativo.marcar(cache_key)
+            return []
+    
+    return em_voo.executar(cache_key, buscar, padrao=[])
+
+def extrair_conteudo_via_api(url):
+    """Extrai conteúdo via API - método mais confiável
+    
+    Leituras simultâneas do mesmo artigo são uma só. O texto fica guardado com o ETag e o
+    updated_at; passado o TTL, o artigo é revalidado e só é processado de novo se mudou.
+    """
+    article_id = re.search(r'/articles/(\d+)', url)
+    if not article_id:
+        return None
+    article_id = article_id.group(1)
+    
+    # Lido há menos de CACHE_TTL: nem revalida
+    chave_validadores = chave_cache("validado_", "api", article_id)
+    validada = revalidacao.obter(chave_validadores)
+    if validada is not None and revalidacao.fresca(validada):
+        metadados_artigos.registrar([url], updated_at=validada["updated_at"])
+        return validada["texto"]
+    
+    chave_negativa = chave_cache("api_artigo_", article_id)
+    if cache_negativo.contem(chave_negativa):
+        return None
+    
+    def extrair():
+        try:
+            api_url = f"{BASE_CENTRAL}/api/v2/help_center/pt-br/articles/{article_id}"
+            
+            headers = get_dynamic_headers()
+            headers['accept'] = 'application/json'
+            headers.update(revalidacao.condicionais(validada))
+            
+            with medir_etapa("extracao_api", f"Artigo via API: {article_id}") as medicao:
+                response = cliente_http.get(api_url, headers=headers, timeout=15)
+                if response.status_code not in (200, 304):
+                    medicao.falhou()
+            
+            if response.status_code == 304 and validada is not None:
+                metadados_artigos.registrar([url], updated_at=validada["updated_at"])
+                return revalidacao.revalidada(chave_validadores, validada, response)
+            
+            if response.status_code == 200:
+                data = response.json()
+                article = data.get('article', {})
+                updated_at = article.get('updated_at')
+                metadados_artigos.registrar([url], updated_at=updated_at)
+                
+                # Mesmo updated_at: o texto guardado continua valendo (sem processar o HTML de novo)
+                if validada is not None and updated_at and updated_at == validada["updated_at"]:
+                    return revalidacao.revalidada(chave_validadores, validada, response)
+                
+                texto = _texto_do_artigo(article.get('title', ''), article.get('body', ''))
+                revalidacao.guardar(chave_validadores, texto, response, updated_at)
+                return texto
+        
+        except Exception:
+            pass
+        
+        if not prazo_esgotado():
+            cache_negativo.marcar(chave_negativa)
+        return None
+    
+    return em_voo.executar(chave_negativa, extrair)
+
+def _texto_do_artigo(title: str, body: str) -> str:
+    """Monta o texto limpo a partir do título e do corpo HTML de um artigo da API"""
+    text = texto_de_fragmento_html(body)
+    
+    full_content = f"{title}\n\n{text}"
+    return clean_text(full_content)[:MAX_CARACTERES_ARTIGO]
+
+def extrair_conteudo_via_espelho(url):
+    """Extrai conteúdo do espelho local (sem rede)"""
+    if espelho is None:
+        return None
+    try:
+        artigo = espelho.artigo_por_url(url)
+    except sqlite3.Error:
+        return None
+    if not artigo:
+        return None
+    return _texto_do_artigo(artigo['titulo'], artigo['corpo']) or None
+
+# ---------------------------
+# STOP WORDS E PRÉ-PROCESSAMENTO (MELHORADO)
+# ---------------------------
+STOP_WORDS = {
+    "bom dia", "boa tarde", "boa noite", "olá", "att", "atenciosamente",
+    "obrigado", "obrigada", "prezado", "prezada", "caro", "cara", 
+    "senhor", "senhora", "ola", "oi", "saudações", "tudo bem", "tudo bem?",
+    "amigo", "amiga", "por favor", "grato", "grata", "cordialmente", 
+    "abraço", "abs", "ok", "entendi", "obg", "vlw", "por favor", 
+    "favor", "gostaria", "queria", "saber"
+}
+
+PALAVRAS_TECNICAS = {
+    'erp', 'sql', 'api', 'xml', 'json', 'tss', 'nt', 'danfe', 'nfe', 'cte',
+    'mde', 'sped', 'ecd', 'ecf', 'efd', 'protheus', 'fluig', 'rm', 'log',
+    'fis', 'fat', 'crm', 'com', 'tms', 'wms', 'bi', 'linx', 'datasul',
+    'configurar', 'parâmetro', 'erro', 'funcionalidade', 'módulo', 'instalação'
+}
+
+def clean_query(query: str) -> str:
+    """Limpa e otimiza a query para busca"""
+    if not query:
+        return ""
+    
+    # Remover caracteres especiais mas manter acentos
+    query = re.sub(r'[^\w\sáàâãéèêíïóôõöúçñÁÀÂãÉÈÊÍÏÓÔÕÖÚÇÑ-]', ' ', query)
+    query = query.lower().strip()
+    
+    # Remover stop words mas manter palavras técnicas
+    parts = query.split()
+    keep = []
+    
+    for p in parts:
+        p_clean = p.strip()
+        if (p_clean not in STOP_WORDS and len(p_clean) >= 2) or p_clean in PALAVRAS_TECNICAS:
+            keep.append(p_clean)
+    
+    # Adicionar "Protheus" se não estiver presente e for uma consulta técnica
+    if keep and "protheus" not in " ".join(keep).lower():
+        termos_tecnicos = any(term in " ".join(keep).lower() for term in 
+                            ['configurar', 'parâmetro', 'erro', 'funcionalidade', 'módulo', 'instalação'])
+        if termos_tecnicos:
+            keep.append("protheus")
+    
+    return " ".join(keep)
+
+def tem_video_ou_anexo(query: str) -> bool:
+    """Verifica se a query se refere a conteúdo multimídia"""
+    padroes = [
+        r"\banexo\b", r"\banexos\b", r"\banexado\b", r"\banexada\b",
+        r"\bv[íi]deo\b", r"\bv[íi]deos\b", r"\bgravaç[ãa]o\b",
+        r"\bprint\b", r"\bimagem\b", r"\bscreenshot\b", r"\bfoto\b",
+        r"\bpdf\b", r"\barquivo\b", r"\bdownload\b"
+    ]
+    query_lower = query.lower()
+    return any(re.search(p, query_lower) for p in padroes)
+
+# ---------------------------
+# SISTEMA DE EXTRAÇÃO MELHORADO
+# ---------------------------
+def extrair_conteudo_pagina(url: str, usar_espelho: bool = True) -> str:
+    """Extrai conteúdo com múltiplas estratégias
+    
+    O texto vindo da rede fica guardado uma vez só, na revalidação (ou no req_ de uma página
+    sem validadores): passado o TTL, o artigo é revalidado em vez de servido de outra cópia.
+    """
+    if '/search?' in url:
+        return "Página de pesquisa - conteúdo não extraído"
+
+    # Espelho local primeiro: sem latência de rede
+    if usar_espelho:
+        conteudo_espelho = extrair_conteudo_via_espelho(url)
+        if conteudo_espelho:
+            return conteudo_espelho
+
+    # Tentar via API (método mais confiável na rede)
+    conteudo_api = extrair_conteudo_via_api(url)
+    if conteudo_api:
+        return conteudo_api
+
+    # Fallback para scraping tradicional
+    try:
+        texto = fazer_requisicao_inteligente(url, extrator=extrair_texto_html)
+        
+        if texto is None:
+            return f"❌ Não foi possível acessar: {url}"
+        
+        if not texto:
+            return "Conteúdo não encontrado"
+        
+        return texto
+        
+    except Exception as e:
+        return f"Erro na extração: {str(e)}"
+
+# Limite padrão de extrações simultâneas para não sermos limitados pela central
+MAX_EXTRACOES_SIMULTANEAS = 4
+
+def extrair_conteudos_paralelo(links: List[str], max_workers: int = MAX_EXTRACOES_SIMULTANEAS,
+                               usar_espelho: bool = True):
+    """Extrai o conteúdo dos links em paralelo, devolvendo (índice, link, texto) conforme concluem
+    
+    Com prazo na pergunta, para de esperar quando ele acaba (os artigos ainda não lidos ficam de fora).
+    """
+    if not links:
+        return
+    
+    max_workers = max(1, min(max_workers, len(links)))
+    # Sem "with": ao estourar o prazo não esperamos as extrações em andamento
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extracao")
+    try:
+        futuros = {
+            _submeter(executor, extrair_conteudo_pagina, link, usar_espelho): (i, link)
+            for i, link in enumerate(links)
+        }
+        restante = tempo_restante()
+        try:
+            for futuro in as_completed(futuros, timeout=None if restante is None else max(restante, 0.0)):
+                i, link = futuros[futuro]
+                try:
+                    texto = futuro.result()
+                except Exception as e:
+                    texto = f"Erro na extração: {str(e)}"
+                yield i, link, texto
+        except FuturoTimeout:
+            return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def pesquisar_interna_totvs(query: str, limit: int = 5) -> List[str]:
+    """Pesquisa interna com fallbacks"""
+    cache_key = chave_cache("internal_search_", normalizar_consulta(query))
+    cached = cache.get(cache_key)
+    if cached:
+        metadados_artigos.registrar(cached[:limit], "interna")
+        return cached[:limit]
+    
+    search_url = f"{BASE_CENTRAL}/hc/pt-br/search?query={urllib.parse.quote(query)}"
+    
+    links = []
+    with medir_etapa("busca_interna", "Pesquisa interna da central") as medicao:
+        try:
+            links = fazer_requisicao_inteligente(search_url, extrator=extrair_links_busca)
+        except Exception as e:
+            links = None
+        if links is None:
+            medicao.falhou()
+            links = []
+    
+    if not prazo_esgotado():  # Cortada pelo prazo: o vazio não é o resultado real
+        cache.set(cache_key, links)
+    metadados_artigos.registrar(links[:limit], "interna")
+    return links[:limit]
+
+# "0" desliga a busca no DuckDuckGo (ex.: lotes contra um simulador local da central)
+DUCKDUCKGO_ATIVO = os.getenv("RESPONDE_AI_DUCKDUCKGO", "1") != "0"
+
+def buscar_via_duckduckgo(query: str, max_results: int = 5, ignorar: Set[str] = None) -> List[str]:
+    """Busca artigos da central via DuckDuckGo"""
+    ignorar = ignorar or set()
+    links = []
+    if not DUCKDUCKGO_ATIVO:
+        return links
+    chave_negativa = chave_cache("ddg_", normalizar_consulta(query))
+    disjuntor = disjuntores.obter(HOST_DUCKDUCKGO)
+    if prazo_esgotado() or cache_negativo.contem(chave_negativa) or not disjuntor.permitir():
+        return links
+    aguardar_vez("duckduckgo")
+    with medir_etapa("busca_duckduckgo", "Busca no DuckDuckGo") as medicao:
+        try:
+            search_query = f"site:{urllib.parse.urlsplit(BASE_CENTRAL).netloc} {query}"
+            with DDGS() as ddgs:
+                for r in ddgs.text(search_query, max_results=10):
+                    url = r.get("href", "")
+                    if (url.startswith(BASE_CENTRAL) and 
+                        "/articles/" in url and url not in ignorar and url not in links):
+                        links.append(url)
+                    if len(links) >= max_results:
+                        break
+            disjuntor.sucesso()
+        except Exception as e:
+            # Bloqueio/limite do DuckDuckGo chega como exceção do ddgs
+            medicao.falhou()
+            disjuntor.falha()
+            cache_negativo.marcar(chave_negativa)
+    
+    metadados_artigos.registrar(links, "duckduckgo")
+    return links
+
+# Prazo padrão (segundos) da busca em paralelo
+PRAZO_BUSCA_PARALELA = 8.0
+
+def _mesclar_resultados_busca(resultados: List[List[str]], max_links: int) -> List[str]:
+    """Mescla resultados das estratégias na ordem de prioridade, sem duplicatas"""
+    found = []
+    seen = set()
+    for links in resultados:
+        for url in links or []:
+            if url not in seen:
+                found.append(url)
+                seen.add(url)
+            if len(found) >= max_links:
+                return found
+    return found
+
+def _buscar_em_paralelo(cleaned: str, max_links: int, prazo: float,
+                        iniciais: List[str] = None) -> Tuple[List[str], bool]:
+    """Dispara todas as estratégias ao mesmo tempo e retorna ao atingir max_links ou o prazo.
+    
+    `iniciais` (ex.: resultados do espelho local) têm prioridade sobre as estratégias de rede.
+    Retorna (links, completo), onde completo indica que nenhuma estratégia foi descartada pelo prazo.
+    """
+    estrategias = [
+        (buscar_via_api_zendesk, (cleaned, max_links)),
+        (buscar_via_duckduckgo, (cleaned, max_links)),
+        (pesquisar_interna_totvs, (cleaned, max_links)),
+    ]
+    resultados = [iniciais or []] + [None] * len(estrategias)
+    limite = time.monotonic() + prazo
+    
+    # Sem "with": ao sair não esperamos as estratégias lentas
+    executor = ThreadPoolExecutor(max_workers=len(estrategias), thread_name_prefix="busca")
+    try:
+        pendentes = {_submeter(executor, func, *args): i for i, (func, args) in enumerate(estrategias, 1)}
+        while pendentes:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            concluidos, _ = wait(pendentes, timeout=restante, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                i = pendentes.pop(futuro)
+                try:
+                    resultados[i] = futuro.result()
+                except Exception:
+                    resultados[i] = []
+            
+            # Mantém a prioridade (API > DuckDuckGo > interna) entre as estratégias já concluídas
+            if len(_mesclar_resultados_busca(resultados, max_links)) >= max_links:
+                break
+        
+        completo = not pendentes
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    links = _mesclar_resultados_busca(resultados, max_links)
+    return links, completo or len(links) >= max_links
+
+def buscar_documentacao_totvs(query: str, max_links: int = 5, paralelo: bool = False,
+                              prazo: float = PRAZO_BUSCA_PARALELA, usar_espelho: bool = True) -> List[str]:
+    """Sistema híbrido de busca com múltiplas fontes
+    
+    O espelho local é consultado primeiro; se já preencher max_links, a rede não é usada.
+    No modo paralelo as estratégias são disparadas juntas e a busca termina ao
+    atingir max_links ou ao esgotar o prazo (em segundos); as lentas são ignoradas.
+    Nos dois modos a busca também respeita o prazo da pergunta atual.
+    """
+    cache_key = chave_cache("search_", normalizar_consulta(query), max_links, usar_espelho)
+    cached = cache.get(cache_key)
+    if cached:
+        return cached
+    
+    cleaned = clean_query(query)
+    if not cleaned:
+        return []
+    
+    # Estratégia 0: espelho local
+    locais = buscar_no_espelho(cleaned, max_links) if usar_espelho else []
+    if len(locais) >= max_links:
+        cache.set(cache_key, locais)
+        return locais[:max_links]
+    
+    if paralelo:
+        found, completo = _buscar_em_paralelo(cleaned, max_links, no_prazo(prazo), iniciais=locais)
+        if not found:
+            return [f"{BASE_CENTRAL}/hc/pt-br/search?query={urllib.parse.quote(cleaned)}"]
+        
+        # Resultados cortados pelo prazo não vão para o cache
+        if completo:
+            cache.set(cache_key, found)
+        return found[:max_links]
+    
+    found = list(locais)
+    seen = set(locais)
+    
+    # Estratégia 1: API Zendesk (mais confiável)
+    api_links = buscar_via_api_zendesk(cleaned, max_links) if len(found) < max_links else []
+    for url in api_links:
+        if url not in seen:
+            found.append(url)
+            seen.add(url)
+    
+    # Estratégia 2: DuckDuckGo
+    if len(found) < max_links:
+        for url in buscar_via_duckduckgo(cleaned, max_links - len(found), ignorar=seen):
+            found.append(url)
+            seen.add(url)
+    
+    # Estratégia 3: Pesquisa interna
+    if len(found) < max_links:
+        interna_links = pesquisar_interna_totvs(cleaned, max_links - len(found))
+        for url in interna_links:
+            if url not in seen:
+                found.append(url)
+                seen.add(url)
+    
+    # Fallback final
+    if not found:
+        found = [f"{BASE_CENTRAL}/hc/pt-br/search?query={urllib.parse.quote(cleaned)}"]
+    
+    if not prazo_esgotado():
+        cache.set(cache_key, found)
+    return found[:max_links]
+
+# ---------------------------
+# SISTEMA DE RELEVÂNCIA MELHORADO
+# ---------------------------
+# Respostas de extração que indicam falha (não entram no índice)
+PREFIXOS_FALHA_EXTRACAO = (
+    "❌", "Erro HTTP", "Erro na extração", "Página de pesquisa", "Conteúdo não encontrado"
+)
+
+def conteudo_valido(texto: str) -> bool:
+    return bool(texto) and not texto.startswith(PREFIXOS_FALHA_EXTRACAO)
+
+def _tokenizar(texto: str) -> List[str]:
+    return re.findall(r"\w+", texto.lower())
+
+class IndiceBM25:
+    """Índice invertido incremental com pontuação BM25 sobre o texto dos artigos extraídos
+    
+    Normalização (usada no Score Mínimo de Relevância): bm25 / soma dos idf dos termos
+    da consulta, limitada a 1.0. Vale ~1.0 quando todos os termos aparecem ao menos uma
+    vez em um documento de tamanho médio e cai conforme o peso (idf) dos termos ausentes.
+    """
+    
+    def __init__(self, k1=1.2, b=0.75, max_docs=20000):
+        self.k1 = k1
+        self.b = b
+        self.max_docs = max_docs
+        self.postings = {}  # termo -> {doc: frequência}
+        self.docs = OrderedDict()  # doc -> (assinatura, tamanho, termos)
+        self.total_tokens = 0
+        self._lock = threading.RLock()
+    
+    def __len__(self):
+        return len(self.docs)
+    
+    def adicionar(self, doc_id: str, texto: str) -> bool:
+        """Indexa (ou reindexa, se o texto mudou) um documento; retorna False se já estava atualizado"""
+        assinatura = (len(texto), hashlib.md5(texto.encode("utf-8")).hexdigest())
+        with self._lock:
+            atual = self.docs.get(doc_id)
+            if atual is not None and atual[0] == assinatura:
+                self.docs.move_to_end(doc_id)
+                return False
+        
+        # Tokenização fora do lock
+        tokens = _tokenizar(texto)
+        frequencias = Counter(tokens)
+        
+        with self._lock:
+            if doc_id in self.docs:
+                self._remover(doc_id)
+            for termo, tf in frequencias.items():
+                self.postings.setdefault(termo, {})[doc_id] = tf
+            self.docs[doc_id] = (assinatura, len(tokens), tuple(frequencias))
+            self.total_tokens += len(tokens)
+            
+            while len(self.docs) > self.max_docs:
+                self._remover(next(iter(self.docs)))
+        return True
+    
+    def _remover(self, doc_id):
+        _, tamanho, termos = self.docs.pop(doc_id)
+        self.total_tokens -= tamanho
+        for termo in termos:
+            lista = self.postings.get(termo)
+            if lista is not None:
+                lista.pop(doc_id, None)
+                if not lista:
+                    del self.postings[termo]
+    
+    def _idf(self, termo: str) -> float:
+        n = len(self.docs)
+        df = len(self.postings.get(termo, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+    
+    def pontuar(self, consulta: str, doc_ids: List[str] = None, normalizar: bool = True) -> Dict[str, float]:
+        """Pontua os documentos (todos os que contêm algum termo, ou apenas doc_ids) para a consulta"""
+        termos = list(dict.fromkeys(_tokenizar(clean_query(consulta))))
+        with self._lock:
+            if not termos or not self.docs:
+                return {doc: 0.0 for doc in doc_ids or []}
+            
+            media = self.total_tokens / len(self.docs) or 1.0
+            if doc_ids is None:
+                alvo = set()
+                for termo in termos:
+                    alvo.update(self.postings.get(termo, ()))
+            else:
+                alvo = doc_ids
+            
+            scores = {doc: 0.0 for doc in alvo}
+            soma_idf = 0.0
+            for termo in termos:
+                idf = self._idf(termo)
+                soma_idf += idf
+                lista = self.postings.get(termo)
+                if not lista:
+                    continue
+                for doc in scores:
+                    tf = lista.get(doc)
+                    if tf:
+                        tamanho = self.docs[doc][1]
+                        scores[doc] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * tamanho / media))
+        
+        if normalizar and soma_idf > 0:
+            return {doc: min(score / soma_idf, 1.0) for doc, score in scores.items()}
+        return scores
+
+@functools.lru_cache(maxsize=None)
+def obter_indice_bm25() -> IndiceBM25:
+    """Índice único por processo, alimentado por todas as sessões"""
+    return IndiceBM25()
+
+indice_bm25 = obter_indice_bm25()
+
+def pontuar_artigos(artigos: List[Tuple[str, str]], query: str) -> List[Tuple[float, str, str]]:
+    """Indexa os (link, texto) extraídos e devolve (score BM25 normalizado, link, texto)"""
+    for link, texto in artigos:
+        if conteudo_valido(texto):
+            indice_bm25.adicionar(link, texto)
+            indice_vetorial.adicionar(link, texto)
+    
+    validos = [link for link, texto in artigos if conteudo_valido(texto)]
+    scores = indice_bm25.pontuar(query, validos)
+    return [(scores.get(link, 0.0), link, texto) for link, texto in artigos]
+
+# ---------------------------
+# CONTAGEM DE TOKENS E ORÇAMENTO DE ENTRADA
+# ---------------------------
+# Caracteres por token, calibrados em artigos técnicos em português, usados quando não
+# há tokenizador local para o modelo (Gemini sempre; OpenAI sem o pacote tiktoken)
+CARACTERES_POR_TOKEN = {"gemini": 3.6, "openai": 3.3}
+ORCAMENTO_TOKENS_ENTRADA = 4000
+ORCAMENTO_TOKENS_RECLASSIFICACAO = 1200
+
+@functools.lru_cache(maxsize=8)
+def _codificador_tiktoken(modelo: str):
+    """Tokenizador local da OpenAI, se o pacote opcional tiktoken estiver instalado"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None  # Ex.: arquivo do vocabulário indisponível sem rede
+
+class ContadorTokens:
+    """Conta tokens de entrada para o provedor/modelo selecionado"""
+    
+    def __init__(self, use_gemini: bool, modelo: str):
+        self.provedor = "gemini" if use_gemini else "openai"
+        self.codificador = None if use_gemini else _codificador_tiktoken(modelo)
+        self.metodo = "tiktoken" if self.codificador is not None else "estimativa"
+    
+    def contar(self, texto: str) -> int:
+        if not texto:
+            return 0
+        if self.codificador is not None:
+            return len(self.codificador.encode(texto, disallowed_special=()))
+        return math.ceil(len(texto) / CARACTERES_POR_TOKEN[self.provedor])
+    
+    def truncar(self, texto: str, max_tokens: int) -> str:
+        """Corta o texto para caber em max_tokens (no limite de palavra quando estimado)"""
+        if max_tokens <= 0 or not texto:
+            return ""
+        if self.codificador is not None:
+            tokens = self.codificador.encode(texto, disallowed_special=())
+            return texto if len(tokens) <= max_tokens else self.codificador.decode(tokens[:max_tokens])
+        limite = int(max_tokens * CARACTERES_POR_TOKEN[self.provedor])
+        return texto if len(texto) <= limite else texto[:limite].rsplit(" ", 1)[0]
+
+# ---------------------------
+# TRECHOS (PASSAGENS) PARA O CONTEXTO
+# ---------------------------
+# Tamanho das passagens em palavras, sobreposição entre elas e limites do contexto
+TAMANHO_PASSAGEM = 180
+SOBREPOSICAO_PASSAGEM = 40
+MAX_PASSAGENS_CONTEXTO = 6
+
+def dividir_em_passagens(texto: str, tamanho: int = TAMANHO_PASSAGEM,
+                         sobreposicao: int = SOBREPOSICAO_PASSAGEM) -> List[Tuple[int, int]]:
+    """Divide o texto em janelas de palavras sobrepostas; retorna os intervalos (início, fim)"""
+    n = len(texto.split())
+    if n <= tamanho:
+        return [(0, n)] if n else []
+    passo = tamanho - sobreposicao
+    return [(i, min(i + tamanho, n)) for i in range(0, n - sobreposicao, passo)]
+
+def selecionar_passagens(artigos: List[Tuple[float, str, str]], query: str, contador: ContadorTokens,
+                         orcamento_tokens: int, max_passagens: int = MAX_PASSAGENS_CONTEXTO
+                         ) -> Tuple[List[Tuple[float, str, int, int]], int]:
+    """Pontua as passagens de todos os candidatos e preenche o orçamento de tokens por relevância
+    
+    A pontuação é o BM25 normalizado da passagem (calculado entre as passagens dos
+    candidatos) ponderado pela posição do artigo na ordenação/reclassificação:
+    peso = 1 / (1 + 0.15 * posição). Retorna ([(score, url, início, fim)], tokens usados).
+    """
+    indice = IndiceBM25(max_docs=10 ** 6)
+    passagens = {}
+    palavras_por_url = {}
+    for posicao, (_, url, texto) in enumerate(artigos):
+        if not conteudo_valido(texto):
+            continue
+        palavras = texto.split()
+        palavras_por_url[url] = palavras
+        for inicio, fim in dividir_em_passagens(texto):
+            doc_id = f"{url}#{inicio}"
+            indice.adicionar(doc_id, " ".join(palavras[inicio:fim]))
+            passagens[doc_id] = (url, inicio, fim, 1 / (1 + 0.15 * posicao))
+    
+    if not passagens:
+        return [], 0
+    
+    scores = indice.pontuar(query, list(passagens))
+    ordenadas = sorted(passagens, key=lambda d: scores[d] * passagens[d][3], reverse=True)
+    
+    # Sem nenhum termo em comum: usa o início dos 3 primeiros artigos, como antes dos trechos
+    sem_correspondencia = not scores[ordenadas[0]]
+    if sem_correspondencia:
+        ordenadas = [d for d in passagens if passagens[d][1] == 0][:3]
+    
+    selecionadas = []
+    fontes = set()
+    tokens = 0
+    for doc_id in ordenadas:
+        if not sem_correspondencia and not scores[doc_id]:
+            break  # Restam apenas passagens sem nenhum termo da pergunta
+        url, inicio, fim, peso = passagens[doc_id]
+        custo = contador.contar(" ".join(palavras_por_url[url][inicio:fim]))
+        if url not in fontes:
+            custo += contador.contar(f"Fonte: {url}\n\n")
+        if tokens + custo > orcamento_tokens:
+            continue  # Tenta passagens menores que ainda caibam
+        selecionadas.append((scores[doc_id] * peso, url, inicio, fim))
+        fontes.add(url)
+        tokens += custo
+        if len(selecionadas) >= max_passagens:
+            break
+    
+    return selecionadas, tokens
+
+def montar_contexto_passagens(artigos: List[Tuple[float, str, str]], query: str, contador: ContadorTokens,
+                              orcamento_tokens: int = ORCAMENTO_TOKENS_ENTRADA,
+                              max_passagens: int = MAX_PASSAGENS_CONTEXTO) -> Tuple[str, List[str], int]:
+    """Monta o contexto com as melhores passagens que cabem no orçamento de tokens
+    
+    O orçamento é o da entrada inteira: a parte fixa do prompt (instruções, pergunta e
+    lista de fontes) é descontada antes. Retorna (contexto, fontes, tokens de entrada estimados).
+    """
+    fixos = tokens_fixos_resposta(contador, query, [url for _, url, _ in artigos])
+    selecionadas, tokens = selecionar_passagens(artigos, query, contador, orcamento_tokens - fixos, max_passagens)
+    if not selecionadas:
+        return "", [], fixos
+    
+    palavras_por_url = {url: texto.split() for _, url, texto in artigos if conteudo_valido(texto)}
+    
+    # Artigos na ordem da sua melhor passagem; trechos sobrepostos do mesmo artigo são unidos
+    intervalos = {}
+    for _, url, inicio, fim in selecionadas:
+        intervalos.setdefault(url, []).append((inicio, fim))
+    
+    blocos = []
+    for url, lista in intervalos.items():
+        unidos = []
+        for inicio, fim in sorted(lista):
+            if unidos and inicio <= unidos[-1][1]:
+                unidos[-1] = (unidos[-1][0], max(fim, unidos[-1][1]))
+            else:
+                unidos.append((inicio, fim))
+        palavras = palavras_por_url[url]
+        trechos = " [...] ".join(" ".join(palavras[inicio:fim]) for inicio, fim in unidos)
+        blocos.append(f"Fonte: {url}\n{trechos}")
+    
+    return "\n\n".join(blocos), list(intervalos), fixos + tokens
+
+# ---------------------------
+# RECUPERAÇÃO VETORIAL (NUMPY)
+# ---------------------------
+# Dimensão dos vetores (feature hashing), caminho de persistência e similaridade mínima
+VETOR_DIM = int(os.getenv("RESPONDE_AI_VETOR_DIM", "2048"))
+VETORES_CAMINHO = os.getenv("RESPONDE_AI_VETORES", os.path.join(".cache", "vetores"))
+SIMILARIDADE_MINIMA = 0.2
+
+def codificar_hashing(tokens: List[str], dim: int = VETOR_DIM, bigramas: bool = True) -> np.ndarray:
+    """Vetor TF sublinear (não normalizado) de unigramas (e bigramas) via feature hashing"""
+    if not tokens:
+        return np.zeros(dim, dtype=np.float32)
+    
+    # Unigramas e bigramas, com sinal para reduzir o efeito das colisões
+    termos = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])] if bigramas else tokens
+    hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in termos), dtype=np.uint32, count=len(termos))
+    sinais = np.where(hashes & 0x80000000, 1.0, -1.0)
+    vetor = np.bincount(hashes % dim, weights=sinais, minlength=dim)
+    return (np.sign(vetor) * np.log1p(np.abs(vetor))).astype(np.float32)
+
+class IndiceVetorial:
+    """Recuperação densa local: TF-IDF com feature hashing em uma matriz float32 contígua
+    
+    Cada linha é o vetor TF sublinear normalizado (L2) de um artigo; a consulta recebe os
+    pesos idf e a pontuação de todos os artigos sai de um único produto matriz-vetor.
+    Não depende de rede nem de modelos externos. O hashing usa crc32, estável entre
+    processos, então a matriz pode ser salva/carregada (np.save / memmap).
+    """
+    
+    def __init__(self, dim=VETOR_DIM, capacidade_inicial=256):
+        self.dim = dim
+        self.matriz = np.zeros((capacidade_inicial, dim), dtype=np.float32)
+        self.df = np.zeros(dim, dtype=np.float32)  # em quantos documentos cada posição aparece
+        self.ids = []
+        self.linhas = {}  # id -> linha
+        self._lock = threading.RLock()
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def _codificar(self, texto: str) -> np.ndarray:
+        return codificar_hashing(_tokenizar(texto), self.dim)
+    
+    def _garantir_capacidade(self, n):
+        # Cresce dobrando; também converte um memmap somente leitura em array na memória
+        if n <= len(self.matriz) and self.matriz.flags.writeable:
+            return
+        nova = np.zeros((max(n, 2 * len(self.matriz), 256), self.dim), dtype=np.float32)
+        nova[:len(self.ids)] = self.matriz[:len(self.ids)]
+        self.matriz = nova
+    
+    def adicionar(self, doc_id: str, texto: str):
+        vetor = self._codificar(texto)
+        norma = np.linalg.norm(vetor)
+        if norma == 0:
+            return
+        vetor /= norma
+        
+        with self._lock:
+            linha = self.linhas.get(doc_id)
+            if linha is None:
+                linha = len(self.ids)
+                self._garantir_capacidade(linha + 1)
+                self.ids.append(doc_id)
+                self.linhas[doc_id] = linha
+            else:
+                self._garantir_capacidade(len(self.ids))
+                self.df -= self.matriz[linha] != 0
+            self.matriz[linha] = vetor
+            self.df += vetor != 0
+    
+    def buscar(self, consulta: str, k: int = 5, minimo: float = SIMILARIDADE_MINIMA,
+               ignorar: Set[str] = None) -> List[Tuple[float, str]]:
+        """Retorna até k (similaridade, id) acima de `minimo`, da mais para a menos similar"""
+        ignorar = ignorar or set()
+        vetor = self._codificar(clean_query(consulta))
+        
+        with self._lock:
+            n = len(self.ids)
+            if n == 0 or not vetor.any():
+                return []
+            
+            idf = np.log((1 + n) / (1 + self.df)) + 1
+            vetor *= idf
+            vetor /= np.linalg.norm(vetor)
+            scores = self.matriz[:n] @ vetor
+            
+            quantidade = min(n, k + len(ignorar))
+            melhores = np.argpartition(-scores, quantidade - 1)[:quantidade]
+            melhores = melhores[np.argsort(-scores[melhores])]
+            ids = self.ids
+        
+        resultados = []
+        for linha in melhores:
+            score = float(scores[linha])
+            if score < minimo:
+                break
+            if ids[linha] not in ignorar:
+                resultados.append((score, ids[linha]))
+            if len(resultados) >= k:
+                break
+        return resultados
+    
+    def salvar(self, pasta: str = VETORES_CAMINHO):
+        """Grava matriz, df e ids; os arquivos são trocados atomicamente (seguro com memmaps abertos)"""
+        os.makedirs(pasta, exist_ok=True)
+        with self._lock:
+            n = len(self.ids)
+            arquivos = {
+                "matriz.npy": self.matriz[:n],
+                "df.npy": self.df,
+            }
+            ids = list(self.ids)
+        
+        for nome, array in arquivos.items():
+            temporario = os.path.join(pasta, f".{nome}.tmp")
+            with open(temporario, "wb") as f:
+                np.save(f, array)
+            os.replace(temporario, os.path.join(pasta, nome))
+        
+        temporario = os.path.join(pasta, ".ids.json.tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "ids": ids}, f)
+        os.replace(temporario, os.path.join(pasta, "ids.json"))
+    
+    @classmethod
+    def carregar(cls, pasta: str = VETORES_CAMINHO, mmap: bool = True) -> "IndiceVetorial":
+        """Carrega um índice salvo; com mmap a matriz fica mapeada do disco até a primeira alteração"""
+        with open(os.path.join(pasta, "ids.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        
+        indice = cls(dim=meta["dim"], capacidade_inicial=1)
+        matriz = np.load(os.path.join(pasta, "matriz.npy"), mmap_mode="r" if mmap else None)
+        if matriz.shape != (len(meta["ids"]), indice.dim):
+            raise ValueError("Índice vetorial inconsistente")
+        
+        indice.matriz = matriz
+        indice.df = np.load(os.path.join(pasta, "df.npy")).astype(np.float32)
+        indice.ids = list(meta["ids"])
+        indice.linhas = {doc_id: i for i, doc_id in enumerate(indice.ids)}
+        return indice
+
+@functools.lru_cache(maxsize=None)
+def obter_indice_vetorial() -> IndiceVetorial:
+    """Índice vetorial único por processo, carregado do disco quando existir"""
+    try:
+        return IndiceVetorial.carregar(VETORES_CAMINHO)
+    except (OSError, ValueError, KeyError):
+        return IndiceVetorial()
+
+indice_vetorial = obter_indice_vetorial()
+
+def indexar_espelho_vetorial() -> int:
+    """Codifica todos os artigos do espelho no índice vetorial e salva em disco"""
+    if espelho is None:
+        return 0
+    
+    total = 0
+    for url, texto in espelho.iterar_textos():
+        indice_vetorial.adicionar(url, texto)
+        total += 1
+    indice_vetorial.salvar(VETORES_CAMINHO)
+    return total
+
+def buscar_candidatos_vetoriais(query: str, ignorar: List[str], k: int = 3) -> List[str]:
+    """Artigos já vistos (cache/espelho) semelhantes à pergunta, sem nova busca na rede"""
+    links = [doc_id for _, doc_id in indice_vetorial.buscar(query, k=k, ignorar=set(ignorar))]
+    metadados_artigos.registrar(links, "vetorial")
+    return links
+
+# ---------------------------
+# CACHE SEMÂNTICO DE RESPOSTAS
+# ---------------------------
+RESPOSTAS_TTL = int(os.getenv("RESPONDE_AI_RESPOSTAS_TTL", str(24 * 3600)))
+RESPOSTAS_MAX_ITENS = int(os.getenv("RESPONDE_AI_RESPOSTAS_MAX_ITENS", "500"))
+SIMILARIDADE_RESPOSTA = 0.8
+
+# Termos que não distinguem uma pergunta de outra (clean_query às vezes acrescenta "protheus")
+TERMOS_GENERICOS_RESPOSTA = {"protheus", "totvs", "sistema", "como", "qual", "quais", "onde", "quando",
+                             "porque", "fazer", "faco", "posso", "consigo", "preciso"}
+
+def _chaves_validadores_artigo(url: str) -> List[str]:
+    """Chaves da revalidação onde o artigo pode estar: lido pela API ou pela página"""
+    chaves = [chave_cache("validado_", normalizar_url(url), extrair_texto_html.__name__)]
+    article_id = re.search(r'/articles/(\d+)', url)
+    if article_id:
+        chaves.insert(0, chave_cache("validado_", "api", article_id.group(1)))
+    return chaves
+
+def assinatura_artigo(url: str, revalidar: bool = False) -> Optional[str]:
+    """Versão atual de um artigo por um validador durável (None se desconhecida)
+    
+    updated_at do espelho ou, para artigos lidos da rede, o updated_at/ETag/Last-Modified
+    guardado pela revalidação. Com `revalidar`, uma versão conferida há mais de CACHE_TTL é
+    conferida de novo com a central (requisição condicional; num 304 nada é baixado).
+    """
+    if espelho is not None:
+        try:
+            artigo = espelho.artigo_por_url(url)
+        except sqlite3.Error:
+            artigo = None
+        if artigo:
+            return artigo["updated_at"]
+    
+    for chave in _chaves_validadores_artigo(url):
+        validada = revalidacao.obter(chave)
+        if validada is None:
+            continue
+        if revalidar and not revalidacao.fresca(validada):
+            extrair_conteudo_pagina(url, usar_espelho=False)
+            validada = revalidacao.obter(chave)
+            if validada is None or not revalidacao.fresca(validada):
+                return None  # Não deu para conferir: versão desconhecida
+        return validada["updated_at"] or validada["etag"] or validada["last_modified"]
+    return None
+
+class CacheRespostas:
+    """Respostas já geradas, reaproveitadas para perguntas iguais ou quase iguais
+    
+    A busca é exata pela consulta normalizada e, em seguida, por similaridade de cosseno
+    entre vetores de hashing das consultas. Perguntas com identificadores diferentes
+    (ex.: MV_ESTNEG x MV_ESTPOS) nunca são consideradas semelhantes. Uma entrada vale
+    até o TTL e deixa de valer quando algum dos artigos usados na resposta mudou ou quando
+    não dá para saber a versão atual de algum deles (ver assinatura_artigo).
+    """
+    
+    def __init__(self, ttl=RESPOSTAS_TTL, max_itens=RESPOSTAS_MAX_ITENS, dim=VETOR_DIM):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.dim = dim
+        self.entradas = OrderedDict()  # chave -> entrada
+        self._lock = threading.RLock()
+        self._stats = {"hits_exatos": 0, "hits_semelhantes": 0, "misses": 0, "expirados": 0, "invalidados": 0}
+    
+    def __len__(self):
+        return len(self.entradas)
+    
+    @staticmethod
+    def _termos(consulta: str) -> List[str]:
+        # Sem acentos e com radical grosseiro (6 letras): "configuro"/"configurar", "parametro"/"parâmetro"
+        texto = _sem_acentos(clean_query(consulta))
+        return [t if CacheRespostas._identificador(t) else t[:6]
+                for t in _tokenizar(texto) if t not in TERMOS_GENERICOS_RESPOSTA]
+    
+    @staticmethod
+    def _identificador(termo: str) -> bool:
+        # Parâmetros, tabelas, rotinas e códigos de erro: precisam coincidir exatamente
+        return "_" in termo or any(c.isdigit() for c in termo)
+    
+    @staticmethod
+    def _identificadores(termos: List[str]) -> frozenset:
+        return frozenset(t for t in termos if CacheRespostas._identificador(t))
+    
+    def _vetor(self, termos: List[str]):
+        # Só unigramas: a ordem das palavras varia muito entre formas de perguntar a mesma coisa
+        vetor = codificar_hashing(termos, self.dim, bigramas=False)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else None
+    
+    def _remover(self, chave, motivo):
+        if self.entradas.pop(chave, None) is not None:
+            self._stats[motivo] += 1
+    
+    def _candidata(self, consulta: str, perfil: tuple, limiar: float):
+        """Melhor entrada vigente para a consulta: (chave, entrada, similaridade, exata) ou None"""
+        chave = chave_cache("resposta_", perfil, normalizar_consulta(consulta))
+        agora = time.time()
+        
+        with self._lock:
+            entrada = self.entradas.get(chave)
+            if entrada is not None and agora - entrada["criado_em"] < self.ttl:
+                return chave, entrada, 1.0, True
+            
+            termos = self._termos(consulta)
+            vetor = self._vetor(termos)
+            if vetor is None:
+                return None
+            identificadores = self._identificadores(termos)
+            
+            candidatas = []
+            for chave_entrada, entrada in list(self.entradas.items()):
+                if agora - entrada["criado_em"] >= self.ttl:
+                    self._remover(chave_entrada, "expirados")
+                elif entrada["perfil"] == perfil and entrada["identificadores"] == identificadores:
+                    candidatas.append((chave_entrada, entrada))
+            if not candidatas:
+                return None
+            
+            similaridades = np.stack([entrada["vetor"] for _, entrada in candidatas]) @ vetor
+            melhor = int(np.argmax(similaridades))
+            if similaridades[melhor] < limiar:
+                return None
+            chave_entrada, entrada = candidatas[melhor]
+            return chave_entrada, entrada, float(similaridades[melhor]), False
+    
+    def buscar(self, consulta: str, perfil: tuple, limiar: float = SIMILARIDADE_RESPOSTA):
+        """Resposta armazenada para a consulta (ou uma semelhante acima do limiar), se ainda válida"""
+        if _cache_ignorado.get():
+            return None
+        
+        encontrada = self._candidata(consulta, perfil, limiar)
+        if encontrada is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        
+        chave, entrada, similaridade, exata = encontrada
+        
+        # Fora do lock: a verificação consulta o espelho e, se preciso, revalida os artigos na central
+        if any(versao is None or assinatura_artigo(url, revalidar=True) != versao
+               for url, versao in entrada["versoes"].items()):
+            with self._lock:
+                self._remover(chave, "invalidados")
+                self._stats["misses"] += 1
+            return None
+        
+        with self._lock:
+            if chave in self.entradas:
+                self.entradas.move_to_end(chave)
+            self._stats["hits_exatos" if exata else "hits_semelhantes"] += 1
+        return {**entrada, "similaridade": similaridade}
+    
+    def guardar(self, consulta: str, perfil: tuple, resposta: str, fontes: List[str], versoes: Dict[str, str]):
+        """Guarda a resposta com a versão de cada fonte; sem a versão de alguma, não há como invalidá-la"""
+        if _cache_ignorado.get() or None in versoes.values():
+            return
+        
+        termos = self._termos(consulta)
+        vetor = self._vetor(termos)
+        if vetor is None:
+            return
+        
+        chave = chave_cache("resposta_", perfil, normalizar_consulta(consulta))
+        with self._lock:
+            self.entradas.pop(chave, None)
+            self.entradas[chave] = {
+                "consulta": normalizar_consulta(consulta),
+                "perfil": perfil,
+                "identificadores": self._identificadores(termos),
+                "vetor": vetor,
+                "resposta": resposta,
+                "fontes": list(fontes),
+                "versoes": dict(versoes),
+                "criado_em": time.time(),
+            }
+            while len(self.entradas) > self.max_itens:
+                self.entradas.popitem(last=False)
+    
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {"itens": len(self.entradas), **self._stats}
+    
+    def clear(self):
+        with self._lock:
+            self.entradas.clear()
+
+@functools.lru_cache(maxsize=None)
+def obter_cache_respostas() -> CacheRespostas:
+    """Cache de respostas único por processo"""
+    return CacheRespostas()
+
+cache_respostas = obter_cache_respostas()
+
+# ---------------------------
+# REGISTRO DE CLIENTES DE IA
+# ---------------------------
+# Configurações de segurança relaxadas (montadas uma vez e compartilhadas por todos os modelos)
+GEMINI_SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+# Configuração de geração por finalidade; a temperatura da resposta é passada a cada chamada
+GEMINI_GENERATION_CONFIG = {
+    "resposta": {
+        "temperature": 0.1,
+        "top_p": 0.8,
+        "top_k": 40,
+        "max_output_tokens": 3600,  # AUMENTADO: de 1024 para 3600 tokens
+    },
+    "reclassificacao": {
+        "temperature": 0.0,
+        "max_output_tokens": 2000,
+    },
+}
+
+# Endpoint compatível com a API da OpenAI (ex.: simulador.py); vazio usa o padrão do SDK
+BASE_OPENAI = os.getenv("RESPONDE_AI_BASE_OPENAI") or None
+
+# Combinações (provedor, chave, modelo) mantidas no registro; as usadas há mais tempo saem primeiro
+MAX_CLIENTES_IA = int(os.getenv("RESPONDE_AI_MAX_CLIENTES_IA", "32"))
+
+class RegistroClientesIA:
+    """Clientes Gemini/OpenAI construídos uma vez por (provedor, chave, modelo) e reutilizados entre sessões
+    
+    O Gemini não usa genai.configure (global ao processo, sujeito a corrida entre sessões com
+    chaves diferentes): cada chave tem seu próprio GenerativeServiceClient, compartilhado
+    pelos modelos daquela chave. A construção acontece fora do lock: só quem pede a mesma
+    combinação espera por ela.
+    """
+    
+    def __init__(self, max_clientes: int = MAX_CLIENTES_IA):
+        self.max_clientes = max_clientes
+        self._clientes = OrderedDict()  # (provedor, hash da chave, modelo) -> cliente (LRU)
+        self._construindo = {}  # (provedor, hash da chave, modelo) -> Future do cliente em construção
+        self._servicos_gemini = OrderedDict()  # hash da chave -> GenerativeServiceClient (LRU)
+        self._stats = {}  # (provedor, hash da chave, modelo) -> contadores
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _hash_chave(api_key: str) -> str:
+        # A chave em si não fica como chave de dicionário nem aparece nas métricas
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    
+    def _obter(self, provedor: str, api_key: str, modelo: str, construtor):
+        chave = (provedor, self._hash_chave(api_key), modelo)
+        with self._lock:
+            stats = self._stats.setdefault(chave, {"chamadas": 0, "construcoes": 0, "tempo_construcao": 0.0})
+            stats["chamadas"] += 1
+            cliente = self._clientes.get(chave)
+            if cliente is not None:
+                self._clientes.move_to_end(chave)
+                return cliente
+            futuro = self._construindo.get(chave)
+            construir = futuro is None
+            if construir:
+                futuro = self._construindo[chave] = Future()
+        
+        if not construir:
+            return futuro.result()  # Outra thread já está construindo o mesmo cliente
+        
+        try:
+            inicio = time.perf_counter()
+            cliente = construtor()
+            duracao = time.perf_counter() - inicio
+        except BaseException as e:
+            with self._lock:
+                del self._construindo[chave]
+                if chave not in self._clientes:
+                    self._stats.pop(chave, None)  # Chaves inválidas não acumulam contadores
+            futuro.set_exception(e)
+            raise
+        
+        with self._lock:
+            del self._construindo[chave]
+            self._clientes[chave] = cliente
+            stats = self._stats.setdefault(chave, {"chamadas": 1, "construcoes": 0, "tempo_construcao": 0.0})
+            stats["construcoes"] += 1
+            stats["tempo_construcao"] += duracao
+            while len(self._clientes) > self.max_clientes:
+                antiga, _ = self._clientes.popitem(last=False)
+                self._stats.pop(antiga, None)
+        futuro.set_result(cliente)
+        return cliente
+    
+    def _servico_gemini(self, api_key: str):
+        from google.ai import generativelanguage as glm
+        chave = self._hash_chave(api_key)
+        with self._lock:
+            servico = self._servicos_gemini.get(chave)
+            if servico is not None:
+                self._servicos_gemini.move_to_end(chave)
+                return servico
+        
+        # Construído fora do lock; se duas threads construírem ao mesmo tempo, fica o primeiro
+        novo = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        with self._lock:
+            servico = self._servicos_gemini.setdefault(chave, novo)
+            while len(self._servicos_gemini) > self.max_clientes:
+                self._servicos_gemini.popitem(last=False)
+        return servico
+    
+    def gemini(self, api_key: str, modelo: str) -> Dict[str, object]:
+        """Modelos Gemini prontos, um por finalidade (ver GEMINI_GENERATION_CONFIG)"""
+        def construir():
+            import google.generativeai as genai
+            servico = self._servico_gemini(api_key)
+            modelos = {}
+            for finalidade, generation_config in GEMINI_GENERATION_CONFIG.items():
+                gemini_model = genai.GenerativeModel(
+                    model_name=modelo,
+                    generation_config=generation_config,
+                    safety_settings=GEMINI_SAFETY_SETTINGS
+                )
+                # _client é interno ao SDK (versão fixada em requirements.txt); se sumir numa
+                # versão nova, volta para genai.configure em vez de quebrar em silêncio
+                if hasattr(gemini_model, "_client"):
+                    gemini_model._client = servico
+                else:
+                    logger.warning("google-generativeai sem GenerativeModel._client: usando genai.configure "
+                                   "(a chave passa a ser global ao processo)")
+                    genai.configure(api_key=api_key)
+                modelos[finalidade] = gemini_model
+            return modelos
+        
+        return self._obter("gemini", api_key, modelo, construir)
+    
+    def openai(self, api_key: str, modelo: str):
+        """Cliente OpenAI (com seu pool de conexões HTTP) reutilizado entre chamadas"""
+        def construir():
+            from openai import OpenAI
+            return OpenAI(api_key=api_key, base_url=BASE_OPENAI)
+        
+        return self._obter("openai", api_key, modelo, construir)
+    
+    def estatisticas(self, api_key: str = None) -> List[dict]:
+        """Contadores por (provedor, modelo); com `api_key`, só os dessa chave (um usuário não vê os outros)"""
+        filtro = None if api_key is None else self._hash_chave(api_key)
+        with self._lock:
+            return [
+                {"provedor": provedor, "modelo": modelo, **stats}
+                for (provedor, hash_chave, modelo), stats in self._stats.items()
+                if filtro is None or hash_chave == filtro
+            ]
+    
+    def clear(self):
+        with self._lock:
+            self._clientes.clear()
+            self._servicos_gemini.clear()
+
+@functools.lru_cache(maxsize=None)
+def obter_registro_ia() -> RegistroClientesIA:
+    """Registro de clientes de IA único por processo"""
+    return RegistroClientesIA()
+
+registro_ia = obter_registro_ia()
+
+def cliente_gemini(api_key: str, modelo: str, finalidade: str):
+    """GenerativeModel reutilizável para a finalidade ("resposta" ou "reclassificacao")"""
+    return registro_ia.gemini(api_key, modelo)[finalidade]
+
+def cliente_openai(api_key: str, modelo: str):
+    cliente = registro_ia.openai(api_key, modelo)
+    # Com prazo, sem as retentativas do SDK: cada uma esperaria o timeout inteiro de novo.
+    # with_options copia o cliente, mas mantém o mesmo pool de conexões
+    return cliente if tempo_restante() is None else cliente.with_options(max_retries=0)
+
+# ---------------------------
+# SISTEMA IA MELHORADO COM TRATAMENTO DE ERROS
+# ---------------------------
+# Tokens das instruções fixas do prompt de reclassificação (sem pergunta e artigos)
+TOKENS_INSTRUCOES_RECLASSIFICACAO = 150
+
+def montar_artigos_reclassificacao(artigos: List[Tuple[float, str, str]], query: str, contador: ContadorTokens,
+                                   orcamento_tokens: int = ORCAMENTO_TOKENS_RECLASSIFICACAO) -> Tuple[str, int]:
+    """Monta a lista de artigos do prompt de reclassificação dividindo o orçamento de tokens entre eles"""
+    fixos = TOKENS_INSTRUCOES_RECLASSIFICACAO + contador.contar(query)
+    por_artigo = max((orcamento_tokens - fixos) // len(artigos), 30)
+    
+    artigos_info = []
+    for score, url, conteudo in artigos:
+        titulo = url.split('/')[-1].replace('-', ' ')[:100]
+        cabecalho = f"URL: {url}\nTítulo: {titulo}\nConteúdo: "
+        if conteudo and len(conteudo) > 50:
+            preview = contador.truncar(conteudo, por_artigo - contador.contar(cabecalho))
+            preview = preview + "..." if len(preview) < len(conteudo) else preview
+        else:
+            preview = "Conteúdo não disponível"
+        artigos_info.append(f"{cabecalho}{preview}\n---")
+    
+    artigos_texto = "\n".join(artigos_info)
+    return artigos_texto, fixos + contador.contar(artigos_texto)
+
+def _ordenar_por_urls(artigos: List[Tuple[float, str, str]], urls: List[str]) -> List[Tuple[float, str, str]]:
+    posicao = {url: i for i, url in enumerate(urls)}
+    return sorted(artigos, key=lambda artigo: posicao.get(artigo[1], len(posicao)))
+
+# ---------------------------
+# RECLASSIFICAÇÃO LOCAL (SEM IA)
+# ---------------------------
+# Confiabilidade de cada estratégia de busca como sinal de relevância
+PESO_ORIGEM = {"espelho": 1.0, "api": 0.9, "interna": 0.7, "duckduckgo": 0.6, "vetorial": 0.5}
+PESO_ORIGEM_DESCONHECIDA = 0.5
+
+# Pesos das características na pontuação local (somam 1)
+PESOS_RECLASSIFICACAO = {"lexico": 0.55, "titulo": 0.15, "tecnicos": 0.15, "origem": 0.08, "frescor": 0.07}
+
+# Abaixo desta diferença entre o 1º e o 2º colocados a ordem local é incerta e a IA é consultada
+MARGEM_RECLASSIFICACAO = 0.1
+
+MEIA_VIDA_FRESCOR_DIAS = 365
+
+def _sem_acentos(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+def _termos_comparaveis(texto: str) -> Set[str]:
+    """Termos sem acento, só letras/dígitos, com radical grosseiro de 6 letras (slug x pergunta)"""
+    texto = _sem_acentos(texto.lower())
+    return {t[:6] for t in re.findall(r"[a-z0-9]+", texto) if len(t) >= 2 and t not in TERMOS_GENERICOS_RESPOSTA}
+
+def _termos_do_slug(url: str) -> Set[str]:
+    # .../articles/360012345-Como-configurar-o-parametro-MV-ESTNEG -> título aproximado
+    caminho = urllib.parse.unquote(urllib.parse.urlsplit(url).path)
+    slug = re.sub(r"^\d+-?", "", caminho.rstrip("/").rsplit("/", 1)[-1])
+    return _termos_comparaveis(slug)
+
+def _frescor(updated_at: str) -> float:
+    """1.0 para artigo recém-atualizado, caindo pela metade a cada MEIA_VIDA_FRESCOR_DIAS"""
+    try:
+        atualizado = datetime.fromisoformat(updated_at.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return 0.5
+    if atualizado.tzinfo is None:
+        atualizado = atualizado.replace(tzinfo=timezone.utc)
+    dias = max((datetime.now(timezone.utc) - atualizado).total_seconds() / 86400, 0)
+    return 0.5 ** (dias / MEIA_VIDA_FRESCOR_DIAS)
+
+def caracteristicas_artigo(score: float, url: str, texto: str, termos_consulta: Set[str],
+                           tecnicos_consulta: Set[str]) -> Dict[str, float]:
+    """Características baratas (0 a 1) de um artigo candidato para a pergunta"""
+    meta = metadados_artigos.obter(url)
+    updated_at = meta["updated_at"]
+    if updated_at is None and espelho is not None:
+        try:
+            artigo = espelho.artigo_por_url(url)
+            updated_at = artigo["updated_at"] if artigo else None
+        except sqlite3.Error:
+            pass
+    
+    texto_minusculo = _sem_acentos(texto.lower()) if conteudo_valido(texto) else ""
+    return {
+        "lexico": score,
+        "titulo": len(termos_consulta & _termos_do_slug(url)) / len(termos_consulta) if termos_consulta else 0.0,
+        "tecnicos": (sum(1 for t in tecnicos_consulta if t in texto_minusculo) / len(tecnicos_consulta)
+                     if tecnicos_consulta else 0.0),
+        "origem": max((PESO_ORIGEM.get(o, PESO_ORIGEM_DESCONHECIDA) for o in meta["origens"]),
+                      default=PESO_ORIGEM_DESCONHECIDA),
+        "frescor": _frescor(updated_at),
+    }
+
+def reclassificar_local(artigos: List[Tuple[float, str, str]], query: str) -> Tuple[List[Tuple[float, str, str]], float]:
+    """Ordena os artigos por uma combinação linear de características locais
+    
+    Retorna (artigos ordenados, margem), onde margem é a diferença de pontuação entre o
+    1º e o 2º colocados. Os scores das tuplas (BM25) são mantidos.
+    """
+    if len(artigos) <= 1:
+        return list(artigos), 1.0
+    
+    consulta = clean_query(query)
+    termos_consulta = _termos_comparaveis(consulta)
+    tecnicos_consulta = {_sem_acentos(t) for t in _tokenizar(consulta)
+                         if t in PALAVRAS_TECNICAS or "_" in t or any(c.isdigit() for c in t)}
+    
+    pontuados = []
+    for i, (score, url, texto) in enumerate(artigos):
+        if not conteudo_valido(texto):
+            pontuados.append((-1.0, i, (score, url, texto)))
+            continue
+        caracteristicas = caracteristicas_artigo(score, url, texto, termos_consulta, tecnicos_consulta)
+        pontuacao = sum(PESOS_RECLASSIFICACAO[nome] * valor for nome, valor in caracteristicas.items())
+        pontuados.append((pontuacao, i, (score, url, texto)))
+    
+    # Empate: mantém a ordem original (prioridade das estratégias de busca)
+    pontuados.sort(key=lambda x: (-x[0], x[1]))
+    margem = pontuados[0][0] - pontuados[1][0]
+    return [artigo for _, _, artigo in pontuados], margem
+
+@functools.lru_cache(maxsize=None)
+def obter_metricas_reclassificacao() -> dict:
+    """Quantas vezes a reclassificação por IA foi feita ou dispensada (por processo)"""
+    return {"ia": 0, "local": 0, "lock": threading.Lock()}
+
+def registrar_reclassificacao(tipo: str):
+    metricas = obter_metricas_reclassificacao()
+    with metricas["lock"]:
+        metricas[tipo] += 1
+
+def reclassificar_artigos_ia(artigos: List[Tuple[float, str, str]], query: str, use_gemini: bool, api_key: str, modelo: str,
+                             orcamento_tokens: int = ORCAMENTO_TOKENS_RECLASSIFICACAO) -> List[Tuple[float, str, str]]:
+    """Usa IA para reclassificar os artigos por relevância
+    
+    O cache guarda apenas a ordem dos URLs (não o texto dos artigos). Essa ordem também é o que
+    uma reclassificação em andamento entrega às chamadas simultâneas com a mesma chave. Se a IA
+    falhar, responder algo sem URLs ou o prazo acabar, os artigos voltam na ordem recebida (a do
+    reclassificador local) e nada vai para o cache.
+    """
+    if not artigos or len(artigos) <= 1:
+        return artigos
+    
+    cache_key = chave_cache("reclass_", normalizar_consulta(query), [url for _, url, _ in artigos], use_gemini, modelo)
+    cached = cache.get(cache_key)
+    if cached:
+        return _ordenar_por_urls(artigos, cached)
+    
+    def reclassificar():
+        try:
+            contador = ContadorTokens(use_gemini, modelo)
+            artigos_texto, _ = montar_artigos_reclassificacao(artigos, query, contador, orcamento_tokens)
+            
+            if use_gemini:
+                resposta = reclassificar_gemini(query, artigos_texto, modelo, api_key)
+            else:
+                resposta = reclassificar_openai(query, artigos_texto, modelo, api_key)
+            
+            artigos_ordenados = processar_resposta_reclassificacao(resposta, artigos)
+        except Exception as e:
+            avisar(f"Erro na reclassificação por IA: {e}", "error")
+            return None
+        
+        if not artigos_ordenados:
+            return None
+        urls = [url for _, url, _ in artigos_ordenados]
+        cache.set(cache_key, urls)
+        return urls
+    
+    urls = em_voo.executar(cache_key, reclassificar)
+    if urls is None:  # IA sem resposta útil, ou o prazo acabou esperando a de outra pergunta
+        return artigos
+    return _ordenar_por_urls(artigos, urls)
+
+def reclassificar_gemini(query: str, artigos_texto: str, model: str, api_key: str) -> str:
+    """Reclassifica artigos usando Gemini com tratamento robusto de erros"""
+    try:
+        prompt = f"""
+        Analise estes artigos da documentação TOTVS e ordene-os por relevância para a pergunta do usuário.
+        
+        PERGUNTA DO USUÁRIO: {query}
+        
+        ARTIGOS ENCONTRADOS:
+        {artigos_texto}
+        
+        INSTRUÇÕES:
+        1. Analise cada artigo em relação à pergunta
+        2. Ordene do MAIS RELEVANTE para o MENOS RELEVANTE  
+        3. Retorne APENAS os URLs em ordem de relevância, um por linha
+        4. Não inclua explicações, apenas a lista ordenada de URLs
+        5. Se não puder determinar a relevância, retorne os URLs na ordem original
+        
+        URLs ORDENADOS:
+        """
+        
+        # Usar modelo mais estável
+        if model not in ["gemini-2.5-flash", "gemini-2.5-pro"]:
+            model = "gemini-pro"
+            
+        gemini_model = cliente_gemini(api_key, model, "reclassificacao")
+        
+        with medir_llm("gemini", "reclassificacao", "bloqueante"):
+            response = gemini_model.generate_content([prompt], **opcoes_prazo_ia("gemini"))
+        
+        # Tratamento robusto da resposta
+        if response and response.parts:
+            return response.text.strip()
+        elif response and response.candidates:
+            # Tentar extrair texto dos candidatos
+            for candidate in response.candidates:
+                if candidate.content and candidate.content.parts:
+                    return candidate.content.parts[0].text.strip()
+        
+        return ""  # Retorna string vazia em caso de erro
+        
+    except Exception as e:
+        avisar(f"Aviso Gemini: {e}")
+        return ""  # Retorna string vazia em caso de erro
+
+def reclassificar_openai(query: str, artigos_texto: str, model: str, api_key: str) -> str:
+    """Reclassifica artigos usando OpenAI"""
+    try:
+        client = cliente_openai(api_key, model)
+        
+        prompt = f"""
+        Analise estes artigos da documentação TOTVS e ordene-os por relevância para a pergunta do usuário.
+        
+        PERGUNTA DO USUÁRIO: {query}
+        
+        ARTIGOS ENCONTRADOS:
+        {artigos_texto}
+        
+        INSTRUÇÕES:
+        1. Analise cada artigo em relação à pergunta
+        2. Ordene do MAIS RELEVANTE para o MENOS RELEVANTE
+        3. Retorne APENAS os URLs em ordem de relevância, um por linha
+        4. Não inclua explicações, apenas a lista ordenada de URLs
+        """
+        
+        with medir_llm("openai", "reclassificacao", "bloqueante"):
+            resp = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "Você é um especialista em classificar documentação técnica por relevância."},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=0.0,
+                max_tokens=500,
+                **opcoes_prazo_ia("openai"),
+            )
+        return resp.choices[0].message.content.strip()
+    except Exception as e:
+        raise Exception(f"Erro OpenAI: {e}")
+
+def processar_resposta_reclassificacao(resposta_ia: str, artigos_originais: List[Tuple[float, str, str]]) -> List[Tuple[float, str, str]]:
+    """Processa a resposta da IA e reordena os artigos ([] se ela não cita nenhum dos artigos)"""
+    if not resposta_ia:
+        return []
+    
+    # Extrair URLs da resposta
+    urls_ordenados = []
+    for linha in resposta_ia.split('\n'):
+        linha = linha.strip()
+        if linha.startswith('http'):
+            urls_ordenados.append(linha)
+    
+    # Criar mapa de artigos por URL
+    artigo_por_url = {url: (score, url, conteudo) for score, url, conteudo in artigos_originais}
+    
+    # Reordenar baseado na classificação da IA
+    artigos_ordenados = []
+    for url in urls_ordenados:
+        if url in artigo_por_url:
+            artigos_ordenados.append(artigo_por_url[url])
+    if not artigos_ordenados:
+        return []
+    
+    # Adicionar quaisquer artigos que não foram classificados pela IA
+    urls_adicionados = set(urls_ordenados)
+    for artigo in artigos_originais:
+        if artigo[1] not in urls_adicionados:
+            artigos_ordenados.append(artigo)
+    
+    return artigos_ordenados
+
+def formatar_links_saiba_mais(links: List[str]) -> str:
+    """Formata os links para a seção Saiba Mais"""
+    if not links:
+        return ""
+    
+    padroes_de_remocao = ["-Cross", "-CROSS", "-RH", "-MP", "-Logística", "-Framework", "-LOG", "-FIN", "-FAT", "-CRM"]
+    
+    links_formatados = []
+    for link in links:
+        link_limpo = link
+        for padrao in padroes_de_remocao:
+            posicao = link.find(padrao)
+            if posicao != -1:
+                link_limpo = link[:posicao]
+                break
+        links_formatados.append(link_limpo)
+    
+    # Remover duplicatas mantendo a ordem
+    links_unicos = []
+    for link in links_formatados:
+        if link not in links_unicos:
+            links_unicos.append(link)
+    
+    # Formatar a seção Saiba Mais
+    saiba_mais = "\n\n**🔗 Saiba mais:**\n"
+    for i, link in enumerate(links_unicos[:5], 1):  # Limitar a 5 links
+        saiba_mais += f"{i}. {link}\n"
+    
+    return saiba_mais
+
+SYSTEM_PROMPT_RESPOSTA = (
+    "Você é um analista de suporte especializado no ERP Protheus da TOTVS.\n"
+    "Responda de forma técnica, precisa e baseada exclusivamente no contexto fornecido.\n"
+    "- Se a informação não estiver no contexto, responda apenas: \"Não encontrei essa informação na documentação oficial\".\n"
+    "- Seja objetivo e inclua passos acionáveis quando aplicável.\n"
+    "- Forneça respostas RESUMIDA, não corte informações importantes.\n"
+    "- NÃO inclua a seção 'Fontes consultadas' no final - isso será adicionado automaticamente.\n"
+)
+
+# Tokens das instruções fixas em torno de pergunta/contexto/fontes nos prompts de resposta
+TOKENS_INSTRUCOES_RESPOSTA = 60
+
+def tokens_fixos_resposta(contador: ContadorTokens, query: str, fontes: List[str]) -> int:
+    """Parte do prompt de resposta que não é contexto (usada para descontar do orçamento)"""
+    return (contador.contar(SYSTEM_PROMPT_RESPOSTA) + contador.contar(query)
+            + contador.contar("\n".join(fontes)) + TOKENS_INSTRUCOES_RESPOSTA)
+
+class RespostaFalha(str):
+    """Texto mostrado no lugar da resposta quando a IA não gerou uma (erro, resposta vazia, sem contexto)
+    
+    É o sinal de falha das funções de geração: quem as consome confere
+    isinstance(texto, RespostaFalha) (em cada pedaço, no streaming) em vez de procurar
+    trechos no texto. Resposta com falha não ganha "Saiba mais" nem vai para o cache.
+    """
+
+def _filtrar_contexto(context: str):
+    """Retorna (contexto, mensagem); a mensagem é preenchida quando não há contexto utilizável"""
+    # Filtrar contexto removendo mensagens de erro
+    if "erro 403" in context.lower() or "acesso negado" in context.lower():
+        context = "Conteúdo não disponível devido a restrições de acesso."
+    
+    if not context or not context.strip() or context == "Conteúdo não disponível devido a restrições de acesso.":
+        return context, RespostaFalha("Não encontrei essa informação na documentação oficial devido a restrições de acesso.")
+    return context, None
+
+def get_ai_response(query: str, context: str, fontes: List[str], modelo: str, use_gemini: bool, api_key: str, temperatura: float):
+    """Função unificada que escolhe entre Gemini e ChatGPT com tratamento robusto"""
+    context, mensagem = _filtrar_contexto(context)
+    if mensagem:
+        return mensagem
+
+    try:
+        if use_gemini:
+            return get_gemini_response_robusto(query, context, fontes, modelo, api_key, temperatura)
+        else:
+            return get_chatgpt_response(query, context, fontes, modelo, api_key, temperatura)
+    except Exception as e:
+        return RespostaFalha(f"Erro ao processar a resposta: {str(e)}")
+
+def get_ai_response_stream(query: str, context: str, fontes: List[str], modelo: str, use_gemini: bool, api_key: str, temperatura: float):
+    """Versão em streaming de get_ai_response: gera a resposta em pedaços conforme chegam"""
+    context, mensagem = _filtrar_contexto(context)
+    if mensagem:
+        yield mensagem
+        return
+
+    try:
+        if use_gemini:
+            yield from get_gemini_response_stream(query, context, fontes, modelo, api_key, temperatura)
+        else:
+            yield from get_chatgpt_response_stream(query, context, fontes, modelo, api_key, temperatura)
+    except Exception as e:
+        yield RespostaFalha(f"Erro ao processar a resposta: {str(e)}")
+
+def _modelo_gemini_resposta(model: str, api_key: str):
+    """Modelo de resposta do Gemini (reutilizado pelo registro de clientes)"""
+    # Usar modelo mais estável
+    if model not in ["gemini-2.5-flash", "gemini-2.5-pro"]:
+        model = "gemini-2.5-flash"
+    return cliente_gemini(api_key, model, "resposta")
+
+def _config_resposta_gemini(temperatura: float) -> dict:
+    return {"temperature": min(temperatura, 0.7)}  # Limitar temperatura para evitar problemas
+
+def _prompt_gemini(query: str, context: str, fontes: List[str]) -> str:
+    return (
+        f"{SYSTEM_PROMPT_RESPOSTA}\n\n"
+        f"PERGUNTA DO USUÁRIO:\n{query}\n\n"
+        f"CONTEÚDO EXTRAÍDO:\n{context}\n\n"
+        "INSTRUÇÃO IMPORTANTE: Forneça uma resposta COMPLETA sem cortes. Se necessário, use parágrafos claros e organizados.\n\n"
+        "Fontes disponíveis:\n" + "\n".join(fontes)
+    )
+
+def _mensagens_chatgpt(query: str, context: str, fontes: List[str]) -> List[dict]:
+    user_content = f"PERGUNTA DO USUÁRIO:\n{query}\n\nCONTEÚDO EXTRAÍDO:\n{context}\n\nINSTRUÇÃO: Forneça resposta COMPLETA sem cortes.\n\nFontes disponíveis:\n" + "\n".join(fontes)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT_RESPOSTA},
+        {"role": "user", "content": user_content},
+    ]
+
+def get_gemini_response_robusto(query: str, context: str, fontes: List[str], model: str, api_key: str, temperatura: float):
+    """Versão robusta do Gemini com tratamento completo de erros"""
+    try:
+        gemini_model = _modelo_gemini_resposta(model, api_key)
+        with medir_llm("gemini", "resposta", "bloqueante"):
+            response = gemini_model.generate_content(
+                [_prompt_gemini(query, context, fontes)],
+                generation_config=_config_resposta_gemini(temperatura),
+                **opcoes_prazo_ia("gemini")
+            )
+        
+        # Tratamento robusto da resposta
+        if response and response.parts:
+            return response.text.strip()
+        elif response and response.candidates:
+            for candidate in response.candidates:
+                if candidate.content and candidate.content.parts:
+                    return candidate.content.parts[0].text.strip()
+        
+        # Fallback se a resposta estiver vazia
+        return RespostaFalha("Não foi possível gerar uma resposta para esta consulta.")
+        
+    except Exception as e:
+        return RespostaFalha(f"Erro ao processar a solicitação: {str(e)}")
+
+def get_gemini_response_stream(query: str, context: str, fontes: List[str], model: str, api_key: str, temperatura: float):
+    """Gemini em streaming (generate_content com stream=True)"""
+    try:
+        gemini_model = _modelo_gemini_resposta(model, api_key)
+        gerou = False
+        with medir_llm("gemini", "resposta", "stream") as medicao:
+            response = gemini_model.generate_content(
+                [_prompt_gemini(query, context, fontes)],
+                generation_config=_config_resposta_gemini(temperatura),
+                stream=True,
+                **opcoes_prazo_ia("gemini")
+            )
+            
+            for chunk in response:
+                try:
+                    texto = chunk.text
+                except ValueError:
+                    continue  # Pedaço sem partes de texto (ex.: apenas metadados)
+                if texto:
+                    if not gerou:
+                        metricas_latencia.observar(HIST_PRIMEIRO_TOKEN, medicao.decorrido(),
+                                                   provedor="gemini", finalidade="resposta")
+                    gerou = True
+                    yield texto
+        
+        if not gerou:
+            yield RespostaFalha("Não foi possível gerar uma resposta para esta consulta.")
+        
+    except Exception as e:
+        yield RespostaFalha(f"Erro ao processar a solicitação: {str(e)}")
+
+def get_chatgpt_response(query: str, context: str, fontes: List[str], model: str, api_key: str, temperatura: float):
+    try:
+        client = cliente_openai(api_key, model)
+        
+        with medir_llm("openai", "resposta", "bloqueante"):
+            resp = client.chat.completions.create(
+                model=model,
+                messages=_mensagens_chatgpt(query, context, fontes),
+                temperature=temperatura,
+                max_tokens=3060,  # AUMENTADO: de 512 para 3060 tokens
+                **opcoes_prazo_ia("openai"),
+            )
+        return resp.choices[0].message.content.strip()
+    except Exception as e:
+        return RespostaFalha(f"Erro ao gerar resposta com OpenAI: {e}")
+
+def get_chatgpt_response_stream(query: str, context: str, fontes: List[str], model: str, api_key: str, temperatura: float):
+    """ChatGPT em streaming (chat.completions com stream=True)"""
+    try:
+        client = cliente_openai(api_key, model)
+        
+        gerou = False
+        with medir_llm("openai", "resposta", "stream") as medicao:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=_mensagens_chatgpt(query, context, fontes),
+                temperature=temperatura,
+                max_tokens=3060,
+                stream=True,
+                **opcoes_prazo_ia("openai"),
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not gerou:
+                        metricas_latencia.observar(HIST_PRIMEIRO_TOKEN, medicao.decorrido(),
+                                                   provedor="openai", finalidade="resposta")
+                        gerou = True
+                    yield chunk.choices[0].delta.content
+    except Exception as e:
+        yield RespostaFalha(f"Erro ao gerar resposta com OpenAI: {e}")
+
+def medir_primeiro_token(gerador, latencia: dict, inicio: float = None):
+    """Repassa os pedaços do gerador registrando em `latencia` o tempo até o primeiro token e o total
+    
+    Os tempos contam de `inicio` (time.perf_counter; padrão: agora), ex.: o início da pergunta.
+    """
+    inicio = time.perf_counter() if inicio is None else inicio
+    latencia["primeiro_token"] = None
+    try:
+        for pedaco in gerador:
+            if pedaco and latencia["primeiro_token"] is None:
+                latencia["primeiro_token"] = time.perf_counter() - inicio
+            yield pedaco
+    finally:
+        latencia["total"] = time.perf_counter() - inicio  # Também quando o consumo é interrompido
+
+class RespostaEspeculativa:
+    """Gera a resposta em segundo plano (ex.: enquanto a reclassificação por IA roda)
+    
+    Os pedaços ficam em buffer e podem ser consumidos depois com `pedacos()`, mesmo
+    com a geração ainda em andamento. `cancelar()` interrompe o consumo do stream.
+    """
+    
+    def __init__(self, gerador_fabrica):
+        self._pedacos = []
+        self._cond = threading.Condition()
+        self._cancelada = False
+        self.concluida = False
+        self.inicio = time.perf_counter()
+        self.fim = None
+        contexto = contextvars.copy_context()
+        self._thread = threading.Thread(target=contexto.run, args=(self._executar, gerador_fabrica),
+                                        name="resposta-antecipada", daemon=True)
+        self._thread.start()
+    
+    def _executar(self, gerador_fabrica):
+        gerador = None
+        try:
+            gerador = gerador_fabrica()
+            for pedaco in gerador:
+                with self._cond:
+                    if self._cancelada:
+                        break
+                    self._pedacos.append(pedaco)
+                    self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self._pedacos.append(RespostaFalha(f"Erro ao processar a resposta: {str(e)}"))
+        finally:
+            if gerador is not None:
+                gerador.close()  # Encerra o stream da API se foi cancelada no meio
+            with self._cond:
+                self.concluida = True
+                self.fim = time.perf_counter()
+                self._cond.notify_all()
+    
+    def cancelar(self) -> float:
+        """Cancela a geração; retorna há quanto tempo ela estava rodando"""
+        with self._cond:
+            self._cancelada = True
+        return time.perf_counter() - self.inicio
+    
+    def duracao(self) -> float:
+        return (self.fim or time.perf_counter()) - self.inicio
+    
+    def pedacos(self):
+        """Repassa os pedaços já gerados e os próximos, até o fim da geração (ou do prazo da pergunta)"""
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self._pedacos) and not self.concluida:
+                    restante = tempo_restante()
+                    if restante is not None and restante <= 0:
+                        return  # Prazo da pergunta esgotado: fica o que já foi gerado
+                    self._cond.wait(restante)
+                novos = self._pedacos[i:]
+                i = len(self._pedacos)
+                terminou = self.concluida
+            yield from novos
+            if terminou and not novos:
+                return
+
+@functools.lru_cache(maxsize=None)
+def obter_metricas_especulacao() -> dict:
+    """Acertos/erros da resposta antecipada e o tempo economizado ou desperdiçado (por processo)"""
+    return {"acertos": 0, "erros": 0, "economia": 0.0, "desperdicio": 0.0, "lock": threading.Lock()}
+
+def registrar_especulacao(acerto: bool, segundos: float):
+    metricas = obter_metricas_especulacao()
+    with metricas["lock"]:
+        if acerto:
+            metricas["acertos"] += 1
+            metricas["economia"] += segundos
+        else:
+            metricas["erros"] += 1
+            metricas["desperdicio"] += segundos
+
+
+# ---------------------------
+# PIPELINE DE PERGUNTAS
+# ---------------------------
+@dataclass
+class ConfiguracaoPergunta:
+    """Parâmetros de uma pergunta (na interface, vêm da sidebar; no serviço, do JSON)"""
+    api_key: str = ""
+    use_gemini: bool = True
+    modelo: str = "gemini-2.5-flash"
+    temperatura: float = 0.1
+    min_score: float = 0.3
+    reclassificar_ia: bool = True
+    margem_reclassificacao: float = MARGEM_RECLASSIFICACAO
+    resposta_antecipada: bool = True
+    cache_enabled: bool = True
+    max_extracoes: int = MAX_EXTRACOES_SIMULTANEAS
+    busca_paralela: bool = True
+    prazo_busca: float = PRAZO_BUSCA_PARALELA
+    usar_espelho: bool = True
+    busca_vetorial: bool = True
+    max_passagens: int = MAX_PASSAGENS_CONTEXTO
+    orcamento_tokens: int = ORCAMENTO_TOKENS_ENTRADA
+    streaming: bool = True
+    cache_respostas: bool = True
+    similaridade_resposta: float = SIMILARIDADE_RESPOSTA
+    prazo_total: float = PRAZO_PERGUNTA  # Segundos para a pergunta inteira (0 = sem prazo)
+    
+    @classmethod
+    def de_dict(cls, dados) -> "ConfiguracaoPergunta":
+        """Monta a partir de um mapeamento (session_state, JSON); chaves desconhecidas são ignoradas
+        
+        Levanta ValueError se algum valor não for do tipo do campo.
+        """
+        valores = {}
+        for campo in fields(cls):
+            if campo.name not in dados:
+                continue
+            valor = dados[campo.name]
+            if campo.type is bool and not isinstance(valor, bool):
+                raise ValueError(f"{campo.name}: esperado true/false")
+            try:
+                valores[campo.name] = valor if campo.type is bool else campo.type(valor)
+            except (TypeError, ValueError):
+                raise ValueError(f"{campo.name}: valor inválido ({valor!r})")
+        return cls(**valores)
+
+@dataclass
+class ResultadoPergunta:
+    resposta: str
+    respondida: bool = False  # Gerou texto ou veio do cache de respostas (vai para o histórico)
+    reaproveitada: bool = False
+    fontes: List[str] = field(default_factory=list)
+    latencia: Optional[dict] = None  # primeiro_token / total, em segundos desde o início da pergunta
+    etapas: List[dict] = field(default_factory=list)  # Detalhamento das etapas medidas
+    artigos: List[dict] = field(default_factory=list)  # Ranqueamento final: url e score
+    degradacoes: List[str] = field(default_factory=list)  # Chaves de DEGRADACOES aplicadas pelo prazo
+    
+    def para_dict(self) -> dict:
+        return asdict(self)
+
+# Resposta que o SYSTEM_PROMPT_RESPOSTA manda a IA dar quando o contexto não tem a informação:
+# gerada com sucesso, mas sem "Saiba mais" e fora do cache de respostas
+RESPOSTA_SEM_INFORMACAO = "não encontrei essa informação na documentação oficial"
+
+def resposta_parcial(gerado: str = "") -> str:
+    """Resposta quando o prazo acaba: o que a IA gerou até ali, ou um aviso (os links vêm no "Saiba mais")"""
+    if gerado.strip():
+        return gerado.rstrip() + "\n\n⏱️ *Resposta interrompida pelo prazo da pergunta.*"
+    return ("⏱️ O prazo desta pergunta acabou antes de a resposta ficar pronta. "
+            "Os artigos mais relevantes encontrados estão abaixo.")
+
+def processar_pergunta(pergunta: str, config: ConfiguracaoPergunta,
+                       progresso: Progresso = None) -> ResultadoPergunta:
+    """Busca, extrai, ranqueia e gera a resposta para a pergunta
+    
+    O andamento (fases, passos, avisos e, com config.streaming, os pedaços da resposta)
+    é reportado em `progresso`. Pode ser chamada por várias threads ao mesmo tempo.
+    
+    Com config.prazo_total, cada etapa recebe o que resta do prazo; quando ele aperta a
+    pergunta degrada em passos (menos artigos, sem reclassificação por IA, resposta
+    parcial) em vez de travar, e o que foi aplicado volta em `degradacoes`.
+    """
+    progresso = progresso or Progresso()
+    degradacoes = []
+    token = _progresso_atual.set(progresso)
+    token_degradacoes = _degradacoes_atuais.set(degradacoes)
+    try:
+        with detalhar() as detalhamento, limitar_prazo(config.prazo_total or None):
+            with medir_etapa("total", "Total"):
+                resultado = _processar_pergunta(pergunta, config, progresso)
+        resultado.etapas = detalhamento.linhas()
+        resultado.degradacoes = degradacoes
+        return resultado
+    finally:
+        _degradacoes_atuais.reset(token_degradacoes)
+        _progresso_atual.reset(token)
+
+def _processar_pergunta(user_query: str, config: ConfiguracaoPergunta, progresso: Progresso) -> ResultadoPergunta:
+    inicio_pergunta = time.perf_counter()  # Referência da latência percebida (primeiro token)
+    # Verificar se a API key foi configurada
+    if not config.api_key:
+        return ResultadoPergunta("Erro: Chave da API não configurada. Por favor, configure sua chave na sidebar.")
+    
+    cleaned_query = clean_query(user_query)
+    if not cleaned_query:
+        return ResultadoPergunta("Não foi possível processar a pergunta.")
+
+    if tem_video_ou_anexo(user_query):
+        return ResultadoPergunta("Pergunta contém referência a vídeo ou anexo. Não será feita busca automática na documentação.")
+    
+    # Resposta já gerada para esta pergunta (ou uma muito parecida)
+    usar_cache_respostas = config.cache_enabled and config.cache_respostas
+    perfil = (config.use_gemini, config.modelo)
+    if usar_cache_respostas:
+        with medir_etapa("cache_respostas", "Cache de respostas"):
+            anterior = cache_respostas.buscar(user_query, perfil, config.similaridade_resposta)
+        if anterior is not None:
+            if anterior["consulta"] != normalizar_consulta(user_query):
+                progresso.aviso(f"♻️ Resposta reaproveitada de uma pergunta semelhante "
+                                f"({anterior['similaridade']:.0%}): \"{anterior['consulta']}\"", "info")
+            else:
+                progresso.aviso("♻️ Resposta reaproveitada do cache de respostas", "info")
+            return ResultadoPergunta(anterior["resposta"], respondida=True, reaproveitada=True,
+                                     fontes=anterior["fontes"])
+    
+    # Parte do prazo fica guardada para a geração; as etapas anteriores usam o resto
+    reserva = reserva_resposta(config.prazo_total)
+    
+    try:
+        # Buscar links
+        with cache.ignorado(not config.cache_enabled):
+            progresso.status("Buscando na documentação TOTVS...")
+            progresso.etapa("🔍 Procurando artigos relevantes...")
+            with reservar_prazo(reserva), medir_etapa("busca", "Busca de artigos") as medicao:
+                links = buscar_documentacao_totvs(
+                    user_query,
+                    max_links=5,
+                    paralelo=config.busca_paralela,
+                    prazo=config.prazo_busca,
+                    usar_espelho=config.usar_espelho
+                )
+                if not links:
+                    medicao.falhou()
+            
+            if not links:
+                return ResultadoPergunta("Não foram encontrados artigos relevantes na documentação TOTVS.")
+            
+            # Candidatos extras da recuperação vetorial (artigos já em cache/espelho)
+            if config.busca_vetorial:
+                with medir_etapa("busca_vetorial", "Busca vetorial local"):
+                    extras = buscar_candidatos_vetoriais(user_query, links)
+                if extras:
+                    progresso.etapa(f"🧮 {len(extras)} artigo(s) semelhante(s) encontrados no índice local")
+                    links = links + extras
+            
+            progresso.etapa(f"📚 Encontrados {len(links)} artigos. Extraindo conteúdo...")
+            resultados = {}
+            
+            # Extrair conteúdo dos links em paralelo (concorrência limitada)
+            with reservar_prazo(reserva), medir_etapa("extracao", "Extração dos artigos"):
+                for concluidos, (i, link, texto) in enumerate(
+                    extrair_conteudos_paralelo(links, config.max_extracoes, config.usar_espelho), 1
+                ):
+                    progresso.etapa(f"📖 Artigo {concluidos}/{len(links)} lido: {link.split('/')[-1][:80]}")
+                    resultados[i] = (link, texto)
+            
+            if len(resultados) < len(links):
+                registrar_degradacao("menos_artigos")
+                if not resultados:
+                    registrar_degradacao("resposta_parcial")
+                    progresso.status("Prazo esgotado", "complete")
+                    # Só os links: não é resposta (o lote refaz com --refazer-falhas)
+                    return ResultadoPergunta(resposta_parcial() + formatar_links_saiba_mais(links[:5]),
+                                             fontes=list(links[:5]))
+            
+            # Manter a ordem original dos links para desempates na ordenação
+            with medir_etapa("pontuacao", "Pontuação BM25"):
+                contexto_scores = pontuar_artigos([resultados[i] for i in sorted(resultados)], user_query)
+
+            # Usar as melhores passagens de todos os candidatos, dentro do orçamento de tokens
+            contador = ContadorTokens(config.use_gemini, config.modelo)
+            
+            def montar_contexto(artigos):
+                with medir_etapa("contexto", "Montagem do contexto"):
+                    return montar_contexto_passagens(
+                        artigos,
+                        user_query,
+                        contador,
+                        orcamento_tokens=config.orcamento_tokens,
+                        max_passagens=config.max_passagens
+                    )
+            
+            def argumentos_resposta(contexto, fontes_contexto):
+                return (
+                    user_query, 
+                    contexto, 
+                    fontes_contexto, 
+                    config.modelo,
+                    config.use_gemini,
+                    config.api_key,
+                    config.temperatura
+                )
+            
+            # Reclassificação local; a IA só é consultada quando a ordem local é incerta
+            with medir_etapa("reclassificacao_local", "Reclassificação local"):
+                contexto_scores, margem = reclassificar_local(contexto_scores, user_query)
+            especulativa = None
+            montado = None
+            restante = tempo_restante()
+            sem_tempo_reclassificacao = restante is not None and restante - reserva < MINIMO_RECLASSIFICACAO
+            if config.reclassificar_ia and len(contexto_scores) > 1:
+                if margem < config.margem_reclassificacao and sem_tempo_reclassificacao:
+                    registrar_degradacao("reclassificacao_pulada")
+                elif margem < config.margem_reclassificacao:
+                    # Resposta antecipada com a ordem local, em paralelo com a reclassificação
+                    if config.resposta_antecipada:
+                        montado_local = montar_contexto(contexto_scores)
+                        if montado_local[0].strip():
+                            argumentos_local = argumentos_resposta(*montado_local[:2])
+                            especulativa = RespostaEspeculativa(lambda: get_ai_response_stream(*argumentos_local))
+                            progresso.etapa("🏃 Resposta antecipada iniciada com a ordem local...")
+                    
+                    top3_local = {url for _, url, _ in contexto_scores[:3]}
+                    progresso.etapa(f"🧠 Reclassificando artigos por relevância (margem local {margem:.2f})...")
+                    with reservar_prazo(reserva), medir_etapa("reclassificacao_ia", "Reclassificação por IA") as medicao:
+                        contexto_scores = reclassificar_artigos_ia(
+                            contexto_scores, 
+                            user_query, 
+                            config.use_gemini,
+                            config.api_key,
+                            config.modelo
+                        )
+                    duracao_reclassificacao = medicao.duracao
+                    registrar_reclassificacao("ia")
+                    
+                    if especulativa is not None:
+                        if {url for _, url, _ in contexto_scores[:3]} == top3_local:
+                            progresso.etapa("✅ Mesmos 3 artigos principais: resposta antecipada aproveitada")
+                            montado = montado_local
+                        else:
+                            registrar_especulacao(False, especulativa.cancelar())
+                            especulativa = None
+                            progresso.etapa("↩️ Os 3 artigos principais mudaram: resposta antecipada descartada")
+                else:
+                    progresso.etapa(f"⚡ Ordem local confiável (margem {margem:.2f}); reclassificação por IA dispensada")
+                    registrar_reclassificacao("local")
+            
+            progresso.etapa("🤖 Gerando resposta com IA...")
+            
+            contexto_combinado, fontes, tokens_entrada = montado or montar_contexto(contexto_scores)
+            progresso.etapa(f"🧾 Entrada: ~{tokens_entrada} de {config.orcamento_tokens} tokens "
+                            f"({contador.metodo}, {len(fontes)} fonte(s))")
+            
+            # Gerar resposta
+            prefixo = ""
+            resposta_final = None
+            latencia = None
+            respondida = True  # False quando o prazo acaba sem nenhum texto gerado (ou a geração falha)
+            falhou = False  # A IA não gerou a resposta (RespostaFalha) ou não havia conteúdo para gerá-la
+            restante = tempo_restante()
+            if not contexto_combinado.strip():
+                if restante is not None and restante <= reserva:
+                    # Busca/extração cortadas pelo prazo: sem conteúdo, ficam só os links
+                    registrar_degradacao("resposta_parcial")
+                    resposta_final = resposta_parcial()
+                    respondida = False
+                else:
+                    resposta_final = "Atenção: não foi possível validar essa informação específica na documentação oficial."
+                    falhou = True
+            elif contexto_scores[0][0] < config.min_score:
+                prefixo = "Observação: essa consulta aborda um ponto não detalhado na documentação. A resposta é baseada em conhecimento geral.\n\n"
+            
+            if resposta_final is None and restante is not None and restante < MINIMO_GERACAO:
+                registrar_degradacao("resposta_parcial")
+                if especulativa is not None:
+                    especulativa.cancelar()
+                    especulativa = None
+                resposta_final = prefixo + resposta_parcial()
+                respondida = False
+            
+            if resposta_final is None:
+                argumentos_ia = argumentos_resposta(contexto_combinado, fontes)
+                latencia = {}
+                cortada = False
+                
+                with medir_etapa("geracao", "Geração da resposta"):
+                    if config.streaming:
+                        # Repassa a resposta parcial enquanto o modelo gera
+                        progresso.status("Gerando resposta...")
+                        progresso.inicio_resposta(prefixo)
+                        pedacos = especulativa.pedacos() if especulativa else get_ai_response_stream(*argumentos_ia)
+                        gerado = []
+                        for pedaco in medir_primeiro_token(pedacos, latencia, inicio_pergunta):
+                            falhou = falhou or isinstance(pedaco, RespostaFalha)
+                            gerado.append(pedaco)
+                            progresso.pedaco(pedaco)
+                            if prazo_esgotado():
+                                cortada = True
+                                break  # Fecha o stream: fica o que já foi gerado
+                        gerado = "".join(gerado).strip()
+                    else:
+                        pedacos = list(especulativa.pedacos()) if especulativa else [get_ai_response(*argumentos_ia)]
+                        falhou = any(isinstance(pedaco, RespostaFalha) for pedaco in pedacos)
+                        gerado = "".join(pedacos).strip()
+                        # Chamada cortada pelo timeout do prazo volta como falha
+                        if falhou and not especulativa and prazo_esgotado():
+                            cortada, falhou, gerado = True, False, ""
+                        latencia = {"primeiro_token": None, "total": time.perf_counter() - inicio_pergunta}
+                    # A resposta antecipada para de ser lida quando o prazo acaba
+                    if especulativa is not None and not especulativa.concluida:
+                        especulativa.cancelar()
+                        cortada = True
+                
+                if cortada:
+                    registrar_degradacao("resposta_parcial")
+                    respondida = bool(gerado.strip())
+                    gerado = resposta_parcial(gerado)
+                resposta_final = prefixo + gerado
+                
+                if especulativa:
+                    # Em sequência levaria reclassificação + geração; em paralelo, o maior dos dois
+                    registrar_especulacao(True, min(duracao_reclassificacao, especulativa.duracao()))
+            
+            # Adicionar seção "Saiba mais" se a IA respondeu (a resposta parcial do prazo também ganha os links)
+            resposta_valida = not falhou and RESPOSTA_SEM_INFORMACAO not in resposta_final.lower()
+            
+            if resposta_valida and links:
+                saiba_mais = formatar_links_saiba_mais([link for _, link, _ in contexto_scores[:5]])
+                resposta_final += saiba_mais
+                
+                # Respostas degradadas pelo prazo não são reaproveitadas
+                if usar_cache_respostas and not _degradacoes_atuais.get():
+                    cache_respostas.guardar(
+                        user_query,
+                        perfil,
+                        resposta_final,
+                        fontes,
+                        {url: assinatura_artigo(url) for url in fontes}
+                    )
+            
+            progresso.status("Processamento completo!", "complete")
+            
+        artigos = [{"url": url, "score": float(score)} for score, url, _ in contexto_scores]
+        return ResultadoPergunta(resposta_final, respondida=respondida and not falhou, fontes=list(fontes),
+                                 latencia=latencia, artigos=artigos)
+
+    except Exception as e:
+        return ResultadoPergunta(f"Ocorreu um erro durante o processamento: {str(e)}")
@@ -0,0 +1,277 @@
+"""Serviço HTTP (ASGI) do Responde AI: o mesmo pipeline da interface, em JSON.
+
+Roda o núcleo (nucleo.py) para vários clientes ao mesmo tempo, cada pergunta em uma
+thread de um pool limitado, sem bloquear o loop de eventos.
+
+Uso:
+    uvicorn servico:app --host 127.0.0.1 --port 8000
+
+Rotas:
+    POST /v1/perguntas   {"pergunta": "...", "config": {...}, "stream": false}
+                         config aceita os campos de ConfiguracaoPergunta (modelo, use_gemini,
+                         temperatura...); sem api_key, usa RESPONDE_AI_API_KEY, desde que a
+                         requisição traga "Authorization: Bearer <RESPONDE_AI_SERVICO_TOKEN>".
+                         Prazo, extrações simultâneas e tamanho do contexto ficam limitados
+                         aos tetos do servidor (LIMITES_CONFIG, RESPONDE_AI_SERVICO_PRAZO_MAXIMO).
+                         Com "stream": true a resposta é NDJSON: um evento por linha
+                         (status, etapa, aviso, inicio_resposta, pedaco) e por fim "resultado".
+                         Se o cliente desconectar, a pergunta para no próximo ponto de prazo.
+    GET  /health
+    GET  /metrics        histogramas de latência no formato do Prometheus; exige o token do
+                         serviço (sem ele, use o endpoint local de RESPONDE_AI_METRICAS_PORTA)
+"""
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import TIPO_CONTEUDO
+from nucleo import (MAX_EXTRACOES_SIMULTANEAS, MAX_PASSAGENS_CONTEXTO, ORCAMENTO_TOKENS_ENTRADA,
+                    PRAZO_BUSCA_PARALELA, PRAZO_PERGUNTA, ConfiguracaoPergunta, Progresso, metricas_latencia,
+                    processar_pergunta, vincular_cancelamento)
+
+# Perguntas processadas ao mesmo tempo (as demais esperam na fila do pool)
+SERVICO_WORKERS = int(os.getenv("RESPONDE_AI_SERVICO_WORKERS", "8"))
+# Chave de IA usada quando a requisição não traz uma
+SERVICO_API_KEY = os.getenv("RESPONDE_AI_API_KEY", "")
+# Token (Authorization: Bearer) exigido para usar a chave do servidor; vazio, cada
+# requisição precisa trazer a sua api_key
+SERVICO_TOKEN = os.getenv("RESPONDE_AI_SERVICO_TOKEN", "")
+MAX_CORPO = 64 * 1024
+MAX_PERGUNTA = 4000
+# Prazo máximo de uma pergunta no serviço; pedidos sem prazo (0) ou acima dele ficam com ele
+SERVICO_PRAZO_MAXIMO = float(os.getenv("RESPONDE_AI_SERVICO_PRAZO_MAXIMO", str(PRAZO_PERGUNTA or 60)))
+# (mínimo, máximo) dos campos da config que ocupam o servidor: o cliente pode pedir menos
+# que o padrão do núcleo, nunca mais
+LIMITES_CONFIG = {
+    "max_extracoes": (1, MAX_EXTRACOES_SIMULTANEAS),
+    "max_passagens": (1, MAX_PASSAGENS_CONTEXTO),
+    "orcamento_tokens": (500, ORCAMENTO_TOKENS_ENTRADA),
+    "prazo_busca": (1.0, PRAZO_BUSCA_PARALELA),
+}
+
+
+class ProgressoFila(Progresso):
+    """Converte o andamento em eventos numa asyncio.Queue (chamado de qualquer thread)"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, fila: asyncio.Queue):
+        self._loop = loop
+        self._fila = fila
+
+    def _enviar(self, evento: dict):
+        self._loop.call_soon_threadsafe(self._fila.put_nowait, evento)
+
+    def status(self, rotulo: str, estado: str = "running"):
+        self._enviar({"evento": "status", "rotulo": rotulo, "estado": estado})
+
+    def etapa(self, mensagem: str):
+        self._enviar({"evento": "etapa", "mensagem": mensagem})
+
+    def aviso(self, mensagem: str, nivel: str = "warning"):
+        self._enviar({"evento": "aviso", "mensagem": mensagem, "nivel": nivel})
+
+    def inicio_resposta(self, prefixo: str):
+        self._enviar({"evento": "inicio_resposta", "prefixo": prefixo})
+
+    def pedaco(self, texto: str):
+        self._enviar({"evento": "pedaco", "texto": texto})
+
+
+class ErroRequisicao(Exception):
+    def __init__(self, status: int, mensagem: str):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+def _json(dados) -> bytes:
+    return json.dumps(dados, ensure_ascii=False).encode("utf-8")
+
+
+def _limitar(config: ConfiguracaoPergunta):
+    """Traz prazo, concorrência e tamanho do contexto pedidos pelo cliente para os limites do servidor"""
+    if not 0 < config.prazo_total <= SERVICO_PRAZO_MAXIMO:
+        config.prazo_total = SERVICO_PRAZO_MAXIMO
+    for campo, (minimo, maximo) in LIMITES_CONFIG.items():
+        setattr(config, campo, min(max(getattr(config, campo), minimo), maximo))
+
+
+class ServicoRespondeAI:
+    """Aplicação ASGI (sem framework) que expõe processar_pergunta"""
+
+    def __init__(self, max_workers: int = SERVICO_WORKERS, api_key: str = SERVICO_API_KEY,
+                 token: str = SERVICO_TOKEN):
+        self.max_workers = max_workers
+        self.api_key = api_key
+        self.token = token
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="servico")
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._ciclo_de_vida(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        metodo, caminho = scope["method"], scope["path"].rstrip("/") or "/"
+        try:
+            if caminho == "/health" and metodo == "GET":
+                await self._responder(send, 200, _json({"status": "ok"}))
+            elif caminho == "/metrics" and metodo == "GET":
+                if not self._autenticado(scope):
+                    raise ErroRequisicao(401, "Envie o token do serviço (Authorization: Bearer)")
+                await self._responder(send, 200, metricas_latencia.exposicao().encode("utf-8"), TIPO_CONTEUDO)
+            elif caminho == "/v1/perguntas":
+                if metodo != "POST":
+                    raise ErroRequisicao(405, "Use POST")
+                dados = await self._ler_json(receive)
+                await self._perguntar(dados, self._autenticado(scope), receive, send)
+            else:
+                raise ErroRequisicao(404, "Rota não encontrada")
+        except ErroRequisicao as e:
+            await self._responder(send, e.status, _json({"erro": e.mensagem}))
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensagem["type"] == "lifespan.shutdown":
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _responder(self, send, status: int, corpo: bytes, tipo: str = "application/json"):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", tipo.encode()), (b"content-length", str(len(corpo)).encode())]})
+        await send({"type": "http.response.body", "body": corpo})
+
+    async def _ler_json(self, receive) -> dict:
+        corpo = b""
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                raise ErroRequisicao(400, "Conexão encerrada")
+            corpo += mensagem.get("body", b"")
+            if len(corpo) > MAX_CORPO:
+                raise ErroRequisicao(413, "Corpo da requisição grande demais")
+            if not mensagem.get("more_body"):
+                break
+        try:
+            dados = json.loads(corpo or b"{}")
+        except ValueError:
+            raise ErroRequisicao(400, "JSON inválido")
+        if not isinstance(dados, dict):
+            raise ErroRequisicao(400, "Esperado um objeto JSON")
+        return dados
+
+    def _autenticado(self, scope) -> bool:
+        """A requisição traz o token do serviço (Authorization: Bearer ...)"""
+        if not self.token:
+            return False
+        for nome, valor in scope.get("headers", []):
+            if nome.lower() == b"authorization":
+                esquema, _, credencial = valor.decode("latin-1").partition(" ")
+                return (esquema.lower() == "bearer"
+                        and hmac.compare_digest(credencial.strip().encode(), self.token.encode()))
+        return False
+
+    def _configuracao(self, dados: dict, autenticado: bool) -> ConfiguracaoPergunta:
+        bruta = dados.get("config") or {}
+        if not isinstance(bruta, dict):
+            raise ErroRequisicao(400, "config deve ser um objeto")
+        try:
+            config = ConfiguracaoPergunta.de_dict(bruta)
+        except ValueError as e:
+            raise ErroRequisicao(400, f"config inválida: {e}")
+        _limitar(config)
+        if config.api_key:
+            return config
+        if not self.api_key:
+            raise ErroRequisicao(400, "api_key ausente (na config ou em RESPONDE_AI_API_KEY)")
+        if not autenticado:
+            # A chave do servidor não fica à disposição de quem alcança a porta
+            raise ErroRequisicao(401, "api_key ausente: envie a sua na config ou o token do serviço "
+                                      "(Authorization: Bearer)")
+        config.api_key = self.api_key
+        return config
+
+    async def _aguardar_desconexao(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def _perguntar(self, dados: dict, autenticado: bool, receive, send):
+        pergunta = dados.get("pergunta")
+        if not isinstance(pergunta, str) or not pergunta.strip():
+            raise ErroRequisicao(400, "Campo 'pergunta' obrigatório")
+        if len(pergunta) > MAX_PERGUNTA:
+            raise ErroRequisicao(413, f"Pergunta maior que {MAX_PERGUNTA} caracteres")
+        stream = bool(dados.get("stream"))
+        config = self._configuracao(dados, autenticado)
+        if not stream:
+            config.streaming = False  # Ninguém vai ler os pedaços: a chamada bloqueante basta
+
+        loop = asyncio.get_running_loop()
+        fila = asyncio.Queue()
+        # Contexto copiado: métricas e cache por pergunta ficam isolados entre as threads. O
+        # cancelamento vinculado a ele esgota o prazo da pergunta se o cliente for embora
+        cancelamento = threading.Event()
+        contexto = contextvars.copy_context()
+        contexto.run(vincular_cancelamento, cancelamento)
+        futuro = loop.run_in_executor(self.executor, contexto.run,
+                                      processar_pergunta, pergunta, config, ProgressoFila(loop, fila))
+        desconexao = asyncio.ensure_future(self._aguardar_desconexao(receive))
+        try:
+            if not stream:
+                await asyncio.wait({futuro, desconexao}, return_when=asyncio.FIRST_COMPLETED)
+                if not futuro.done():
+                    return
+                resultado = futuro.result()
+                avisos = []
+                while not fila.empty():
+                    evento = fila.get_nowait()
+                    if evento["evento"] == "aviso":
+                        avisos.append(evento)
+                await self._responder(send, 200, _json({**resultado.para_dict(), "avisos": avisos}))
+                return
+
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/x-ndjson; charset=utf-8")]})
+            while True:
+                proximo = asyncio.ensure_future(fila.get())
+                concluidos, _ = await asyncio.wait({proximo, futuro, desconexao},
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if desconexao in concluidos:
+                    proximo.cancel()
+                    return
+                if proximo not in concluidos:
+                    proximo.cancel()
+                    break
+                await send({"type": "http.response.body", "body": _json(proximo.result()) + b"\n",
+                            "more_body": True})
+            # Eventos enfileirados antes do fim da pergunta
+            while not fila.empty():
+                await send({"type": "http.response.body", "body": _json(fila.get_nowait()) + b"\n",
+                            "more_body": True})
+            resultado = await futuro
+            await send({"type": "http.response.body",
+                        "body": _json({"evento": "resultado", **resultado.para_dict()}) + b"\n"})
+        finally:
+            desconexao.cancel()
+            if not futuro.done():
+                # Cliente desconectado (ou falha no envio): a pergunta para no próximo ponto de prazo
+                cancelamento.set()
+                futuro.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+app = ServicoRespondeAI()
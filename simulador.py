@@ -0,0 +1,340 @@
+"""Simulador local da central (Help Center do Zendesk) e de uma API compatível com a OpenAI.
+
+Serve o corpus sintético de benchmark.py para rodar o modo em lote (lote.py), o serviço
+ou a interface sem rede nem chave de verdade, com latência e falhas configuráveis.
+
+Uso:
+    python simulador.py --porta 8765 --artigos 500 --latencia-ia 0.5 --taxa-erro 0.05
+
+    RESPONDE_AI_BASE_CENTRAL=http://127.0.0.1:8765 \\
+    RESPONDE_AI_BASE_OPENAI=http://127.0.0.1:8765/v1 \\
+    RESPONDE_AI_DUCKDUCKGO=0 \\
+    python lote.py perguntas.csv respostas.jsonl --provedor openai --api-key simulada
+
+Rotas:
+    GET  /api/v2/help_center/pt-br/articles/search?query=...&per_page=5
+    GET  /api/v2/help_center/pt-br/articles/<id>
+    GET  /api/v2/help_center/<locale>/articles.json   (paginado, usado pelo espelho)
+    GET  /hc/pt-br/search?query=...                    (HTML da pesquisa interna)
+    GET  /hc/pt-br/articles/<id>-<slug>                (página do artigo)
+    POST /v1/chat/completions                          (JSON, ou SSE com "stream": true)
+    GET  /_simulador/estatisticas                      (requisições recebidas por rota)
+
+Artigo e página respondem com ETag/Last-Modified e devolvem 304 a requisições condicionais.
+
+O Gemini usa gRPC e não é simulado: contra o simulador, use o provedor OpenAI.
+"""
+import argparse
+import calendar
+import email.utils
+import html
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from benchmark import gerar_artigos, pagina_html
+
+ID_INICIAL = 360000000000
+PALAVRA = re.compile(r"\w{3,}")
+URL_ARTIGO = re.compile(r"https?://[^\s<>\"']+/articles/\d+[^\s<>\"']*")
+
+ROTA_ARTIGO_API = re.compile(r"^/api/v2/help_center/[\w-]+/articles/(\d+)(?:\.json)?$")
+ROTA_LISTA_API = re.compile(r"^/api/v2/help_center/([\w-]+)/articles\.json$")
+ROTA_PAGINA = re.compile(r"^/hc/[\w-]+/articles/(\d+)")
+
+
+def _termos(texto: str) -> set:
+    return set(PALAVRA.findall(texto.lower()))
+
+
+class CorpusSimulado:
+    """Artigos sintéticos no formato da API do Help Center, com uma busca por termos em comum"""
+
+    def __init__(self, n: int, base: str, semente: int = 42):
+        self.artigos = []
+        for i, artigo in enumerate(gerar_artigos(n, semente, base)):
+            self.artigos.append({
+                **artigo,
+                "id": ID_INICIAL + i,
+                # Datas distintas e decrescentes com o id: a sincronização incremental pagina por elas
+                "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1717200000 - i * 3600)),
+            })
+        self._por_id = {artigo["id"]: artigo for artigo in self.artigos}
+        self._termos = [_termos(artigo["titulo"] + " " + " ".join(artigo["paragrafos"])) for artigo in self.artigos]
+
+    def artigo(self, id_artigo: int) -> Optional[dict]:
+        return self._por_id.get(id_artigo)
+
+    def buscar(self, consulta: str, limite: int) -> List[dict]:
+        termos = _termos(consulta)
+        pontos = [(len(termos & termos_artigo), i) for i, termos_artigo in enumerate(self._termos)]
+        melhores = sorted((p for p in pontos if p[0]), key=lambda p: (-p[0], p[1]))[:limite]
+        return [self.artigos[i] for _, i in melhores]
+
+    def atualizar(self, id_artigo: int, paragrafo: str):
+        """Acrescenta um parágrafo e avança o updated_at (para testar a revalidação)"""
+        artigo = self._por_id[id_artigo]
+        artigo["paragrafos"] = artigo["paragrafos"] + [paragrafo]
+        artigo["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    @staticmethod
+    def validadores(artigo: dict) -> dict:
+        """ETag e Last-Modified do artigo, derivados do updated_at"""
+        data = time.strptime(artigo["updated_at"], "%Y-%m-%dT%H:%M:%SZ")
+        return {"ETag": f'"{artigo["id"]}-{calendar.timegm(data)}"',
+                "Last-Modified": email.utils.formatdate(calendar.timegm(data), usegmt=True)}
+
+    @staticmethod
+    def para_api(artigo: dict) -> dict:
+        corpo = "".join(f"<p>{html.escape(p)}</p>" for p in artigo["paragrafos"])
+        return {"id": artigo["id"], "html_url": artigo["url"], "title": artigo["titulo"], "body": corpo,
+                "locale": "pt-br", "draft": False, "updated_at": artigo["updated_at"]}
+
+
+def resposta_simulada(mensagens: List[dict]) -> str:
+    """Resposta determinística: na reclassificação, as URLs do prompt; senão, um resumo do contexto"""
+    sistema = " ".join(m.get("content", "") for m in mensagens if m.get("role") == "system")
+    usuario = "\n".join(m.get("content", "") for m in mensagens if m.get("role") == "user")
+    urls = list(dict.fromkeys(URL_ARTIGO.findall(usuario)))
+
+    if "classificar" in sistema.lower():
+        return "\n".join(urls)
+
+    pergunta = usuario.split("PERGUNTA DO USUÁRIO:", 1)[-1].split("CONTEÚDO EXTRAÍDO:", 1)[0].strip()
+    contexto = usuario.split("CONTEÚDO EXTRAÍDO:", 1)[-1].split("INSTRUÇÃO:", 1)[0]
+    trecho = " ".join(contexto.split()[:60])
+    fonte = urls[0] if urls else "documentação"
+    return (f"**Resposta simulada** para: {pergunta}\n\n"
+            f"De acordo com a documentação ({fonte}): {trecho}...\n\n"
+            "1. Acesse a rotina indicada.\n2. Revise os parâmetros citados.\n3. Confirme a operação.")
+
+
+class ServidorHTTPSilencioso(ThreadingHTTPServer):
+    """Não imprime traceback quando o cliente desiste no meio (timeout, prazo da pergunta)"""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class ServidorSimulado:
+    """Servidor HTTP em segundo plano com as rotas da central e da OpenAI"""
+
+    def __init__(self, host: str = "127.0.0.1", porta: int = 8765, artigos: int = 500,
+                 latencia_central: float = 0.0, latencia_ia: float = 0.0, taxa_erro: float = 0.0,
+                 semente: int = 42):
+        self.host = host
+        self.porta = porta
+        self.n_artigos = artigos
+        self.latencia_central = latencia_central
+        self.latencia_ia = latencia_ia
+        self.taxa_erro = taxa_erro
+        self.semente = semente
+        self.corpus = None
+        self.contagens = Counter()
+        self._lock = threading.Lock()
+        self._aleatorio = random.Random(semente)
+        self._servidor = None
+
+    @property
+    def url(self) -> str:
+        host = "127.0.0.1" if self.host in ("", "0.0.0.0") else self.host
+        return f"http://{host}:{self.porta}"
+
+    def _contar(self, rota: str) -> bool:
+        """Registra a requisição; retorna True quando ela deve falhar (--taxa-erro)"""
+        with self._lock:
+            self.contagens[rota] += 1
+            return self._aleatorio.random() < self.taxa_erro
+
+    def iniciar(self):
+        simulador = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _enviar(self, status: int, corpo: bytes, tipo: str = "application/json", cabecalhos: dict = None):
+                self.send_response(status)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(corpo)))
+                for nome, valor in (cabecalhos or {}).items():
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def _json(self, dados, status: int = 200, cabecalhos: dict = None):
+                self._enviar(status, json.dumps(dados, ensure_ascii=False).encode("utf-8"),
+                             "application/json; charset=utf-8", cabecalhos)
+
+            def _nao_modificado(self, rota: str, validadores: dict) -> bool:
+                """Responde 304 se a requisição condicional traz o ETag (ou a data) atual do artigo"""
+                if (self.headers.get("If-None-Match") != validadores["ETag"]
+                        and self.headers.get("If-Modified-Since") != validadores["Last-Modified"]):
+                    return False
+                with simulador._lock:
+                    simulador.contagens[f"{rota}_304"] += 1
+                self.send_response(304)
+                for nome, valor in validadores.items():
+                    self.send_header(nome, valor)
+                self.end_headers()
+                return True
+
+            def do_GET(self):
+                partes = urllib.parse.urlsplit(self.path)
+                caminho, params = partes.path, urllib.parse.parse_qs(partes.query)
+                if caminho == "/_simulador/estatisticas":
+                    with simulador._lock:
+                        self._json(dict(simulador.contagens))
+                    return
+
+                rota = ("api_busca" if caminho.endswith("/articles/search") else
+                        "api_artigo" if ROTA_ARTIGO_API.match(caminho) else
+                        "api_lista" if ROTA_LISTA_API.match(caminho) else
+                        "pesquisa_interna" if caminho.endswith("/search") else
+                        "pagina" if ROTA_PAGINA.match(caminho) else None)
+                if rota is None:
+                    self._json({"error": "NotFound"}, 404)
+                    return
+                if simulador._contar(rota):
+                    self._json({"error": "ServiceUnavailable"}, 503)
+                    return
+                if simulador.latencia_central:
+                    time.sleep(simulador.latencia_central)
+                getattr(self, f"_{rota}")(caminho, params)
+
+            def _api_busca(self, caminho, params):
+                limite = int(params.get("per_page", ["25"])[0])
+                artigos = simulador.corpus.buscar(params.get("query", [""])[0], limite)
+                self._json({"results": [CorpusSimulado.para_api(a) for a in artigos], "count": len(artigos)})
+
+            def _api_artigo(self, caminho, params):
+                artigo = simulador.corpus.artigo(int(ROTA_ARTIGO_API.match(caminho).group(1)))
+                if artigo is None:
+                    self._json({"error": "RecordNotFound"}, 404)
+                elif not self._nao_modificado("api_artigo", CorpusSimulado.validadores(artigo)):
+                    self._json({"article": CorpusSimulado.para_api(artigo)}, cabecalhos=CorpusSimulado.validadores(artigo))
+
+            def _api_lista(self, caminho, params):
+                por_pagina = min(int(params.get("per_page", ["30"])[0]), 100)
+                pagina = int(params.get("page", ["1"])[0])
+                # Como a API real com sort_by=updated_at: um artigo atualizado volta para a 1ª página
+                ordenados = sorted(simulador.corpus.artigos, key=lambda a: a["updated_at"], reverse=True)
+                artigos = ordenados[(pagina - 1) * por_pagina:pagina * por_pagina]
+                proxima = None
+                if pagina * por_pagina < len(simulador.corpus.artigos):
+                    proxima = (f"{simulador.url}{caminho}?"
+                               + urllib.parse.urlencode({"per_page": por_pagina, "page": pagina + 1}))
+                self._json({"articles": [CorpusSimulado.para_api(a) for a in artigos], "next_page": proxima,
+                            "count": len(simulador.corpus.artigos)})
+
+            def _pesquisa_interna(self, caminho, params):
+                artigos = simulador.corpus.buscar(params.get("query", [""])[0], 10)
+                itens = "".join(
+                    f"<li class='search-result'><a class='search-result-link' "
+                    f"href='{urllib.parse.urlsplit(a['url']).path}'>{html.escape(a['titulo'])}</a></li>"
+                    for a in artigos
+                )
+                self._enviar(200, f"<html><body><ul class='search-results-list'>{itens}</ul></body></html>"
+                             .encode("utf-8"), "text/html; charset=utf-8")
+
+            def _pagina(self, caminho, params):
+                artigo = simulador.corpus.artigo(int(ROTA_PAGINA.match(caminho).group(1)))
+                if artigo is None:
+                    self._enviar(404, b"<html><body>Not found</body></html>", "text/html")
+                elif not self._nao_modificado("pagina", CorpusSimulado.validadores(artigo)):
+                    self._enviar(200, pagina_html(artigo), "text/html; charset=utf-8", CorpusSimulado.validadores(artigo))
+
+            def do_POST(self):
+                if urllib.parse.urlsplit(self.path).path.rstrip("/") != "/v1/chat/completions":
+                    self._json({"error": {"message": "Not found"}}, 404)
+                    return
+                try:
+                    dados = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                except ValueError:
+                    self._json({"error": {"message": "JSON inválido"}}, 400)
+                    return
+                if simulador._contar("chat_completions"):
+                    self._json({"error": {"message": "Simulated failure", "type": "server_error"}}, 503)
+                    return
+
+                texto = resposta_simulada(dados.get("messages") or [])
+                modelo = dados.get("model", "simulado")
+                criado = int(time.time())
+                if not dados.get("stream"):
+                    if simulador.latencia_ia:
+                        time.sleep(simulador.latencia_ia)
+                    self._json({
+                        "id": "chatcmpl-simulado", "object": "chat.completion", "created": criado, "model": modelo,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": texto}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": len(texto.split()),
+                                  "total_tokens": len(texto.split())},
+                    })
+                    return
+
+                # SSE no formato da OpenAI; HTTP/1.0 (sem keep-alive), então o fim da conexão fecha o stream
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                pedacos = re.findall(r"\S+\s*", texto)
+                for i, pedaco in enumerate(pedacos + [None]):
+                    if simulador.latencia_ia:
+                        time.sleep(simulador.latencia_ia / (len(pedacos) + 1))
+                    delta = {"content": pedaco} if pedaco is not None else {}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    evento = {"id": "chatcmpl-simulado", "object": "chat.completion.chunk", "created": criado,
+                              "model": modelo, "choices": [{"index": 0, "delta": delta,
+                                                            "finish_reason": None if pedaco is not None else "stop"}]}
+                    self.wfile.write(f"data: {json.dumps(evento, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = ServidorHTTPSilencioso((self.host, self.porta), Handler)
+        self._servidor.daemon_threads = True
+        self.porta = self._servidor.server_address[1]  # Porta 0: o sistema escolhe uma livre
+        self.corpus = CorpusSimulado(self.n_artigos, self.url, self.semente)
+        threading.Thread(target=self._servidor.serve_forever, name="simulador", daemon=True).start()
+
+    def parar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador local da central e de uma API compatível com a OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--artigos", type=int, default=500, help="Tamanho do corpus sintético")
+    parser.add_argument("--latencia-central", type=float, default=0.0, help="Segundos por requisição à central")
+    parser.add_argument("--latencia-ia", type=float, default=0.0, help="Segundos por resposta da IA")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração das requisições respondidas com 503")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    simulador = ServidorSimulado(args.host, args.porta, args.artigos, args.latencia_central, args.latencia_ia,
+                                 args.taxa_erro, args.semente)
+    simulador.iniciar()
+    print(f"Simulador em {simulador.url} ({args.artigos} artigos). Ctrl+C para encerrar.")
+    print(f"  RESPONDE_AI_BASE_CENTRAL={simulador.url}")
+    print(f"  RESPONDE_AI_BASE_OPENAI={simulador.url}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulador.parar()
+        print(json.dumps(dict(simulador.contagens), indent=2))
+
+
+if __name__ == "__main__":
+    main()
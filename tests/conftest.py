@@ -0,0 +1,60 @@
+"""Ambiente dos testes: nada de rede externa, de arquivos em .cache nem de endpoint /metrics.
+
+nucleo, extracao e espelho leem a configuração na importação, então as variáveis são
+definidas aqui, antes de qualquer teste importá-los. A central e a OpenAI apontam para o
+simulador local (simulador.py), iniciado só pelos testes que usam a fixture `simulador`.
+"""
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+PASTA_TEMPORARIA = tempfile.mkdtemp(prefix="responde_ai_testes_")
+PORTA_SIMULADOR = _porta_livre()
+
+os.environ.update({
+    "RESPONDE_AI_BASE_CENTRAL": f"http://127.0.0.1:{PORTA_SIMULADOR}",
+    "RESPONDE_AI_BASE_OPENAI": f"http://127.0.0.1:{PORTA_SIMULADOR}/v1",
+    "RESPONDE_AI_DUCKDUCKGO": "0",
+    "RESPONDE_AI_METRICAS_PORTA": "0",
+    "RESPONDE_AI_CACHE_DISCO": "0",
+    "RESPONDE_AI_ESPELHO": "0",
+    "RESPONDE_AI_VETORES": os.path.join(PASTA_TEMPORARIA, "vetores"),
+})
+
+
+@pytest.fixture(scope="session")
+def simulador():
+    """Central e OpenAI simuladas (simulador.py) na porta de RESPONDE_AI_BASE_CENTRAL"""
+    from simulador import ServidorSimulado
+
+    servidor = ServidorSimulado(porta=PORTA_SIMULADOR, artigos=200)
+    servidor.iniciar()
+    yield servidor
+    servidor.parar()
+
+
+@pytest.fixture
+def cache_limpo():
+    """Cache do processo (com as versões da revalidação e o cache negativo) vazio antes e depois do teste"""
+    import nucleo
+
+    def limpar():
+        nucleo.cache.clear()
+        nucleo.revalidacao.clear()
+        nucleo.cache_negativo.clear()
+
+    limpar()
+    yield nucleo.cache
+    limpar()
@@ -0,0 +1,88 @@
+"""Índice BM25 incremental (IndiceBM25) e a pontuação dos artigos extraídos.
+
+    python -m pytest tests
+"""
+import math
+
+import pytest
+
+import nucleo
+
+
+def _bm25(tf, tamanho, media, n, df, k1=1.2, b=0.75):
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * tamanho / media))
+
+
+@pytest.fixture
+def indice():
+    indice = nucleo.IndiceBM25()
+    indice.adicionar("a", "boleto boleto fatura")
+    indice.adicionar("b", "fatura vencida no financeiro")
+    indice.adicionar("c", "cadastro de produtos")
+    return indice
+
+
+def test_score_segue_a_formula(indice):
+    media = (3 + 4 + 3) / 3
+    esperado_a = _bm25(2, 3, media, 3, 1) + _bm25(1, 3, media, 3, 2)
+    esperado_b = _bm25(1, 4, media, 3, 2)
+
+    scores = indice.pontuar("boleto fatura", normalizar=False)
+    assert set(scores) == {"a", "b"}  # Sem doc_ids: só quem tem algum termo
+    assert scores["a"] == pytest.approx(esperado_a)
+    assert scores["b"] == pytest.approx(esperado_b)
+
+
+def test_normalizado_entre_zero_e_um(indice):
+    scores = indice.pontuar("boleto fatura", ["a", "b", "c"])
+    assert scores["c"] == 0.0
+    assert 0 < scores["b"] < scores["a"] <= 1.0
+
+
+def test_termo_raro_pesa_mais(indice):
+    scores = indice.pontuar("boleto vencida", normalizar=False)
+    # "boleto" e "vencida" aparecem em um documento cada; "fatura" (em dois) vale menos
+    assert indice._idf("boleto") == pytest.approx(indice._idf("vencida"))
+    assert indice._idf("fatura") < indice._idf("boleto")
+    assert scores["a"] > scores["b"]  # tf 2 contra 1, mesmo idf
+
+
+def test_reindexa_so_quando_o_texto_muda(indice):
+    assert not indice.adicionar("c", "cadastro de produtos")
+    assert indice.adicionar("c", "boleto de produtos")
+
+    assert "cadastro" not in indice.postings
+    assert indice.postings["boleto"].keys() == {"a", "c"}
+    assert indice.total_tokens == 3 + 4 + 3
+    assert len(indice) == 3
+
+
+def test_limite_de_documentos_remove_os_mais_antigos():
+    indice = nucleo.IndiceBM25(max_docs=2)
+    indice.adicionar("a", "boleto")
+    indice.adicionar("b", "fatura")
+    indice.adicionar("a", "boleto")  # Texto igual: só volta para o fim da fila
+    indice.adicionar("c", "estoque")
+
+    assert list(indice.docs) == ["a", "c"]
+    assert "fatura" not in indice.postings
+    assert indice.total_tokens == 2
+
+
+def test_consulta_sem_termos_uteis(indice):
+    assert indice.pontuar("", ["a", "b"]) == {"a": 0.0, "b": 0.0}
+    assert nucleo.IndiceBM25().pontuar("boleto") == {}
+
+
+def test_pontuar_artigos_ignora_extracoes_com_falha():
+    artigos = [
+        ("https://central/hc/pt-br/articles/bm25-1", "Como emitir o boleto bancário da fatura"),
+        ("https://central/hc/pt-br/articles/bm25-2", "Erro HTTP 404 ao acessar boleto"),
+    ]
+    pontuados = nucleo.pontuar_artigos(artigos, "emitir boleto")
+
+    assert [link for _, link, _ in pontuados] == [link for link, _ in artigos]
+    assert pontuados[0][0] > 0
+    assert pontuados[1][0] == 0.0
+    assert artigos[1][0] not in nucleo.indice_bm25.docs
@@ -0,0 +1,136 @@
+"""CacheManager (LRU com TTL, limites de itens e bytes) e o segundo nível em disco (DiskCache).
+
+    python -m pytest tests
+"""
+import threading
+import time
+
+import nucleo
+
+
+def test_lru_despeja_o_usado_ha_mais_tempo():
+    cache = nucleo.CacheManager(ttl=60, max_itens=2)
+    cache.set("req_a", "A")
+    cache.set("req_b", "B")
+    assert cache.get("req_a") == "A"  # "a" passa a ser o mais recente
+    cache.set("req_c", "C")
+
+    assert cache.get("req_b") is None
+    assert cache.get("req_a") == "A" and cache.get("req_c") == "C"
+    assert cache.estatisticas()["namespaces"]["req_"]["evictions"] == 1
+
+
+def test_limite_de_bytes():
+    texto = "x" * 1000
+    cache = nucleo.CacheManager(ttl=60, max_itens=100, max_bytes=3 * nucleo._tamanho_aproximado(texto))
+    for i in range(5):
+        cache.set(f"req_{i}", texto)
+    assert cache.estatisticas()["itens"] == 3
+    assert cache.bytes <= cache.max_bytes
+
+    cache.set("req_gigante", "x" * 10000)  # Maior que o cache inteiro: não entra nem despeja os outros
+    assert cache.get("req_gigante") is None
+    assert cache.estatisticas()["itens"] == 3
+
+
+def test_ttl_e_estatisticas_por_namespace():
+    cache = nucleo.CacheManager(ttl=0.05, intervalo_varredura=0)
+    cache.set("reclass_x", ["u1", "u2"])
+    assert cache.get("reclass_x") == ["u1", "u2"]
+    assert cache.get("reclass_y") is None
+    time.sleep(0.06)
+    assert cache.get("reclass_x") is None
+
+    stats = cache.estatisticas()["namespaces"]["reclass_"]
+    assert (stats["hits"], stats["misses"], stats["expirados"]) == (1, 2, 1)
+
+
+def test_varredura_remove_expirados():
+    cache = nucleo.CacheManager(ttl=0.05)
+    cache.set("req_a", "A")
+    cache.set("req_b", "B")
+    time.sleep(0.06)
+    cache.varrer()
+    assert cache.estatisticas()["itens"] == 0
+    assert cache.bytes == 0
+
+
+def test_ignorado_vale_so_no_contexto():
+    cache = nucleo.CacheManager(ttl=60)
+    cache.set("req_a", "A")
+    with cache.ignorado():
+        assert cache.get("req_a") is None
+        cache.set("req_b", "B")
+    assert cache.get("req_a") == "A"
+    assert cache.get("req_b") is None
+
+
+def test_acesso_concorrente_respeita_os_limites():
+    cache = nucleo.CacheManager(ttl=60, max_itens=50)
+
+    def usar(n):
+        for i in range(500):
+            cache.set(f"req_{n}_{i % 80}", i)
+            cache.get(f"req_{n}_{(i * 7) % 80}")
+
+    threads = [threading.Thread(target=usar, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache.cache) == 50
+    assert cache.bytes == sum(tamanho for _, _, tamanho in cache.cache.values())
+
+
+# ---------------------------
+# SEGUNDO NÍVEL EM DISCO
+# ---------------------------
+def _disco(tmp_path, **kwargs):
+    kwargs.setdefault("ttls", {"req_": 60, "reclass_": 0.05})
+    return nucleo.DiskCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_disco_sobrevive_a_reinicio(tmp_path):
+    _disco(tmp_path).set("req_a", {"links": ["u1"]}, "req_")
+    assert _disco(tmp_path).get("req_a") == {"links": ["u1"]}  # Outro processo/reinício: mesmo arquivo
+
+
+def test_disco_so_persiste_namespaces_configurados(tmp_path):
+    disco = _disco(tmp_path)
+    assert disco.persiste("req_") and not disco.persiste("outros")
+    disco.set("outros_a", "A", "outros")
+    disco.set("req_b", object(), "req_")  # Não serializável: fica só na memória
+    assert disco.estatisticas()["itens"] == 0
+
+
+def test_disco_ttl_por_namespace(tmp_path):
+    disco = _disco(tmp_path)
+    disco.set("req_a", "A", "req_")
+    disco.set("reclass_b", ["u1"], "reclass_")
+    time.sleep(0.06)
+    assert disco.get("req_a") == "A"
+    assert disco.get("reclass_b") is None
+
+
+def test_disco_limita_bytes_pelos_menos_acessados(tmp_path):
+    disco = _disco(tmp_path, max_bytes=10000, intervalo_limpeza=1000)
+    for i in range(150):
+        disco.set(f"req_{i}", "x" * 100, "req_")
+    time.sleep(0.01)
+    disco.get("req_0")  # Acessado por último: fica
+    disco.limpar_excesso()
+    assert disco.estatisticas()["bytes"] <= 10000
+    assert disco.get("req_0") is not None
+    assert disco.get("req_1") is None
+    assert disco.get("req_149") is not None
+
+
+def test_memoria_promove_do_disco(tmp_path):
+    disco = _disco(tmp_path)
+    nucleo.CacheManager(ttl=60, disco=disco).set("req_a", "A")
+
+    cache = nucleo.CacheManager(ttl=60, disco=disco)  # Outro worker, memória vazia
+    assert cache.get("req_a") == "A"
+    assert "req_a" in cache.cache
+    assert cache.estatisticas()["namespaces"]["req_"]["hits_disco"] == 1
@@ -0,0 +1,68 @@
+"""Cache de respostas: reaproveita perguntas parecidas e deixa de valer quando um artigo usado muda.
+
+A versão de cada fonte vem de um validador durável (updated_at/ETag guardado pela
+revalidação); versão desconhecida é miss, nunca hit.
+
+    python -m pytest tests
+"""
+import time
+
+import pytest
+
+import nucleo
+
+PERFIL = (False, "gpt-4o-mini")
+PERGUNTA = "Como configurar o parâmetro MV_ESTNEG no SIGAEST?"
+
+
+@pytest.fixture
+def respostas(cache_limpo, monkeypatch):
+    monkeypatch.setattr(nucleo.revalidacao, "ttl", 0.2)
+    cache = nucleo.CacheRespostas()
+    yield cache
+    cache.clear()
+
+
+def _guardar(respostas, simulador, indice):
+    url = simulador.corpus.artigos[indice]["url"]
+    assert nucleo.extrair_conteudo_pagina(url, usar_espelho=False)
+    versao = nucleo.assinatura_artigo(url)
+    assert versao
+    respostas.guardar(PERGUNTA, PERFIL, "Resposta sobre MV_ESTNEG.", [url], {url: versao})
+    return url
+
+
+def test_pergunta_semelhante_reaproveitada(respostas, simulador):
+    _guardar(respostas, simulador, 10)
+    assert respostas.buscar(PERGUNTA, PERFIL)["similaridade"] == 1.0
+    assert respostas.buscar("como configuro o parametro MV_ESTNEG no SIGAEST", PERFIL) is not None
+    assert respostas.buscar("Como configurar o parâmetro MV_ESTPOS no SIGAEST?", PERFIL) is None
+    assert respostas.buscar(PERGUNTA, (True, "gemini-2.5-flash")) is None
+
+
+def test_artigo_inalterado_revalidado_continua_valendo(respostas, simulador):
+    _guardar(respostas, simulador, 11)
+    time.sleep(0.3)
+    antes = simulador.contagens["api_artigo_304"]
+    assert respostas.buscar(PERGUNTA, PERFIL) is not None
+    assert simulador.contagens["api_artigo_304"] == antes + 1
+
+
+def test_artigo_alterado_invalida(respostas, simulador):
+    _guardar(respostas, simulador, 12)
+    simulador.corpus.atualizar(simulador.corpus.artigos[12]["id"], "Parágrafo novo sobre MV_ESTNEG.")
+    time.sleep(0.3)
+    assert respostas.buscar(PERGUNTA, PERFIL) is None
+    assert respostas.estatisticas()["invalidados"] == 1
+
+
+def test_versao_desconhecida_e_miss(respostas, simulador):
+    _guardar(respostas, simulador, 13)
+    nucleo.revalidacao.clear()  # Validadores perdidos: não há como saber se o artigo mudou
+    assert respostas.buscar(PERGUNTA, PERFIL) is None
+
+
+def test_fonte_sem_versao_nao_e_guardada(respostas):
+    respostas.guardar(PERGUNTA, PERFIL, "Resposta.", ["https://central/hc/pt-br/articles/1-a"],
+                      {"https://central/hc/pt-br/articles/1-a": None})
+    assert len(respostas) == 0
@@ -0,0 +1,103 @@
+"""Disjuntor por host e cache negativo: fechado -> aberto -> meio-aberto (uma sonda) -> fechado.
+
+    python -m pytest tests
+"""
+import time
+
+import pytest
+
+import nucleo
+
+
+def _abrir(disjuntor):
+    for _ in range(disjuntor.limiar):
+        assert disjuntor.permitir()
+        disjuntor.falha()
+    assert disjuntor.estado == "aberto"
+
+
+def _esperar_meio_aberto(disjuntor):
+    time.sleep(disjuntor.tempo_aberto * 1.5)
+    assert disjuntor.situacao()["estado"] == "meio_aberto"
+
+
+@pytest.fixture
+def disjuntor():
+    return nucleo.DisjuntorHost("central.teste", limiar=3, tempo_aberto=0.05)
+
+
+def test_abre_depois_de_falhas_seguidas(disjuntor):
+    disjuntor.falha()
+    disjuntor.falha()
+    disjuntor.sucesso()  # Um sucesso zera a sequência
+    disjuntor.falha()
+    disjuntor.falha()
+    assert disjuntor.estado == "fechado"
+
+    disjuntor.falha()
+    assert disjuntor.estado == "aberto"
+    assert not disjuntor.permitir()
+    assert not disjuntor.disponivel()
+    assert disjuntor.situacao()["recusadas"] == 2
+
+
+def test_meio_aberto_deixa_passar_uma_sonda(disjuntor):
+    _abrir(disjuntor)
+    _esperar_meio_aberto(disjuntor)
+    assert disjuntor.disponivel()  # Consultar não consome a sonda
+    assert disjuntor.permitir()
+    assert not disjuntor.permitir()
+
+    disjuntor.sucesso()
+    assert disjuntor.estado == "fechado"
+    assert disjuntor.permitir()
+
+
+def test_sonda_com_falha_reabre_por_mais_tempo(disjuntor):
+    _abrir(disjuntor)
+    _esperar_meio_aberto(disjuntor)
+    assert disjuntor.permitir()
+    disjuntor.falha()
+    assert disjuntor.estado == "aberto"
+    assert disjuntor.tempo_aberto == pytest.approx(0.1)
+
+
+def test_sonda_liberada_sem_resultado(disjuntor):
+    _abrir(disjuntor)
+    _esperar_meio_aberto(disjuntor)
+    assert disjuntor.permitir()
+    disjuntor.liberar_sonda()
+    assert disjuntor.permitir()
+
+
+def test_cliente_http_devolve_a_sonda_quando_nao_chega_ao_host(monkeypatch):
+    # Prazo esgotado na fila do limite por minuto, depois de o disjuntor ceder a sonda
+    disjuntor = nucleo.disjuntores.obter(nucleo.BASE_CENTRAL)
+    monkeypatch.setattr(disjuntor, "tempo_aberto", 0.05)
+    _abrir(disjuntor)
+    _esperar_meio_aberto(disjuntor)
+
+    def sem_vez(provedor):
+        raise nucleo.PrazoEsgotado("Prazo da pergunta esgotado")
+
+    monkeypatch.setattr(nucleo, "aguardar_vez", sem_vez)
+    try:
+        with pytest.raises(nucleo.PrazoEsgotado):
+            nucleo.cliente_http.get(nucleo.BASE_CENTRAL + "/hc/pt-br/articles/1", timeout=5)
+        assert disjuntor.permitir()  # A sonda não ficou presa
+    finally:
+        disjuntor.sucesso()
+
+
+def test_cache_negativo_expira():
+    negativo = nucleo.CacheNegativo(ttl=0.05, max_itens=2)
+    negativo.marcar("a")
+    negativo.marcar("b")
+    negativo.marcar("c")  # Passa do limite: "a" sai
+    assert not negativo.contem("a")
+    assert negativo.contem("b") and negativo.contem("c")
+    assert negativo.evitadas == 2
+
+    time.sleep(0.06)
+    assert not negativo.contem("b")
+    assert len(negativo) == 0
@@ -0,0 +1,127 @@
+"""Coalescência de chamadas em voo (ChamadasEmVoo): uma execução por chave, prazo de quem espera e erros.
+
+    python -m pytest tests
+"""
+import threading
+import time
+
+import pytest
+
+import nucleo
+
+
+def _em_thread(func, *args):
+    """Roda func(*args) numa thread (contexto próprio, sem prazo) e guarda o resultado ou a exceção"""
+    saida = {}
+
+    def rodar():
+        try:
+            saida["resultado"] = func(*args)
+        except Exception as e:
+            saida["erro"] = e
+
+    thread = threading.Thread(target=rodar)
+    thread.start()
+    return thread, saida
+
+
+def _lider_bloqueado(em_voo, chave, liberar, resultado="pronto", erro=None):
+    """Inicia a chamada líder de `chave`, presa até `liberar` ser ligado"""
+    def func():
+        liberar.wait(5)
+        if erro is not None:
+            raise erro
+        return resultado
+
+    thread, saida = _em_thread(em_voo.executar, chave, func)
+    while em_voo.em_andamento() == 0:
+        time.sleep(0.001)
+    return thread, saida
+
+
+def test_chamadas_iguais_executam_uma_vez():
+    em_voo = nucleo.ChamadasEmVoo()
+    liberar = threading.Event()
+    execucoes = []
+
+    def func():
+        execucoes.append(1)
+        liberar.wait(5)
+        return ["u1", "u2"]
+
+    threads = [_em_thread(em_voo.executar, "req_a", func) for _ in range(5)]
+    time.sleep(0.1)
+    liberar.set()
+    for thread, _ in threads:
+        thread.join()
+
+    assert len(execucoes) == 1
+    assert all(saida["resultado"] == ["u1", "u2"] for _, saida in threads)
+    assert em_voo.estatisticas()["req_"] == {"chamadas": 1, "compartilhadas": 4, "desistencias": 0}
+    assert em_voo.em_andamento() == 0
+
+
+def test_chaves_diferentes_nao_esperam_umas_pelas_outras():
+    em_voo = nucleo.ChamadasEmVoo()
+    liberar = threading.Event()
+    thread, _ = _lider_bloqueado(em_voo, "req_a", liberar)
+    try:
+        assert em_voo.executar("req_b", lambda: "b") == "b"
+    finally:
+        liberar.set()
+        thread.join()
+
+
+def test_quem_espera_respeita_o_proprio_prazo():
+    em_voo = nucleo.ChamadasEmVoo()
+    liberar = threading.Event()
+    thread, saida = _lider_bloqueado(em_voo, "req_a", liberar)
+    try:
+        inicio = time.monotonic()
+        with nucleo.limitar_prazo(0.05):
+            assert em_voo.executar("req_a", lambda: "nunca", padrao="padrao") == "padrao"
+        assert time.monotonic() - inicio < 1
+    finally:
+        liberar.set()
+        thread.join()
+
+    assert saida["resultado"] == "pronto"  # O líder termina normalmente
+    assert em_voo.estatisticas()["req_"]["desistencias"] == 1
+
+
+def test_erro_do_lider_chega_a_quem_espera():
+    em_voo = nucleo.ChamadasEmVoo()
+    liberar = threading.Event()
+    thread, saida = _lider_bloqueado(em_voo, "req_a", liberar, erro=ValueError("falhou"))
+    seguidor, saida_seguidor = _em_thread(em_voo.executar, "req_a", lambda: "nunca")
+    time.sleep(0.05)
+    liberar.set()
+    thread.join()
+    seguidor.join()
+
+    assert isinstance(saida["erro"], ValueError)
+    assert saida_seguidor["erro"] is saida["erro"]
+    assert em_voo.em_andamento() == 0
+    with pytest.raises(KeyError):  # Depois do erro, a chave está livre para uma nova tentativa
+        em_voo.executar("req_a", lambda: {}["x"])
+
+
+def test_resultado_cortado_pelo_prazo_do_lider_e_refeito():
+    em_voo = nucleo.ChamadasEmVoo()
+
+    def lento():
+        time.sleep(0.1)
+        return "parcial"
+
+    def lider():
+        with nucleo.limitar_prazo(0.02):
+            return em_voo.executar("req_a", lento)
+
+    thread, saida = _em_thread(lider)
+    while em_voo.em_andamento() == 0:
+        time.sleep(0.001)
+
+    assert em_voo.executar("req_a", lambda: "completo") == "completo"
+    thread.join()
+    assert saida["resultado"] == "parcial"
+    assert em_voo.estatisticas()["req_"]["chamadas"] == 2
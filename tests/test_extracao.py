@@ -0,0 +1,85 @@
+"""Paridade da extração com lxml e com BeautifulSoup num corpus de páginas da central.
+
+As páginas em fixtures/central seguem o tema do Help Center (cabeçalho, navegação,
+votos, comentários, anexos). Elas cobrem o caso comum e também o que o editor salva
+de estranho: blocos dentro de <p>, tags fora de ordem, outra codificação e página sem
+contêiner de artigo.
+
+    python -m pytest tests
+"""
+import glob
+import os
+import types
+
+import pytest
+from bs4 import BeautifulSoup
+
+pytest.importorskip("lxml")
+
+import extracao  # noqa: E402
+
+PASTA = os.path.join(os.path.dirname(__file__), "fixtures", "central")
+PAGINAS = sorted(os.path.basename(p) for p in glob.glob(os.path.join(PASTA, "*.html")))
+
+# Páginas que o libxml2 reorganiza (bloco dentro de <p>, fechamentos fora de ordem): o texto vem do BeautifulSoup
+REPARADAS = {"artigo_bloco_em_paragrafo.html", "artigo_malformado.html"}
+
+
+def _ler(nome: str) -> bytes:
+    with open(os.path.join(PASTA, nome), "rb") as f:
+        return f.read()
+
+
+def test_corpus_presente():
+    assert len(PAGINAS) >= 8
+    assert REPARADAS <= set(PAGINAS)
+
+
+@pytest.mark.parametrize("nome", PAGINAS)
+def test_texto_igual_ao_beautifulsoup(nome):
+    conteudo = _ler(nome)
+    esperado = extracao._extrair_texto_html_bs4(conteudo)
+    assert esperado
+    assert extracao.extrair_texto_html(types.SimpleNamespace(content=conteudo)) == esperado
+
+
+@pytest.mark.parametrize("nome", sorted(set(PAGINAS) - REPARADAS))
+def test_caminho_lxml_sem_reparo(nome):
+    conteudo = _ler(nome)
+    assert extracao._extrair_texto_html_lxml(conteudo) == extracao._extrair_texto_html_bs4(conteudo)
+
+
+@pytest.mark.parametrize("nome", sorted(REPARADAS))
+def test_aninhamento_reparado_detectado(nome):
+    with pytest.raises(extracao.AninhamentoReparado):
+        extracao._extrair_texto_html_lxml(_ler(nome))
+
+
+def test_bloco_em_paragrafo_nao_cola_palavras():
+    # Sem a detecção, o </p> órfão some no libxml2 e "liberação." gruda no texto seguinte
+    texto = extracao.extrair_texto_html(types.SimpleNamespace(content=_ler("artigo_bloco_em_paragrafo.html")))
+    assert "liberação. Importante:" in texto
+    assert "Este trecho foi útil?" not in texto  # .article-votes dentro do <p> continua removido
+
+
+def test_links_da_pesquisa(monkeypatch):
+    # A página é da central de verdade (conftest aponta RESPONDE_AI_BASE_CENTRAL para o simulador)
+    monkeypatch.setattr(extracao, "BASE_CENTRAL", "https://centraldeatendimento.totvs.com")
+    conteudo = _ler("pesquisa.html")
+    _, documento = extracao._documento_lxml(conteudo)
+    hrefs_lxml = [a.get("href", "") for xpath in extracao._XPATH_LINKS_BUSCA for a in xpath(documento)]
+    assert hrefs_lxml == extracao._links_busca_bs4(conteudo)
+
+    links = extracao.extrair_links_busca(types.SimpleNamespace(content=conteudo))
+    assert [link.rsplit("/", 1)[1].split("-", 1)[0] for link in links] == [
+        "360000000001", "360000000015", "360000000016", "360000000017"]
+
+
+@pytest.mark.parametrize("corpo", [
+    "<p>Acesse <strong>MATA010</strong> e confirme.</p><ul><li>Produto</li><li>Saldo</li></ul>",
+    "<p>Verifique:<ul><li>grupo</li></ul>Depois refaça.</p>Importante: por filial.",
+    "<p>Texto &amp; entidades&nbsp;&ndash; <!-- nota --> fim</p><template><p>oculto</p></template>",
+])
+def test_fragmento_da_api(corpo):
+    esperado = BeautifulSoup(corpo, "html.parser").get_text(separator=" ", strip=True)
+    assert extracao.texto_de_fragmento_html(corpo) == esperado
@@ -0,0 +1,49 @@
+"""Cliente HTTP compartilhado contra um servidor local que responde o que cada teste pedir.
+
+    python -m pytest tests
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import nucleo
+
+
+@pytest.fixture
+def servidor():
+    """Servidor local; `servidor.respostas` é a fila de (status, cabeçalhos) das próximas requisições"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, cabecalhos = servidor.respostas.pop(0) if servidor.respostas else (200, {})
+            servidor.requisicoes += 1
+            self.send_response(status)
+            for nome, valor in cabecalhos.items():
+                self.send_header(nome, valor)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    servidor.respostas = []
+    servidor.requisicoes = 0
+    servidor.url = f"http://127.0.0.1:{servidor.server_address[1]}/hc/pt-br/articles/1"
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_status_de_erro_volta_sem_repetir_nem_dormir(servidor, status):
+    servidor.respostas = [(status, {"Retry-After": "5"})]
+    inicio = time.monotonic()
+    response = nucleo.cliente_http.get(servidor.url, timeout=10)
+    assert response.status_code == status
+    assert servidor.requisicoes == 1
+    assert time.monotonic() - inicio < 2
@@ -0,0 +1,65 @@
+"""Checkpoint do modo em lote: o que `retomar` considera feito e o que volta para a fila.
+
+    python -m pytest tests
+"""
+import json
+
+import lote
+
+
+def _gravar(caminho, registros, sobra: bytes = b""):
+    with open(caminho, "wb") as f:
+        for registro in registros:
+            f.write(json.dumps(registro, ensure_ascii=False).encode("utf-8") + b"\n")
+        f.write(sobra)
+
+
+def _registro(id_pergunta, respondida=True, erro=None, resposta="Acesse a rotina MATA010."):
+    return {"id": id_pergunta, "pergunta": "?", "resposta": resposta, "respondida": respondida, "erro": erro}
+
+
+def test_sem_saida(tmp_path):
+    assert lote.retomar(str(tmp_path / "respostas.jsonl")) == set()
+
+
+def test_linha_pela_metade_e_cortada(tmp_path):
+    saida = tmp_path / "respostas.jsonl"
+    _gravar(saida, [_registro("1"), _registro("2")], sobra=b'{"id": "3", "resp')
+    tamanho_valido = saida.stat().st_size - len(b'{"id": "3", "resp')
+
+    assert lote.retomar(str(saida)) == {"1", "2"}
+    assert saida.stat().st_size == tamanho_valido
+    assert saida.read_bytes().endswith(b"\n")
+
+
+def test_json_invalido_no_meio_corta_dali_em_diante(tmp_path):
+    saida = tmp_path / "respostas.jsonl"
+    _gravar(saida, [_registro("1")], sobra=b"lixo\n" + json.dumps(_registro("2")).encode() + b"\n")
+
+    assert lote.retomar(str(saida)) == {"1"}
+    assert [json.loads(linha)["id"] for linha in saida.read_text().splitlines()] == ["1"]
+
+
+def test_falha_da_ia_refeita_com_refazer_falhas(tmp_path):
+    saida = tmp_path / "respostas.jsonl"
+    _gravar(saida, [
+        _registro("1"),
+        # Limite de requisições da IA: o núcleo devolve a mensagem de erro com respondida=False
+        _registro("2", respondida=False, resposta="Erro ao gerar resposta com OpenAI: Error code: 429"),
+        _registro("3", respondida=False, erro="RuntimeError: falhou", resposta=None),
+    ])
+
+    assert lote.retomar(str(saida)) == {"1", "2", "3"}
+    assert lote.retomar(str(saida), refazer_falhas=True) == {"1"}
+
+
+def test_registro_mais_recente_vale(tmp_path):
+    saida = tmp_path / "respostas.jsonl"
+    _gravar(saida, [
+        _registro("1", respondida=False),
+        _registro("2"),
+        _registro("1"),  # Refeita com sucesso
+        _registro("2", respondida=False),  # Refeita e falhou de novo
+    ])
+
+    assert lote.retomar(str(saida), refazer_falhas=True) == {"1"}
@@ -0,0 +1,50 @@
+"""Contra o simulador local: sincronização incremental do espelho e uma pergunta do lote de ponta a ponta.
+
+    python -m pytest tests
+"""
+import json
+import sys
+
+import espelho
+import lote
+
+
+def test_sincronizacao_incremental(simulador, tmp_path):
+    local = espelho.EspelhoCentral(str(tmp_path / "espelho.sqlite3"))
+    total = len(simulador.corpus.artigos)
+
+    primeira = espelho.sincronizar(local, base_url=simulador.url)
+    assert primeira["atualizados"] == local.total() == total
+
+    # Nada mudou: a primeira página já alcança a marca d'água
+    segunda = espelho.sincronizar(local, base_url=simulador.url)
+    assert (segunda["paginas"], segunda["atualizados"]) == (1, 0)
+
+    artigo = simulador.corpus.artigos[-1]  # Na última página da listagem até ser atualizado
+    simulador.corpus.atualizar(artigo["id"], "Parágrafo novo sobre o parâmetro MV_ESPELHO.")
+    terceira = espelho.sincronizar(local, base_url=simulador.url)
+    assert (terceira["paginas"], terceira["atualizados"]) == (1, 1)
+    assert local.artigo(artigo["id"])["updated_at"] == artigo["updated_at"]
+    assert "MV_ESPELHO" in local.artigo(artigo["id"])["corpo"]
+    assert local.total() == total
+
+
+def test_pergunta_do_lote(simulador, cache_limpo, tmp_path, monkeypatch):
+    titulo = simulador.corpus.artigos[1]["titulo"]
+    entrada, saida = tmp_path / "chamados.csv", tmp_path / "respostas.jsonl"
+    entrada.write_text(f"ticket,pergunta\nT-1,\"{titulo}\"\n", encoding="utf-8")
+
+    monkeypatch.setattr(sys, "argv", [
+        "lote.py", str(entrada), str(saida), "--id-coluna", "ticket", "--concorrencia", "1",
+        "--provedor", "openai", "--api-key", "simulada", "--sem-duckduckgo",
+        "--base-central", simulador.url, "--base-openai", simulador.url + "/v1",
+    ])
+    lote.main()
+
+    registros = [json.loads(linha) for linha in saida.read_text(encoding="utf-8").splitlines()]
+    assert len(registros) == 1
+    registro = registros[0]
+    assert (registro["id"], registro["erro"], registro["respondida"]) == ("T-1", None, True)
+    assert "Resposta simulada" in registro["resposta"]
+    assert simulador.corpus.artigos[1]["url"] in registro["fontes"]
+    assert lote.retomar(str(saida), refazer_falhas=True) == {"T-1"}
@@ -0,0 +1,44 @@
+"""Reclassificação por IA: a ordem só muda (e só vai para o cache) quando a IA responde algo útil.
+
+    python -m pytest tests
+"""
+import pytest
+
+import nucleo
+
+# Ordem do reclassificador local, de propósito diferente da ordem pelo score BM25
+ARTIGOS = [
+    (1.0, "https://central/hc/pt-br/articles/1-a", "texto a"),
+    (3.0, "https://central/hc/pt-br/articles/2-b", "texto b"),
+    (2.0, "https://central/hc/pt-br/articles/3-c", "texto c"),
+]
+
+
+def _chaves_reclassificacao(cache):
+    return [chave for chave in cache.cache if chave.startswith("reclass_")]
+
+
+def _reclassificar():
+    return nucleo.reclassificar_artigos_ia(ARTIGOS, "como configurar", False, "chave", "gpt-4o-mini")
+
+
+def _falhar(*args):
+    raise Exception("Erro OpenAI: Error code: 429")
+
+
+@pytest.mark.parametrize("resposta", [_falhar, lambda *a: "", lambda *a: "Não consegui ordenar os artigos."])
+def test_falha_mantem_ordem_local_sem_cache(monkeypatch, cache_limpo, resposta):
+    monkeypatch.setattr(nucleo, "reclassificar_openai", resposta)
+    assert _reclassificar() == ARTIGOS
+    assert _chaves_reclassificacao(cache_limpo) == []
+
+
+def test_ordem_da_ia_aplicada_e_guardada(monkeypatch, cache_limpo):
+    monkeypatch.setattr(nucleo, "reclassificar_openai",
+                        lambda *a: "https://central/hc/pt-br/articles/3-c\nhttps://central/hc/pt-br/articles/1-a")
+    esperado = [ARTIGOS[2], ARTIGOS[0], ARTIGOS[1]]  # O não citado vai para o fim
+    assert _reclassificar() == esperado
+    assert len(_chaves_reclassificacao(cache_limpo)) == 1
+
+    monkeypatch.setattr(nucleo, "reclassificar_openai", _falhar)
+    assert _reclassificar() == esperado  # Do cache, sem chamar a IA
@@ -0,0 +1,54 @@
+"""Revalidação condicional dos artigos contra o simulador: fresco -> 304 -> baixado de novo.
+
+Nada guarda outra cópia do texto na frente da revalidação: passado o TTL (aqui encurtado),
+a próxima leitura já é a requisição condicional.
+
+    python -m pytest tests
+"""
+import time
+
+import pytest
+
+import nucleo
+
+TTL = 0.2
+
+
+@pytest.fixture
+def ttl_curto(monkeypatch):
+    monkeypatch.setattr(nucleo.revalidacao, "ttl", TTL)
+
+
+def _novas(simulador, antes: dict) -> dict:
+    return {rota: n - antes.get(rota, 0) for rota, n in simulador.contagens.items() if n != antes.get(rota, 0)}
+
+
+def test_artigo_pela_api(simulador, cache_limpo, ttl_curto):
+    artigo = simulador.corpus.artigos[5]
+    antes = dict(simulador.contagens)
+    primeiro = nucleo.extrair_conteudo_pagina(artigo["url"], usar_espelho=False)
+    assert artigo["titulo"] in primeiro
+    assert nucleo.extrair_conteudo_pagina(artigo["url"], usar_espelho=False) == primeiro
+    assert _novas(simulador, antes) == {"api_artigo": 1}  # Fresco: a segunda leitura não vai à rede
+
+    time.sleep(TTL * 1.5)
+    antes = dict(simulador.contagens)
+    assert nucleo.extrair_conteudo_pagina(artigo["url"], usar_espelho=False) == primeiro
+    assert _novas(simulador, antes) == {"api_artigo": 1, "api_artigo_304": 1}
+
+    simulador.corpus.atualizar(artigo["id"], "Parágrafo novo sobre o parâmetro MV_REVALIDA.")
+    time.sleep(TTL * 1.5)
+    assert "MV_REVALIDA" in nucleo.extrair_conteudo_pagina(artigo["url"], usar_espelho=False)
+
+
+def test_pagina_sem_api(simulador, cache_limpo, ttl_curto):
+    artigo = simulador.corpus.artigos[6]
+    primeiro = nucleo.fazer_requisicao_inteligente(artigo["url"], extrator=nucleo.extrair_texto_html)
+    assert primeiro
+
+    time.sleep(TTL * 1.5)
+    antes = dict(simulador.contagens)
+    assert nucleo.fazer_requisicao_inteligente(artigo["url"], extrator=nucleo.extrair_texto_html) == primeiro
+    assert _novas(simulador, antes) == {"pagina": 1, "pagina_304": 1}
+    # Com validadores, o texto fica só na revalidação (nenhuma cópia em req_)
+    assert not [chave for chave in cache_limpo.cache if chave.startswith("req_")]
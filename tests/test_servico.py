@@ -0,0 +1,60 @@
+"""Serviço HTTP (ASGI): token exigido em /metrics e config do cliente limitada aos tetos do servidor.
+
+    python -m pytest tests
+"""
+import asyncio
+
+import pytest
+
+import servico
+
+
+def _get(app, caminho, cabecalhos=()):
+    """Status e corpo de um GET feito direto na aplicação ASGI"""
+    enviados = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(mensagem):
+        enviados.append(mensagem)
+
+    scope = {"type": "http", "method": "GET", "path": caminho, "headers": list(cabecalhos)}
+    asyncio.run(app(scope, receive, send))
+    return enviados[0]["status"], b"".join(m.get("body", b"") for m in enviados[1:])
+
+
+def test_metrics_exige_o_token():
+    app = servico.ServicoRespondeAI(token="segredo")
+    assert _get(app, "/metrics")[0] == 401
+    assert _get(app, "/metrics", [(b"authorization", b"Bearer errado")])[0] == 401
+
+    status, corpo = _get(app, "/metrics", [(b"authorization", b"Bearer segredo")])
+    assert status == 200
+    assert b"responde_ai_" in corpo
+
+
+def test_metrics_sem_token_configurado():
+    assert _get(servico.ServicoRespondeAI(token=""), "/metrics")[0] == 401
+    assert _get(servico.ServicoRespondeAI(token=""), "/health")[0] == 200
+
+
+@pytest.mark.parametrize("prazo", [0, -1, 10 ** 6])
+def test_prazo_fora_do_limite_vira_o_maximo(prazo):
+    app = servico.ServicoRespondeAI(api_key="")
+    config = app._configuracao({"config": {"api_key": "k", "prazo_total": prazo}}, autenticado=False)
+    assert config.prazo_total == servico.SERVICO_PRAZO_MAXIMO
+
+
+def test_campos_de_concorrencia_limitados():
+    app = servico.ServicoRespondeAI(api_key="")
+    config = app._configuracao({"config": {
+        "api_key": "k", "prazo_total": 5, "max_extracoes": 1000, "max_passagens": 0,
+        "orcamento_tokens": 10 ** 7, "prazo_busca": 2.0,
+    }}, autenticado=False)
+
+    assert config.prazo_total == 5  # Dentro do limite: fica como o cliente pediu
+    assert config.max_extracoes == servico.MAX_EXTRACOES_SIMULTANEAS
+    assert config.max_passagens == 1
+    assert config.orcamento_tokens == servico.ORCAMENTO_TOKENS_ENTRADA
+    assert config.prazo_busca == 2.0